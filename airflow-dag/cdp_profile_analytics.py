@@ -1,47 +1,96 @@
-import time
-from datetime import datetime, date, time, timedelta
+import os
+import sys
+import json
+from datetime import datetime, timedelta
 
 import pendulum
 import logging
 import redis
 from airflow import DAG
-from airflow.operators.empty import EmptyOperator
-from airflow.operators.bash import BashOperator
 from airflow.operators.python import PythonOperator
 
 logger = logging.getLogger('cdp_profile_analytics')
 
+REDIS_HOST = os.getenv('REDIS_HOST', "localhost")
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
+# The tasks run the resynap batch code, from the repository root or from RESYNAP_PATH.
+# It is imported by the tasks only: the scheduler parses this file often, without loading the model or clients.
+RESYNAP_PATH = os.getenv('RESYNAP_PATH', os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def use_resynap():
+    if RESYNAP_PATH not in sys.path:
+        sys.path.append(RESYNAP_PATH)
+
 # Establish connection to Redis
 def connect_to_redis():
     r = redis.Redis(
-        host='localhost',
-        port=6379
+        host=REDIS_HOST,
+        port=REDIS_PORT
     )
     return r
 
+# Count the profiles and products to score
 def load_profiles(**kwargs):
-    # TODO 
-    conf = kwargs['dag_run'].conf
-    segment_id = conf.get('segment_id')    
-    service_params = conf.get('service_params')    
+    conf = kwargs['dag_run'].conf or {}
+    segment_id = conf.get('segment_id', '')
+    service_params = conf.get('service_params', {})
     logger.info('load_profiles')
-    logger.info('segment_id ' + segment_id)
-    
+    logger.info('segment_id ' + str(segment_id))
+
     for key, value in service_params.items():
         logger.info('service_param ' + str(key) + ' ' +  str(value))
 
+    use_resynap()
+    from rs_domain.qdrant_factory import get_qdrant_client
+    from rs_domain.personalization import PROFILE_COLLECTION, PRODUCT_COLLECTION
+
+    client = get_qdrant_client()
+    profile_count = client.count(PROFILE_COLLECTION, exact=True).count
+    product_count = client.count(PRODUCT_COLLECTION, exact=True).count
+    logger.info(f'{profile_count} profiles and {product_count} products to score')
+    return {"profile_count": profile_count, "product_count": product_count}
+
+# Score in memory with one matrix product per batch when the catalog fits, or with Qdrant batch searches
 def classify_profile_service(**kwargs):
-    # TODO 
-    logger.info('classify_profile_service')
+    use_resynap()
+    from rs_domain.precomputed_recommendations import PRECOMPUTE_CATALOG_MAX_SIZE
+
+    counts = kwargs['ti'].xcom_pull(task_ids='load_profiles')
+    scoring = "memory" if counts["product_count"] <= PRECOMPUTE_CATALOG_MAX_SIZE else "qdrant"
+    logger.info(f'classify_profile_service: scoring {counts["profile_count"]} profiles with {scoring}')
+    return scoring
 
+# Compute the top products of every profile and store them in Redis
 def scoring_profile_service(**kwargs):
-    # TODO 
-    logger.info('scoring_profile_service')
-        
+    use_resynap()
+    from rs_domain.precomputed_recommendations import PRECOMPUTED_TOP_N, PRECOMPUTE_BATCH_SIZE
+    from rs_domain.precomputed_recommendations import precompute_recommendations, load_precompute_catalog_index
+    from rs_domain.recommendation_cache import get_catalog_version
+
+    conf = kwargs['dag_run'].conf or {}
+    service_params = conf.get('service_params', {})
+    top_n = int(service_params.get('top_n', PRECOMPUTED_TOP_N))
+    batch_size = int(service_params.get('batch_size', PRECOMPUTE_BATCH_SIZE))
+
+    scoring = kwargs['ti'].xcom_pull(task_ids='classify_profile')
+    redis_client = connect_to_redis()
+    # read before loading the catalog, products changed after it make the stored entries unused
+    catalog_version = get_catalog_version(redis_client)
+    catalog_index = load_precompute_catalog_index() if scoring == "memory" else None
+    stats = precompute_recommendations(redis_client, top_n, batch_size, catalog_index=catalog_index,
+                                       catalog_version=catalog_version)
+    logger.info('scoring_profile_service ' + json.dumps(stats))
+    return stats
+
+# Record the run, the API reports it on /precomputed-recommendations/stats
 def save_profile_service(**kwargs):
+    use_resynap()
+    from rs_domain.precomputed_recommendations import save_precompute_run
+
+    stats = kwargs['ti'].xcom_pull(task_ids='scoring_profile')
     dt_string = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    r = connect_to_redis()
-    r.set('hello_world_done_at', dt_string)
+    save_precompute_run(connect_to_redis(), {**stats, "done_at": dt_string})
     logger.info('save_profile_service')
 
 with DAG(
@@ -53,17 +102,17 @@ with DAG(
     tags=["CDP Profile Enrichment"],
     params={"segment_id": "", "service_params": {}},
 ) as dag:
-    
+
     load_profiles = PythonOperator(task_id='load_profiles', python_callable=load_profiles, provide_context=True)
 
     classify_profile = PythonOperator(task_id='classify_profile', python_callable=classify_profile_service, provide_context=True)
 
     scoring_profile = PythonOperator(task_id='scoring_profile', python_callable=scoring_profile_service, provide_context=True)
-    
+
     save_profile_task = PythonOperator(task_id='save_profile',  python_callable=save_profile_service, provide_context=True )
 
 load_profiles >> classify_profile >> scoring_profile >> save_profile_task
 
 
 if __name__ == "__main__":
-    dag.test()
\ No newline at end of file
+    dag.test()
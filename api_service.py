@@ -2,10 +2,15 @@ from dotenv import load_dotenv
 # Load the .env file and override any existing environment variables
 load_dotenv(override=True)
 
-from rs_domain.personalization import get_all_collection_names_in_qdrant, init_db_personalization
-init_db_personalization()
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from rs_domain.personalization import get_all_collection_names_in_qdrant, get_embedding_cache_stats, check_qdrant_connection
+from rs_domain.personalization import get_product_catalog_index_stats, get_ingestion_stats
 
-from rs_api_router.personalization_router import api_personalization
+from rs_domain.embedding_provider import get_embedding_providers_stats
+from rs_api_router.personalization_router import api_personalization, service_state, check_redis_connection
+from rs_api_router.personalization_router import get_recommendation_cache_stats, get_precomputed_recommendations_stats
+from rs_api_router.personalization_router import get_event_ingestion_stats, get_write_stream_stats
 VERSION_API = "0.0.1"
 SERVICE_NAME = "Personalization Engine API"
 
@@ -14,9 +19,66 @@ SERVICE_NAME = "Personalization Engine API"
 async def root():
     return {"status": "API is ready","service":SERVICE_NAME, "version":VERSION_API}
 
+# liveness: the process is up and serving requests
+@api_personalization.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# readiness: startup is done and Qdrant and Redis answer
+@api_personalization.get("/readyz")
+async def readyz():
+    if not service_state["ready"]:
+        return JSONResponse(status_code=503, content=service_state)
+    try:
+        await run_in_threadpool(check_qdrant_connection)
+        await run_in_threadpool(check_redis_connection)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={**service_state, "ready": False, "error": str(e)})
+    return service_state
+
 # collections
 @api_personalization.get("/collections")
 async def collections():
-    return get_all_collection_names_in_qdrant()
+    return await run_in_threadpool(get_all_collection_names_in_qdrant)
+
+# keyword embedding cache statistics
+@api_personalization.get("/embedding-cache/stats")
+async def embedding_cache_stats():
+    return get_embedding_cache_stats()
+
+# embedding models, cache and micro-batching queue metrics
+@api_personalization.get("/embedding/stats")
+async def embedding_stats():
+    return get_embedding_providers_stats()
+
+# recommendation result cache hit ratio, counted by this process
+@api_personalization.get("/recommendation-cache/stats")
+async def recommendation_cache_stats():
+    return get_recommendation_cache_stats()
+
+# last run of the nightly precomputed recommendations job
+@api_personalization.get("/precomputed-recommendations/stats")
+async def precomputed_recommendations_stats():
+    return await get_precomputed_recommendations_stats()
+
+# observer event queue, batches and profiles updated
+@api_personalization.get("/events/stats")
+async def event_ingestion_stats():
+    return get_event_ingestion_stats()
+
+# write stream length, consumer group lag and dead letters
+@api_personalization.get("/write-stream/stats")
+async def write_stream_stats():
+    return await get_write_stream_stats()
+
+# items embedded, given a new payload only, or skipped because they did not change
+@api_personalization.get("/ingestion/stats")
+async def ingestion_stats():
+    return get_ingestion_stats()
+
+# in-memory product catalog index size and searches
+@api_personalization.get("/catalog-index/stats")
+async def catalog_index_stats():
+    return get_product_catalog_index_stats()
 
 api_service = api_personalization
\ No newline at end of file
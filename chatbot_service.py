@@ -13,9 +13,10 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 
 import markdown
-from rs_model.langgraph.langgraph_ai import critical_thinking, submit_message_to_agent
+from rs_model.langgraph.langgraph_ai import critical_thinking, submit_message_to_agent, asubmit_message_to_agent
 from rs_model.system_utils import read_json_from_file
 
 # Load environment variables
@@ -138,7 +139,8 @@ class ChatbotService:
             if "report" in question.lower():
                 answer, keywords = generate_report(question)
             else:
-                answer, keywords = ask_question(msg)
+                # Qdrant is awaited and blocking calls run in worker threads, so questions do not queue up
+                answer, keywords = await aask_question(msg)
                 
             # return the answer
             print(f"answer: {answer}")
@@ -184,6 +186,37 @@ def ask_question(msg: Message):
 
     return str(answer_text), keywords
 
+
+async def aask_question(msg: Message):
+    """
+    Async version of ask_question(), runs the AI agent workflow without blocking the event loop.
+
+    Args:
+        msg: The Message object containing the question and context.
+
+    Returns:
+        A tuple containing the answer text (str) and a list of keywords (list[str]).
+    """
+    if msg.context == 'critical_thinking':
+        question = await run_in_threadpool(critical_thinking, msg)
+        return str(question), []
+
+    answer_text = ''
+    keywords = []
+    try:
+        final_state = await asubmit_message_to_agent(msg)
+        if final_state:
+            answer_text = final_state.response
+            keywords = final_state.keywords
+
+            if answer_text:
+                answer_text = markdown.markdown(answer_text)
+    except Exception as error:
+        print("An exception occurred:", error)
+        answer_text = ''
+
+    return str(answer_text), keywords
+
 # Initialize chatbot service as Fast API instance
 chatbot_service = ChatbotService()
 chatbot = chatbot_service.app
\ No newline at end of file
@@ -1,11 +1,30 @@
 from fastapi import FastAPI, HTTPException, Request, Depends
-from rs_model.personalization_models import ProfileRequest, ProductRequest, ContentRequest
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from rs_model.personalization_models import ProfileRequest, ProductRequest, ContentRequest, BatchRecommendationRequest
+from rs_model.personalization_models import ProfileKeywordsUpdate
+from contextlib import asynccontextmanager
 from typing import List
 import redis
+import redis.asyncio as aredis
 
-from rs_domain.personalization import add_profile_to_qdrant, add_product_to_qdrant, add_content_to_qdrant, recommend_products_for_profile
+from rs_domain.personalization import normalize_product_vector_weights
+from rs_domain.personalization import init_db_personalization, warmup_embedding_model, check_qdrant_connection
+from rs_domain.personalization import load_product_catalog_index, merge_profile_keyword_updates
+from rs_domain.personalization_async import aadd_item_to_qdrant, aadd_items_to_qdrant, asave_profile_to_qdrant
+from rs_domain.personalization_async import arecommend_products_for_profile, arecommend_products_for_profiles, close_async_qdrant_client
+from rs_domain.personalization_async import aappend_profile_keywords, arebuild_stored_profile_vector
+from rs_domain.recommendation_cache import RecommendationCache, RECOMMENDATION_CACHE_ENABLED
+from rs_domain.event_ingestion import ProfileEventIngestor, EventRejected, aiter_events, map_event_to_keywords
+from rs_domain.profile_locks import ProfileLockTimeout
+from rs_domain.write_stream import WRITE_STREAM_ENABLED, WRITE_MODELS, apublish_writes, aget_write_stream_stats
+from rs_domain.bulk_jobs import new_bulk_job_id, resolve_bulk_job_file, asave_bulk_job_payload, asubmit_bulk_job, aget_bulk_job
+from rs_domain.precomputed_recommendations import PRECOMPUTED_RECOMMENDATIONS_ENABLED, aload_precomputed_recommendations
+from rs_domain.precomputed_recommendations import adelete_precomputed_recommendations, aget_last_precompute_run
 
 import os
+import json
+import time
 import traceback
 
 # Fetch the host and port from environment variables
@@ -18,8 +37,56 @@ redis_db = False
 if REDIS_HOST != "" and REDIS_PORT > 0:
     redis_db = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
 
+# Recommendation results are cached in the same Redis, with an asyncio client for the async endpoints
+aredis_db = False
+recommendation_cache = None
+if redis_db != False:
+    aredis_db = aredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+    if RECOMMENDATION_CACHE_ENABLED:
+        recommendation_cache = RecommendationCache(aredis_db)
+
+# Startup state of the service, reported by /readyz
+service_state = {"ready": False, "started_at": None, "phases": {}}
+
+# Check that Redis answers, if it is configured
+def check_redis_connection():
+    if redis_db != False:
+        redis_db.ping()
+
+# Run the startup phases in order and log how long each one takes
+def start_personalization_service():
+    phases = [
+        ("load_and_warmup_model", warmup_embedding_model),
+        ("check_qdrant", check_qdrant_connection),
+        ("init_collections", init_db_personalization),
+        ("load_catalog_index", load_product_catalog_index),
+        ("check_redis", check_redis_connection),
+    ]
+    started_at = time.perf_counter()
+    for name, phase in phases:
+        phase_started_at = time.perf_counter()
+        phase()
+        service_state["phases"][name] = round(time.perf_counter() - phase_started_at, 3)
+        print(f"Startup phase {name} done in {service_state['phases'][name]:.3f}s")
+    service_state["phases"]["total"] = round(time.perf_counter() - started_at, 3)
+    service_state["started_at"] = int(time.time())
+    service_state["ready"] = True
+    print(f"Personalization API ready in {service_state['phases']['total']:.3f}s")
+
+# The model, Qdrant and Redis are ready before the app accepts traffic
+@asynccontextmanager
+async def personalization_lifespan(app: FastAPI):
+    await run_in_threadpool(start_personalization_service)
+    event_ingestor.start()
+    yield
+    service_state["ready"] = False
+    await event_ingestor.stop()
+    await close_async_qdrant_client()
+    if aredis_db != False:
+        await aredis_db.aclose()
+
 # FastAPI initialization
-api_personalization = FastAPI()
+api_personalization = FastAPI(lifespan=personalization_lifespan)
 
 # Middleware to check token in the request
 async def verify_token(request: Request):
@@ -27,9 +94,9 @@ async def verify_token(request: Request):
     if not token:
         raise HTTPException(status_code=401, detail="Authorization token is missing")
     
-    # Validate token with Redis
-    if redis_db != False:
-        token_valid = redis_db.get(token)
+    # Validate token with Redis, awaited so a slow Redis does not block the other requests
+    if aredis_db != False:
+        token_valid = await aredis_db.get(token)
     else:
         token_valid = DEFAULT_AUTHORIZATION_KEY == token
         
@@ -37,19 +104,76 @@ async def verify_token(request: Request):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
+# Returns the cached recommendations or computes them, the cache is skipped when Redis is not configured
+async def get_cached_recommendations(profile_id, top_n, except_product_ids, journey_maps, weights, compute):
+    if recommendation_cache is None:
+        return await compute()
+    return await recommendation_cache.get_or_compute(profile_id, top_n, except_product_ids, journey_maps, weights, compute)
+
+# Returns the recommendations stored by the nightly batch job, None when they must be computed in real time
+async def get_precomputed_recommendations(profile_id, top_n, except_product_ids, journey_maps, weights):
+    if aredis_db == False or not PRECOMPUTED_RECOMMENDATIONS_ENABLED:
+        return None
+    return await aload_precomputed_recommendations(aredis_db, profile_id, top_n, except_product_ids, journey_maps, weights)
+
+# Cached and precomputed recommendations of these profiles are not served anymore
+async def invalidate_cached_recommendations(profile_ids):
+    profile_ids = [profile_id for profile_id in profile_ids if profile_id is not None]
+    if recommendation_cache is not None and profile_ids:
+        await recommendation_cache.invalidate_profiles(profile_ids)
+    if aredis_db != False and PRECOMPUTED_RECOMMENDATIONS_ENABLED and profile_ids:
+        await adelete_precomputed_recommendations(aredis_db, profile_ids)
+
+# New or updated products: all cached and precomputed recommendations are not served anymore
+async def invalidate_cached_catalog():
+    if recommendation_cache is not None:
+        await recommendation_cache.bump_catalog_version()
+    elif aredis_db != False and PRECOMPUTED_RECOMMENDATIONS_ENABLED:
+        # precomputed entries keep the catalog version they were scored with
+        await RecommendationCache(aredis_db).bump_catalog_version()
+
+def get_recommendation_cache_stats():
+    if recommendation_cache is None:
+        return {"enabled": False}
+    return recommendation_cache.get_stats()
+
+# With WRITE_STREAM_ENABLED, writes are published to the Redis stream and applied by the write stream workers
+# (python -m rs_domain.write_stream). Returns the response of the queued writes, or None to apply them now.
+async def queue_writes(kind, items):
+    if not WRITE_STREAM_ENABLED or aredis_db == False:
+        return None
+    message_ids = await apublish_writes(aredis_db, kind, items)
+    return {"status": f"{len(message_ids)} {kind} writes queued", "message_ids": message_ids}
+
+async def get_write_stream_stats():
+    if aredis_db == False:
+        return {"enabled": False}
+    return await aget_write_stream_stats(aredis_db)
+
+# Observer events are applied to profile vectors in the background, in coalesced batches
+event_ingestor = ProfileEventIngestor(on_profiles_updated=invalidate_cached_recommendations)
+
+def get_event_ingestion_stats():
+    return event_ingestor.get_stats()
+
+async def get_precomputed_recommendations_stats():
+    if aredis_db == False or not PRECOMPUTED_RECOMMENDATIONS_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "last_run": await aget_last_precompute_run(aredis_db)}
+
+
 # Endpoint to add profile
 @api_personalization.post("/add-profile/", dependencies=[Depends(verify_token)])
 async def add_profile(profile: ProfileRequest):
     try:
-        add_profile_to_qdrant(
-            profile.profile_id,
-            profile.page_view_keywords,
-            profile.purchase_keywords,
-            profile.interest_keywords,
-            profile.additional_info,
-            profile.journey_maps
-        )
+        queued = await queue_writes("profile", [profile])
+        if queued is not None:
+            return queued
+        profile_id = await aadd_item_to_qdrant("profile", profile)
+        await invalidate_cached_recommendations([profile_id])
         return {"status": "Profile added successfully"}
+    except ProfileLockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
@@ -58,15 +182,29 @@ async def add_profile(profile: ProfileRequest):
 # Endpoint to check profile and get recommendation in real-time
 @api_personalization.post("/check-profile-for-recommendation/", dependencies=[Depends(verify_token)])
 async def add_profile(profile: ProfileRequest):
+    validate_product_vector_weights(profile.product_vector_weights)
     try:
-        profile_id = add_profile_to_qdrant(profile)       
+        # the model runs in a worker thread, so concurrent requests can share embedding batches
+        profile_id, profile_vector, payload = await asave_profile_to_qdrant(profile)
+        if profile_id is None:
+            raise HTTPException(status_code=400, detail="Could not generate a valid vector for the profile")
+        await invalidate_cached_recommendations([profile_id])
         top_n = profile.max_recommendation_size
         except_product_ids = profile.except_product_ids
         in_journey_maps = profile.journey_maps
-        rs = recommend_products_for_profile(profile_id, top_n, except_product_ids, in_journey_maps)
+        # reuse the vector built for the upsert instead of reading it back and embedding it again
+        async def compute():
+            return await arecommend_products_for_profile(profile_id, top_n, except_product_ids,
+                                                         in_journey_maps, profile_vector, payload, profile.product_vector_weights)
+        rs = await get_cached_recommendations(profile_id, top_n, except_product_ids, in_journey_maps,
+                                              profile.product_vector_weights, compute)
         if not rs:
             raise HTTPException(status_code=404, detail="Profile not found or no recommendations available")
         return rs
+    except HTTPException:
+        raise
+    except ProfileLockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
@@ -76,23 +214,116 @@ async def add_profile(profile: ProfileRequest):
 @api_personalization.post("/add-profiles/", dependencies=[Depends(verify_token)])
 async def add_profiles(profiles: List[ProfileRequest]):
     try:
-        c = 0
-        for profile in profiles:
-            profile_id = add_profile_to_qdrant(profile)
-            if profile_id:
-                c = c + 1
-                print(profile_id + " added successfully")
-        return {"status": str(c) + " profiles added successfully"}
+        queued = await queue_writes("profile", profiles)
+        if queued is not None:
+            return queued
+        added_ids, failed_items, unchanged_ids = await aadd_items_to_qdrant("profile", profiles)
+        await invalidate_cached_recommendations(added_ids)
+        return {"status": f"{len(added_ids)} profiles added successfully, {len(unchanged_ids)} unchanged",
+                "unchanged": unchanged_ids, "failed": failed_items}
+    except ProfileLockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Endpoint to append new keywords to stored profiles, only the new keywords are embedded
+@api_personalization.post("/append-profile-keywords/", dependencies=[Depends(verify_token)])
+async def append_profile_keywords(updates: List[ProfileKeywordsUpdate]):
+    try:
+        keywords_by_profile = merge_profile_keyword_updates(updates)
+        updated_profiles = await aappend_profile_keywords(keywords_by_profile)
+        await invalidate_cached_recommendations(list(updated_profiles))
+        not_updated = [profile_id for profile_id in keywords_by_profile if profile_id not in updated_profiles]
+        return {"status": str(len(updated_profiles)) + " profiles updated successfully", "not_updated": not_updated}
+    except ProfileLockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Endpoint to rebuild the vector of a stored profile from all its keywords
+@api_personalization.post("/rebuild-profile-vector/{profile_id}", dependencies=[Depends(verify_token)])
+async def rebuild_profile_vector(profile_id: str):
+    try:
+        profile_vector, payload = await arebuild_stored_profile_vector(profile_id)
+    except ProfileLockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if profile_vector is None:
+        raise HTTPException(status_code=404, detail="Profile not found or no valid vector")
+    await invalidate_cached_recommendations([profile_id])
+    return {"status": "Profile vector rebuilt successfully", "profile": payload}
+
+
+# Endpoint to ingest LEO observer events, sent as a JSON array or streamed as NDJSON (one event per line).
+# Events update the profile facets in the background; when the queue stays full, the rest of the
+# request is rejected with 429 and the counts of what was accepted.
+@api_personalization.post("/ingest-events/", dependencies=[Depends(verify_token)])
+async def ingest_events(request: Request):
+    counts = {"accepted": 0, "ignored": 0, "invalid": 0}
+    try:
+        async for event in aiter_events(request.stream()):
+            try:
+                update = map_event_to_keywords(event) if event is not None else None
+            except ValueError:
+                update = None
+                event = None
+            if event is None:
+                counts["invalid"] += 1
+            elif update is None:
+                counts["ignored"] += 1
+            else:
+                await event_ingestor.put(*update)
+                counts["accepted"] += 1
+    except EventRejected as e:
+        return JSONResponse(status_code=429, content={**counts, "error": str(e)}, headers={"Retry-After": "1"})
+    return {"status": "Events queued", **counts}
+
+
+# Endpoint to submit a bulk ingestion job of profiles, products or contents, run by the bulk job workers
+# (python -m rs_domain.bulk_jobs). The items are the body, a JSON array or NDJSON, or the file at file_path
+# under BULK_JOB_FILE_ROOT. Poll /bulk-jobs/{job_id} for the progress.
+@api_personalization.post("/bulk-jobs/{kind}", dependencies=[Depends(verify_token)])
+async def submit_bulk_job(kind: str, request: Request, file_path: str = ""):
+    if kind not in WRITE_MODELS:
+        raise HTTPException(status_code=404, detail=f"Unknown kind '{kind}', use one of {list(WRITE_MODELS)}")
+    if aredis_db == False:
+        raise HTTPException(status_code=503, detail="Bulk jobs need Redis")
+    job_id = new_bulk_job_id()
+    try:
+        if file_path:
+            source = resolve_bulk_job_file(file_path)
+        else:
+            source = await asave_bulk_job_payload(job_id, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await asubmit_bulk_job(aredis_db, job_id, kind, source, uploaded=not file_path)
+    return {"status": "Bulk job queued", "job_id": job_id, "kind": kind, "status_url": f"/bulk-jobs/{job_id}",
+            "created_at": job["created_at"]}
+
+
+# Endpoint to poll the status of a bulk ingestion job: processed, applied and failed items, throughput
+@api_personalization.get("/bulk-jobs/{job_id}", dependencies=[Depends(verify_token)])
+async def get_bulk_job(job_id: str, failed_items_limit: int = 100):
+    if aredis_db == False:
+        raise HTTPException(status_code=503, detail="Bulk jobs need Redis")
+    job = await aget_bulk_job(aredis_db, job_id, failed_items_limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Bulk job not found or expired")
+    return job
+
+
 # Endpoint to add product
 @api_personalization.post("/add-product/", dependencies=[Depends(verify_token)])
 async def add_product(product: ProductRequest):
     try:
-        add_product_to_qdrant(product)
+        queued = await queue_writes("product", [product])
+        if queued is not None:
+            return queued
+        await aadd_item_to_qdrant("product", product)
+        await invalidate_cached_catalog()
         return {"status": "Product added successfully"}
     except Exception as e:
         print(traceback.format_exc())
@@ -103,9 +334,14 @@ async def add_product(product: ProductRequest):
 @api_personalization.post("/add-products/", dependencies=[Depends(verify_token)])
 async def add_products(products: List[ProductRequest]):
     try:
-        for product in products:
-            add_product_to_qdrant(product)
-        return {"status": "All products added successfully"}
+        queued = await queue_writes("product", products)
+        if queued is not None:
+            return queued
+        added_ids, failed_items, unchanged_ids = await aadd_items_to_qdrant("product", products)
+        if added_ids:
+            await invalidate_cached_catalog()
+        return {"status": f"{len(added_ids)} products added successfully, {len(unchanged_ids)} unchanged",
+                "unchanged": unchanged_ids, "failed": failed_items}
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
@@ -115,7 +351,10 @@ async def add_products(products: List[ProductRequest]):
 @api_personalization.post("/add-content/", dependencies=[Depends(verify_token)])
 async def add_content(content: ContentRequest):
     try:
-        add_content_to_qdrant(content)
+        queued = await queue_writes("content", [content])
+        if queued is not None:
+            return queued
+        await aadd_item_to_qdrant("content", content)
         return {"status": "Content added successfully"}
     except Exception as e:
         print(traceback.format_exc())
@@ -126,9 +365,12 @@ async def add_content(content: ContentRequest):
 @api_personalization.post("/add-contents/", dependencies=[Depends(verify_token)])
 async def add_contents(contents: List[ContentRequest]):
     try:
-        for content in contents:
-            add_content_to_qdrant(content)
-        return {"status": "All contents added successfully"}
+        queued = await queue_writes("content", contents)
+        if queued is not None:
+            return queued
+        added_ids, failed_items, unchanged_ids = await aadd_items_to_qdrant("content", contents)
+        return {"status": f"{len(added_ids)} contents added successfully, {len(unchanged_ids)} unchanged",
+                "unchanged": unchanged_ids, "failed": failed_items}
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
@@ -136,18 +378,53 @@ async def add_contents(contents: List[ContentRequest]):
 
 # Endpoint to recommend products based on profile
 @api_personalization.get("/recommend/{profile_id}", dependencies=[Depends(verify_token)])
-async def recommend(profile_id: str, top_n: int = 8, except_product_ids: str = "", journey_maps: str = ""):
+async def recommend(profile_id: str, top_n: int = 8, except_product_ids: str = "", journey_maps: str = "",
+                    name_weight: float = None, category_weight: float = None, keywords_weight: float = None):
+    # weights of the named product vectors, the defaults are used for the ones not given
+    weights = {"name": name_weight, "category": category_weight, "keywords": keywords_weight}
+    weights = {name: w for name, w in weights.items() if w is not None}
+    validate_product_vector_weights(weights)
+    except_ids = get_input_array(except_product_ids)
+    in_journey_maps = get_input_array(journey_maps)
     try:
-        rs = recommend_products_for_profile(profile_id, top_n, get_input_array(except_product_ids), get_input_array(journey_maps))
+        # the nightly batch job stored the top products of every unchanged profile
+        rs = await get_precomputed_recommendations(profile_id, top_n, except_ids, in_journey_maps, weights)
+        if rs is not None:
+            return rs
+
+        async def compute():
+            return await arecommend_products_for_profile(profile_id, top_n, except_ids, in_journey_maps, None, None, weights)
+        rs = await get_cached_recommendations(profile_id, top_n, except_ids, in_journey_maps, weights, compute)
         if not rs:
             raise HTTPException(
                 status_code=404, detail="Profile not found or no recommendations available")
         return rs
+    except HTTPException:
+        raise
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Endpoint to recommend products for many profiles, streamed back as one JSON line per profile
+@api_personalization.post("/recommend-batch/", dependencies=[Depends(verify_token)])
+async def recommend_batch(request: BatchRecommendationRequest):
+    validate_product_vector_weights(request.product_vector_weights)
+
+    async def ndjson_lines():
+        async for result in arecommend_products_for_profiles(request.profiles, request.top_n, request.product_vector_weights):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+def validate_product_vector_weights(weights):
+    try:
+        normalize_product_vector_weights(weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 def get_input_array(text, delimiter=","):
   """Splits a string by a delimiter and removes empty strings from the result.
 
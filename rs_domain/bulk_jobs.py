@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import itertools
+import redis
+from rs_domain.personalization import ITEM_KINDS, add_items_to_qdrant
+from rs_domain.write_stream import WRITE_MODELS, invalidate_written_recommendations, autoclaim_messages
+
+# Bulk ingestion job configuration from environment variables
+BULK_JOB_DIR = os.getenv('BULK_JOB_DIR', './.bulk_jobs')  # payloads uploaded to the API, shared with the job workers
+BULK_JOB_FILE_ROOT = os.getenv('BULK_JOB_FILE_ROOT', './data')  # jobs can reference files under this directory only
+BULK_JOB_CHUNK_SIZE = int(os.getenv('BULK_JOB_CHUNK_SIZE', 1000))  # items applied and committed together
+BULK_JOB_TTL = int(os.getenv('BULK_JOB_TTL', 604800))  # seconds the status of a job is kept
+BULK_JOB_MAX_FAILED_ITEMS = int(os.getenv('BULK_JOB_MAX_FAILED_ITEMS', 1000))  # failed items kept with their error
+BULK_JOB_CLAIM_IDLE_MS = int(os.getenv('BULK_JOB_CLAIM_IDLE_MS', 300000))  # jobs of a silent worker are resumed by another
+
+BULK_JOB_STREAM = "rs:bulk-jobs"
+BULK_JOB_GROUP = "rs-bulk-workers"
+BULK_JOB_KEY_PREFIX = "rs:bulk-job"
+BULK_JOB_WRITE_BUFFER = 1024 * 1024  # bytes of an uploaded payload written to disk at once
+
+# Counters of the job hash, read back as numbers
+BULK_JOB_INT_FIELDS = ["offset", "processed", "applied", "unchanged", "failed", "chunks", "created_at", "started_at", "updated_at", "finished_at"]
+
+
+def bulk_job_key(job_id):
+    return f"{BULK_JOB_KEY_PREFIX}:{job_id}"
+
+
+def bulk_job_failed_key(job_id):
+    return f"{BULK_JOB_KEY_PREFIX}:{job_id}:failed"
+
+
+def new_bulk_job_id():
+    return uuid.uuid4().hex
+
+
+# Path of a file referenced by a job, it must be under BULK_JOB_FILE_ROOT
+def resolve_bulk_job_file(file_path, file_root=BULK_JOB_FILE_ROOT):
+    root = os.path.realpath(file_root)
+    path = os.path.realpath(os.path.join(root, file_path))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"File '{file_path}' is not under {file_root}")
+    if not os.path.isfile(path):
+        raise ValueError(f"File '{file_path}' does not exist")
+    return path
+
+
+# Write the chunks of an uploaded payload to BULK_JOB_DIR, the workers read it from there. Returns the file path.
+# The file calls run in worker threads, about one per BULK_JOB_WRITE_BUFFER bytes, so the event loop never waits on the disk.
+async def asave_bulk_job_payload(job_id, chunks, job_dir=BULK_JOB_DIR):
+    await asyncio.to_thread(os.makedirs, job_dir, exist_ok=True)
+    path = os.path.join(job_dir, f"{job_id}.json")
+    size = 0
+    buffer = bytearray()
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            size += len(chunk)
+            if len(buffer) >= BULK_JOB_WRITE_BUFFER:
+                await asyncio.to_thread(f.write, bytes(buffer))
+                buffer.clear()
+        if len(buffer) > 0:
+            await asyncio.to_thread(f.write, bytes(buffer))
+    finally:
+        await asyncio.to_thread(f.close)
+    if size == 0:
+        await asyncio.to_thread(os.remove, path)
+        raise ValueError("The payload is empty")
+    return path
+
+
+# Record a queued job and publish it to the job workers
+async def asubmit_bulk_job(redis_client, job_id, kind, source, uploaded):
+    job = {"job_id": job_id, "kind": kind, "source": source, "uploaded": int(uploaded), "status": "queued",
+           "offset": 0, "processed": 0, "applied": 0, "unchanged": 0, "failed": 0, "chunks": 0, "active_seconds": 0.0,
+           "created_at": int(time.time())}
+    pipeline = redis_client.pipeline(transaction=True)
+    pipeline.hset(bulk_job_key(job_id), mapping=job)
+    pipeline.expire(bulk_job_key(job_id), BULK_JOB_TTL)
+    pipeline.xadd(BULK_JOB_STREAM, {"job_id": job_id})
+    await pipeline.execute()
+    return job
+
+
+def decode_bulk_job(fields):
+    job = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+           for k, v in fields.items()}
+    for name in BULK_JOB_INT_FIELDS:
+        if name in job:
+            job[name] = int(job[name])
+    job["uploaded"] = job.get("uploaded") == "1"
+    job["active_seconds"] = round(float(job.get("active_seconds", 0)), 3)
+    # throughput while the job was running, queue waits and restarts are not counted
+    job["items_per_second"] = round(job["processed"] / job["active_seconds"], 1) if job["active_seconds"] > 0 else 0.0
+    return job
+
+
+# Status and progress of a job, with its first failed items. None when the job does not exist or expired.
+async def aget_bulk_job(redis_client, job_id, failed_items_limit=100):
+    fields = await redis_client.hgetall(bulk_job_key(job_id))
+    if not fields:
+        return None
+    job = decode_bulk_job(fields)
+    failed_items = await redis_client.lrange(bulk_job_failed_key(job_id), 0, failed_items_limit - 1)
+    job["failed_items"] = [json.loads(item) for item in failed_items]
+    return job
+
+
+# Items of a JSON array or NDJSON file, read incrementally. Yields None for NDJSON lines that are not JSON.
+def iter_json_items(path, read_size=1 << 20):
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(read_size)
+        if not buffer.lstrip().startswith("["):
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+            return
+
+        pos = buffer.index("[") + 1
+        eof = False
+        while True:
+            # skip the separators, then decode the next item once it is entirely in the buffer
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            item, end = None, None
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    end = None
+            if end is not None and (end < len(buffer) or eof):
+                yield item
+                pos = end
+                continue
+            if eof:
+                raise ValueError(f"Invalid or truncated JSON array in {path}")
+            more = f.read(read_size)
+            eof = len(more) == 0
+            buffer = buffer[pos:] + more
+            pos = 0
+
+
+class BulkJobWorker:
+    """Runs the bulk ingestion jobs of the stream with the other workers of the consumer group.
+
+    A job reads its items from a file, and applies them in chunks of BULK_JOB_CHUNK_SIZE with
+    add_items_to_qdrant(). After each chunk, the offset of the next item and the counters are committed
+    in one Redis transaction. A job stays pending in the group until it is done. A worker restarted with
+    the same consumer name resumes its own jobs from their last committed chunk. Jobs of a worker that
+    does not come back are claimed by another one after BULK_JOB_CLAIM_IDLE_MS. Point ids come from
+    string_to_point_id(), so a chunk applied again after a crash writes the same points.
+    """
+
+    def __init__(self, redis_client, consumer_name, chunk_size=BULK_JOB_CHUNK_SIZE, claim_idle_ms=BULK_JOB_CLAIM_IDLE_MS,
+                 block_ms=5000):
+        self.redis = redis_client
+        self.consumer_name = consumer_name
+        self.chunk_size = chunk_size
+        self.claim_idle_ms = claim_idle_ms
+        self.block_ms = block_ms
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(BULK_JOB_STREAM, BULK_JOB_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # Next (message_id, job_id): jobs this worker was running before a restart, then jobs of silent workers, then new jobs
+    def next_job(self):
+        response = self.redis.xreadgroup(BULK_JOB_GROUP, self.consumer_name, {BULK_JOB_STREAM: "0"}, count=1)
+        messages = response[0][1] if response else []
+        if len(messages) == 0:
+            messages = autoclaim_messages(self.redis, BULK_JOB_STREAM, BULK_JOB_GROUP, self.consumer_name,
+                                          self.claim_idle_ms, 1)
+        if len(messages) == 0:
+            response = self.redis.xreadgroup(BULK_JOB_GROUP, self.consumer_name, {BULK_JOB_STREAM: ">"},
+                                             count=1, block=self.block_ms)
+            messages = response[0][1] if response else []
+        if len(messages) == 0:
+            return None
+        message_id, fields = messages[0]
+        job_id = (fields or {}).get(b"job_id")
+        if job_id is None:
+            # trimmed or malformed message
+            self.redis.xack(BULK_JOB_STREAM, BULK_JOB_GROUP, message_id)
+            return None
+        return (message_id.decode() if isinstance(message_id, bytes) else message_id,
+                job_id.decode() if isinstance(job_id, bytes) else job_id)
+
+    def finish_job(self, message_id, job, status, error=None):
+        fields = {"status": status, "finished_at": int(time.time())}
+        if error is not None:
+            fields["error"] = error
+        self.redis.hset(bulk_job_key(job["job_id"]), mapping=fields)
+        self.redis.xack(BULK_JOB_STREAM, BULK_JOB_GROUP, message_id)
+        if status == "done" and job["uploaded"] and os.path.exists(job["source"]):
+            os.remove(job["source"])
+        print(f"Bulk job {job['job_id']} {status}: {job['processed']} items processed" + (f", error: {error}" if error else ""))
+
+    # Validate and apply one chunk of (index, item), then commit its counters and the next offset
+    def apply_chunk(self, job, chunk, next_offset):
+        kind = job["kind"]
+        id_field = ITEM_KINDS[kind]["id_field"]
+        started_at = time.perf_counter()
+
+        items, failed_items = [], []
+        for index, item in chunk:
+            try:
+                items.append((index, WRITE_MODELS[kind].model_validate(item)))
+            except Exception as e:
+                item_id = item.get(id_field) if isinstance(item, dict) else None
+                failed_items.append({"index": index, "id": item_id, "error": f"Invalid item: {e}"})
+
+        added_ids, errors, unchanged_ids = [], [], []
+        if len(items) > 0:
+            added_ids, errors, unchanged_ids = add_items_to_qdrant(kind, [item for _, item in items])
+            index_by_id = {getattr(item, id_field): index for index, item in items}
+            failed_items += [{"index": index_by_id.get(f["id"]), "id": f["id"], "error": f["error"]} for f in errors]
+        # items that did not change since they were stored are neither applied nor failed
+        unchanged = len(unchanged_ids)
+
+        seconds = time.perf_counter() - started_at
+        key = bulk_job_key(job["job_id"])
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.hset(key, mapping={"offset": next_offset, "updated_at": int(time.time())})
+        pipeline.hincrby(key, "processed", len(chunk))
+        pipeline.hincrby(key, "applied", len(added_ids))
+        pipeline.hincrby(key, "unchanged", unchanged)
+        pipeline.hincrby(key, "failed", len(failed_items))
+        pipeline.hincrby(key, "chunks", 1)
+        pipeline.hincrbyfloat(key, "active_seconds", seconds)
+        if len(failed_items) > 0:
+            pipeline.rpush(bulk_job_failed_key(job["job_id"]), *[json.dumps(f, ensure_ascii=False) for f in failed_items])
+            pipeline.ltrim(bulk_job_failed_key(job["job_id"]), 0, BULK_JOB_MAX_FAILED_ITEMS - 1)
+            pipeline.expire(bulk_job_failed_key(job["job_id"]), BULK_JOB_TTL)
+        pipeline.execute()
+        job["processed"] += len(chunk)
+
+        invalidate_written_recommendations(self.redis, {kind: added_ids})
+        print(f"Bulk job {job['job_id']}: {len(added_ids)} / {len(chunk)} {kind} items applied, {unchanged} unchanged, in {seconds:.3f}s, "
+              f"next offset {next_offset}")
+
+    def run_job(self, message_id, job_id):
+        fields = self.redis.hgetall(bulk_job_key(job_id))
+        if not fields:
+            print(f"Bulk job {job_id} expired or does not exist")
+            self.redis.xack(BULK_JOB_STREAM, BULK_JOB_GROUP, message_id)
+            return
+        job = decode_bulk_job(fields)
+        if job["status"] in ("done", "failed"):
+            self.redis.xack(BULK_JOB_STREAM, BULK_JOB_GROUP, message_id)
+            return
+
+        running = {"status": "running", "worker": self.consumer_name}
+        if job.get("started_at") is None:
+            running["started_at"] = int(time.time())
+        self.redis.hset(bulk_job_key(job_id), mapping=running)
+        print(f"Bulk job {job_id}: {job['kind']} items of {job['source']} from offset {job['offset']}")
+
+        try:
+            items = itertools.islice(iter_json_items(job["source"]), job["offset"], None)
+            offset = job["offset"]
+            while True:
+                chunk = [(offset + i, item) for i, item in enumerate(itertools.islice(items, self.chunk_size))]
+                if len(chunk) == 0:
+                    break
+                offset += len(chunk)
+                self.apply_chunk(job, chunk, offset)
+                # reset the idle time of the job, so that other workers do not claim it while it runs
+                self.redis.xclaim(BULK_JOB_STREAM, BULK_JOB_GROUP, self.consumer_name, 0, [message_id], justid=True)
+        except (OSError, ValueError) as e:
+            # the source cannot be read, running the job again would fail the same way
+            self.finish_job(message_id, job, "failed", str(e))
+            return
+        self.finish_job(message_id, job, "done")
+
+    def run(self):
+        self.ensure_group()
+        print(f"Bulk job worker '{self.consumer_name}' reading '{BULK_JOB_STREAM}' in group '{BULK_JOB_GROUP}'")
+        while True:
+            next_job = self.next_job()
+            if next_job is None:
+                continue
+            try:
+                self.run_job(*next_job)
+            except Exception as e:
+                # the job stays pending and resumes from its last committed chunk
+                print(f"Bulk job {next_job[1]} interrupted: {e}")
+                time.sleep(self.block_ms / 1000.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bulk ingestion jobs submitted to /bulk-jobs/")
+    parser.add_argument("--consumer", default=socket.gethostname(),
+                        help="unique and stable consumer name, a restarted worker resumes its own jobs")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)), db=0)
+    BulkJobWorker(redis_client, args.consumer).run()
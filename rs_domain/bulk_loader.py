@@ -0,0 +1,156 @@
+"""Load profiles, products or contents from a file straight into Qdrant, without the API.
+
+The file is a JSON array (like data/profiles.json) or NDJSON, one item per line, parsed incrementally.
+A reader thread parses and validates the items and puts them in batches on a bounded queue, while the
+main thread embeds and upserts the previous batch with add_items_to_qdrant(). Memory stays the same
+whatever the size of the file, and items that did not change since the last load are skipped.
+
+After each batch, the number of items done is saved to the checkpoint file. Running the same command
+again resumes after the last saved batch, --restart loads the file from the beginning. Items that cannot
+be loaded are appended to the failed items file, one JSON object per line.
+
+Usage:
+    python -m rs_domain.bulk_loader profile data/profiles.json [--batch-size 1000] [--queue-size 4]
+                                    [--checkpoint data/profiles.json.checkpoint.json] [--failed data/profiles.json.failed.ndjson]
+                                    [--tenant-id default] [--restart]
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import itertools
+
+from dotenv import load_dotenv
+load_dotenv(override=True)
+
+from rs_domain.personalization import ITEM_KINDS, init_db_personalization, add_items_to_qdrant
+from rs_domain.bulk_jobs import iter_json_items
+from rs_domain.qdrant_batch_writer import QDRANT_BATCH_WAIT
+from rs_domain.write_stream import WRITE_MODELS
+
+END_OF_FILE = None
+
+
+# Saved state of a load, it applies to the same kind and file only
+def read_checkpoint(checkpoint_path, kind, source):
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("kind") != kind or checkpoint.get("source") != os.path.abspath(source):
+        raise ValueError(f"Checkpoint {checkpoint_path} is for {checkpoint.get('kind')} items of {checkpoint.get('source')}, "
+                         "use --restart or another --checkpoint")
+    if checkpoint.get("size") != os.path.getsize(source):
+        raise ValueError(f"{source} changed since checkpoint {checkpoint_path} was saved, use --restart")
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    # write then rename, a load stopped while saving keeps the previous checkpoint
+    with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+# Parse and validate the items after the first `offset`, and put them on the queue in batches of (index, item, error).
+# Profiles without a tenant_id get the one given, CRM exports often have none.
+def read_batches(kind, source, offset, batch_size, batches, tenant_id=None):
+    try:
+        items = itertools.islice(iter_json_items(source), offset, None)
+        index = offset
+        while True:
+            batch = []
+            for item in itertools.islice(items, batch_size):
+                if kind == "profile" and tenant_id and isinstance(item, dict) and not item.get("tenant_id"):
+                    item["tenant_id"] = tenant_id
+                try:
+                    batch.append((index, WRITE_MODELS[kind].model_validate(item), None))
+                except Exception as e:
+                    item_id = item.get(ITEM_KINDS[kind]["id_field"]) if isinstance(item, dict) else None
+                    batch.append((index, item_id, f"Invalid item: {e}"))
+                index += 1
+            if len(batch) == 0:
+                break
+            batches.put(batch)
+        batches.put(END_OF_FILE)
+    except Exception as e:
+        # raised again by the main thread, after the batches already read are loaded
+        batches.put(e)
+
+
+def load_items(kind, source, batch_size=1000, queue_size=4, checkpoint_path=None, failed_path=None, restart=False,
+               tenant_id=None):
+    checkpoint_path = checkpoint_path or source + ".checkpoint.json"
+    failed_path = failed_path or source + ".failed.ndjson"
+    id_field = ITEM_KINDS[kind]["id_field"]
+
+    checkpoint = None if restart else read_checkpoint(checkpoint_path, kind, source)
+    if checkpoint is None:
+        checkpoint = {"kind": kind, "source": os.path.abspath(source), "size": os.path.getsize(source),
+                      "offset": 0, "loaded": 0, "unchanged": 0, "failed": 0, "seconds": 0.0}
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+    else:
+        print(f"Resuming {kind} items of {source} after item {checkpoint['offset']}")
+
+    init_db_personalization()
+    batches = queue.Queue(maxsize=queue_size)
+    reader = threading.Thread(target=read_batches, args=(kind, source, checkpoint["offset"], batch_size, batches, tenant_id),
+                              daemon=True)
+    reader.start()
+
+    started_at = time.perf_counter()
+    previous_seconds = checkpoint["seconds"]
+    items_done = 0
+    while True:
+        batch = batches.get()
+        if batch is END_OF_FILE:
+            break
+        if isinstance(batch, Exception):
+            raise batch
+
+        items = [item for _, item, error in batch if error is None]
+        failed_items = [{"index": index, "id": item_id, "error": error} for index, item_id, error in batch if error is not None]
+        # nothing reads the points back during an offline load, Qdrant acknowledges chunks once they are in its WAL
+        added_ids, errors, unchanged_ids = add_items_to_qdrant(kind, items, wait=QDRANT_BATCH_WAIT) if len(items) > 0 else ([], [], [])
+        index_by_id = {getattr(item, id_field): index for index, item, error in batch if error is None}
+        failed_items += [{"index": index_by_id.get(f["id"]), "id": f["id"], "error": f["error"]} for f in errors]
+
+        if len(failed_items) > 0:
+            with open(failed_path, "a", encoding="utf-8") as f:
+                for failed_item in failed_items:
+                    f.write(json.dumps(failed_item, ensure_ascii=False) + "\n")
+        items_done += len(batch)
+        checkpoint["offset"] += len(batch)
+        checkpoint["loaded"] += len(added_ids)
+        checkpoint["unchanged"] += len(unchanged_ids)
+        checkpoint["failed"] += len(failed_items)
+        checkpoint["seconds"] = round(previous_seconds + time.perf_counter() - started_at, 3)
+        write_checkpoint(checkpoint_path, checkpoint)
+
+        seconds = time.perf_counter() - started_at
+        print(f"{checkpoint['offset']} {kind} items done: {checkpoint['loaded']} loaded, {checkpoint['unchanged']} unchanged, "
+              f"{checkpoint['failed']} failed, {items_done / seconds:.1f} items/s, {batches.qsize()} batches read ahead")
+
+    checkpoint["done"] = True
+    write_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load profiles, products or contents from a JSON array or NDJSON file into Qdrant")
+    parser.add_argument("kind", choices=list(WRITE_MODELS), help="kind of the items of the file")
+    parser.add_argument("source", help="JSON array or NDJSON file")
+    parser.add_argument("--batch-size", type=int, default=1000, help="items embedded and upserted per checkpoint")
+    parser.add_argument("--queue-size", type=int, default=4, help="batches parsed ahead of the embedding")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file, default is <source>.checkpoint.json")
+    parser.add_argument("--failed", default=None, help="failed items file, default is <source>.failed.ndjson")
+    parser.add_argument("--tenant-id", default=None, help="tenant_id of the profiles that have none")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load the file from the beginning")
+    args = parser.parse_args()
+
+    result = load_items(args.kind, args.source, args.batch_size, args.queue_size, args.checkpoint, args.failed, args.restart,
+                        args.tenant_id)
+    print(f"Done: {result}")
@@ -0,0 +1,127 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+# Micro-batching configuration from environment variables
+EMBEDDING_BATCHER_ENABLED = os.getenv('EMBEDDING_BATCHER_ENABLED', 'false') == 'true'
+EMBEDDING_BATCHER_MAX_SIZE = int(os.getenv('EMBEDDING_BATCHER_MAX_SIZE', 64))  # max texts per flushed batch
+EMBEDDING_BATCHER_MAX_WAIT_MS = float(os.getenv('EMBEDDING_BATCHER_MAX_WAIT_MS', 5))  # max wait before a flush
+
+
+class _EncodeRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """Collects encode requests from concurrent callers and runs them through the model as one batch.
+
+    A batch is flushed when it holds max_batch_size texts or when its oldest request has waited
+    max_wait_ms, whichever comes first. Every caller gets back only the rows of its own texts.
+    Sync callers (threads) use encode(), async callers await aencode().
+    """
+
+    def __init__(self, encode_fn, max_batch_size=EMBEDDING_BATCHER_MAX_SIZE, max_wait_ms=EMBEDDING_BATCHER_MAX_WAIT_MS,
+                 name='embedding-batcher'):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.metrics_lock = threading.Lock()
+        self.total_requests = 0
+        self.total_texts = 0
+        self.total_batches = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_encode_seconds = 0.0
+        self.worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, texts) -> Future:
+        """Queues texts for the next batch and returns a future of their float32 matrix."""
+        request = _EncodeRequest(list(texts))
+        self.requests.put(request)
+        return request.future
+
+    def encode(self, texts) -> np.ndarray:
+        """Blocks the calling thread until the batch holding these texts has been encoded."""
+        return self.submit(texts).result()
+
+    async def aencode(self, texts) -> np.ndarray:
+        """Awaits the batch holding these texts without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect_batch(self):
+        # wait for the first request, then gather more until the batch is full or the deadline passes
+        batch = [self.requests.get()]
+        size = len(batch[0].texts)
+        deadline = batch[0].enqueued_at + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect_batch()
+            started_at = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            encode_seconds = time.perf_counter() - started_at
+
+            offset = 0
+            for request in batch:
+                # a copy, so a caller holding its rows does not keep the whole batch alive
+                request.future.set_result(np.array(embeddings[offset:offset + len(request.texts)], dtype=np.float32, copy=True))
+                offset += len(request.texts)
+
+            with self.metrics_lock:
+                waits = [started_at - request.enqueued_at for request in batch]
+                self.total_requests += len(batch)
+                self.total_texts += size
+                self.total_batches += 1
+                self.last_batch_size = size
+                self.max_batch_seen = max(self.max_batch_seen, size)
+                self.total_wait_seconds += sum(waits)
+                self.max_wait_seconds = max(self.max_wait_seconds, max(waits))
+                self.total_encode_seconds += encode_seconds
+
+    def get_metrics(self):
+        """Returns queue depth, batch size and wait time metrics."""
+        with self.metrics_lock:
+            batches = self.total_batches
+            return {
+                "queue_depth": self.requests.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "requests": self.total_requests,
+                "texts": self.total_texts,
+                "batches": batches,
+                "last_batch_size": self.last_batch_size,
+                "largest_batch_size": self.max_batch_seen,
+                "avg_batch_size": self.total_texts / batches if batches > 0 else 0.0,
+                "avg_wait_ms": 1000 * self.total_wait_seconds / self.total_requests if self.total_requests > 0 else 0.0,
+                "max_wait_ms_seen": 1000 * self.max_wait_seconds,
+                "avg_encode_ms": 1000 * self.total_encode_seconds / batches if batches > 0 else 0.0,
+            }
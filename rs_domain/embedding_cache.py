@@ -0,0 +1,252 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Cache configuration from environment variables
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true') == 'true'
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', './.embedding_cache')  # empty to disable the disk tier
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv('EMBEDDING_CACHE_MEMORY_SIZE', 50000))  # max entries in process
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv('EMBEDDING_CACHE_DISK_SIZE', 200000))  # max entries on disk
+EMBEDDING_CACHE_READONLY = os.getenv('EMBEDDING_CACHE_READONLY', 'false') == 'true'  # workers only read the disk tier
+
+STORE_FORMAT_VERSION = 2  # 2: vectors of the normalized text
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes a text before it is used as a cache key (unicode NFC, trimmed, single spaces)."""
+    return unicodedata.normalize('NFC', ' '.join(text.split()))
+
+
+def text_key_hash(text: str) -> int:
+    """Returns a non-zero 64-bit key for a normalized text, 0 marks an empty slot on disk."""
+    h = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+    return h or 1
+
+
+class DiskVectorStore:
+    """Fixed-capacity ring of embeddings in memory-mapped files.
+
+    Each model gets its own directory with:
+        meta.json     model name, dimension and capacity of the store
+        keys.u64      key hash of the text stored in each slot (0 = empty)
+        vectors.f32   one float32 row per slot
+        cursor.u64    total number of writes, the next slot is cursor % capacity
+
+    Writers append under an exclusive file lock and overwrite the oldest slot when the
+    store is full, so several processes can share one store and readers never block.
+    """
+
+    def __init__(self, root_dir: str, model_name: str, dim: int, capacity: int, readonly=False):
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = capacity
+        self.readonly = readonly
+        self.enabled = False
+        self.path = os.path.join(root_dir, hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:16])
+        self.index = {}
+        self.loaded_cursor = 0
+        try:
+            self._open()
+        except Exception as e:
+            print(f"Error: Could not open embedding disk cache at {self.path}: {e}")
+
+    def _meta(self):
+        return {"model_name": self.model_name, "dim": self.dim,
+                "capacity": self.capacity, "version": STORE_FORMAT_VERSION}
+
+    def _open(self):
+        meta_file = os.path.join(self.path, 'meta.json')
+        if self.readonly:
+            if self._read_meta(meta_file) != self._meta():
+                print(f"Embedding disk cache at {self.path} is missing or stale, disk tier disabled")
+                return
+        else:
+            # serialize (re)creation between processes starting at the same time
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    if self._read_meta(meta_file) != self._meta():
+                        self._create(meta_file)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+        mode = 'r' if self.readonly else 'r+'
+        self.keys = np.memmap(os.path.join(self.path, 'keys.u64'), dtype=np.uint64, mode=mode, shape=(self.capacity,))
+        self.vectors = np.memmap(os.path.join(self.path, 'vectors.f32'), dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+        self.cursor = np.memmap(os.path.join(self.path, 'cursor.u64'), dtype=np.uint64, mode=mode, shape=(1,))
+        self.lock_file = os.path.join(self.path, 'write.lock')
+        self.enabled = True
+
+    def _read_meta(self, meta_file):
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _create(self, meta_file):
+        # a different model, dimension or capacity invalidates all stored vectors
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        np.memmap(os.path.join(self.path, 'keys.u64'), dtype=np.uint64, mode='w+', shape=(self.capacity,)).flush()
+        np.memmap(os.path.join(self.path, 'vectors.f32'), dtype=np.float32, mode='w+', shape=(self.capacity, self.dim)).flush()
+        np.memmap(os.path.join(self.path, 'cursor.u64'), dtype=np.uint64, mode='w+', shape=(1,)).flush()
+        # meta.json is written last, so readers never open a half-created store
+        with open(meta_file, 'w', encoding='utf-8') as f:
+            json.dump(self._meta(), f)
+
+    def _refresh_index(self):
+        # pick up slots written by this or other processes since the last refresh
+        cursor = int(self.cursor[0])
+        if cursor == self.loaded_cursor:
+            return
+        if cursor - self.loaded_cursor >= self.capacity or cursor < self.loaded_cursor:
+            slots = np.arange(self.capacity)
+            self.index = {}
+        else:
+            slots = np.arange(self.loaded_cursor, cursor) % self.capacity
+        for slot, key in zip(slots.tolist(), self.keys[slots].tolist()):
+            if key != 0:
+                self.index[key] = slot
+        self.loaded_cursor = cursor
+
+    def __len__(self):
+        return min(int(self.cursor[0]), self.capacity) if self.enabled else 0
+
+    def get_many(self, key_hashes):
+        """Returns a dict of key hash to a copy of its vector for every key found on disk."""
+        found = {}
+        if not self.enabled:
+            return found
+        self._refresh_index()
+        for key in key_hashes:
+            slot = self.index.get(key)
+            if slot is None or int(self.keys[slot]) != key:
+                continue
+            vector = np.array(self.vectors[slot])
+            # the slot may have been overwritten by a writer while we copied it
+            if int(self.keys[slot]) == key:
+                found[key] = vector
+        return found
+
+    def put_many(self, vectors_by_key):
+        """Appends vectors to the ring, overwriting the oldest slots when the store is full."""
+        if not self.enabled or self.readonly or len(vectors_by_key) == 0:
+            return
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                cursor = int(self.cursor[0])
+                for key, vector in vectors_by_key.items():
+                    slot = cursor % self.capacity
+                    self.keys[slot] = 0
+                    self.vectors[slot] = vector
+                    self.keys[slot] = key
+                    cursor += 1
+                self.vectors.flush()
+                self.keys.flush()
+                self.cursor[0] = cursor
+                self.cursor.flush()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: an in-process LRU in front of a shared DiskVectorStore.
+
+    Entries are keyed by (model name, normalized text), so changing the model never
+    serves vectors computed by another model. The vectors stored must be the ones of the
+    normalized text, as EmbeddingProvider encodes them, or a hit would depend on which
+    spelling of the text was stored first.
+    """
+
+    def __init__(self, model_name: str, dim: int, memory_size=EMBEDDING_CACHE_MEMORY_SIZE,
+                 disk_dir=EMBEDDING_CACHE_DIR, disk_size=EMBEDDING_CACHE_DISK_SIZE,
+                 readonly=EMBEDDING_CACHE_READONLY):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = None
+        if disk_dir and disk_size > 0:
+            self.disk = DiskVectorStore(disk_dir, model_name, dim, disk_size, readonly)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts):
+        """Looks up texts in both tiers.
+
+        Returns:
+            tuple: a dict of text to vector for every hit, and the list of texts that missed.
+        """
+        found = {}
+        disk_lookups = {}
+        with self.lock:
+            for text in texts:
+                key = (self.model_name, normalize_text(text))
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    found[text] = vector
+                else:
+                    disk_lookups.setdefault(text_key_hash(key[1]), []).append(text)
+
+            if self.disk is not None and len(disk_lookups) > 0:
+                for key_hash, vector in self.disk.get_many(disk_lookups.keys()).items():
+                    for text in disk_lookups.pop(key_hash):
+                        self.disk_hits += 1
+                        self._remember((self.model_name, normalize_text(text)), vector)
+                        found[text] = vector
+
+            missing = [text for texts_of_key in disk_lookups.values() for text in texts_of_key]
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, vectors_by_text):
+        """Stores freshly computed vectors in both tiers."""
+        with self.lock:
+            disk_entries = {}
+            for text, vector in vectors_by_text.items():
+                normalized = normalize_text(text)
+                # a row of a batch matrix is a view that keeps the whole batch alive, store a copy
+                vector = np.array(vector, dtype=np.float32, copy=True)
+                self._remember((self.model_name, normalized), vector)
+                disk_entries[text_key_hash(normalized)] = vector
+            if self.disk is not None:
+                try:
+                    self.disk.put_many(disk_entries)
+                except Exception as e:
+                    print(f"Error: Could not write to embedding disk cache: {e}")
+
+    def get_stats(self):
+        """Returns hit/miss counters and the current size of each tier."""
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model_name": self.model_name,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_capacity": self.memory_size,
+                "disk_entries": len(self.disk) if self.disk is not None else 0,
+                "disk_capacity": self.disk.capacity if self.disk is not None else 0,
+                "disk_readonly": self.disk.readonly if self.disk is not None else False,
+            }
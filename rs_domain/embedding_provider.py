@@ -0,0 +1,234 @@
+import os
+import re
+import asyncio
+import threading
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from rs_domain.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_ENABLED, normalize_text
+from rs_domain.embedding_batcher import EmbeddingBatcher, EMBEDDING_BATCHER_ENABLED
+
+# Embedding configuration from environment variables
+TRANSFORMER_DEVICE = os.getenv('TRANSFORMER_DEVICE', 'cpu')  # default is 'cpu'
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))  # max texts per forward pass
+
+# Inference backend: 'torch' (default), 'onnx' or 'onnx-int8' (ONNX Runtime with dynamic int8 quantization)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', './.onnx_models')  # where quantized models are exported
+EMBEDDING_ONNX_QUANTIZATION = os.getenv('EMBEDDING_ONNX_QUANTIZATION', 'avx2')  # arm64, avx2, avx512 or avx512_vnni
+
+EMBEDDING_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def normalize_model_name(model_name: str) -> str:
+    """Returns the full Hugging Face name, so 'x' and 'sentence-transformers/x' share one model."""
+    if '/' not in model_name and not os.path.exists(model_name):
+        return 'sentence-transformers/' + model_name
+    return model_name
+
+
+def load_sentence_transformer(model_name: str, device: str, backend: str) -> SentenceTransformer:
+    """Loads a SentenceTransformer on the given inference backend.
+
+    The 'onnx' backend exports the model to ONNX on first load (or uses the ONNX file published
+    with the model). The 'onnx-int8' backend additionally quantizes the exported model once into
+    EMBEDDING_ONNX_DIR and reuses it on the next starts.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name, device=device)
+    if backend == 'onnx':
+        return SentenceTransformer(model_name, device=device, backend='onnx')
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    file_name = f"onnx/model_qint8_{EMBEDDING_ONNX_QUANTIZATION}.onnx"
+    local_path = os.path.join(EMBEDDING_ONNX_DIR, re.sub(r'[^A-Za-z0-9_.-]+', '__', model_name))
+    if not os.path.exists(os.path.join(local_path, file_name)):
+        print(f"Export quantized ONNX model {model_name} ({EMBEDDING_ONNX_QUANTIZATION}) to {local_path}")
+        onnx_model = SentenceTransformer(model_name, device=device, backend='onnx')
+        onnx_model.save(local_path)
+        export_dynamic_quantized_onnx_model(onnx_model, EMBEDDING_ONNX_QUANTIZATION, local_path)
+    return SentenceTransformer(local_path, device=device, backend='onnx', model_kwargs={"file_name": file_name})
+
+
+class EmbeddingProvider:
+    """Encodes texts with one SentenceTransformer model, loaded lazily and shared by every module.
+
+    Use get_embedding_provider() instead of creating instances directly.
+    """
+
+    def __init__(self, model_name: str, device: str = TRANSFORMER_DEVICE, backend: str = EMBEDDING_BACKEND,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, use_cache: bool = EMBEDDING_CACHE_ENABLED,
+                 use_batcher: bool = EMBEDDING_BATCHER_ENABLED):
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self.batch_size = batch_size
+        self.use_cache = use_cache
+        self.use_batcher = use_batcher
+        self.cache = None
+        self.batcher = None
+        self._model = None
+        self._dimension = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this provider produces: the model name, plus the backend if not torch."""
+        return self.model_name if self.backend == 'torch' else f"{self.model_name}@{self.backend}"
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """The underlying SentenceTransformer, loaded on first use."""
+        return self.load()
+
+    def load(self) -> SentenceTransformer:
+        """Loads the model once, with its cache and batcher, and returns it. Blocks while the model loads."""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    model = load_sentence_transformer(self.model_name, self.device, self.backend)
+                    self._dimension = model.get_sentence_embedding_dimension()
+                    if self.use_cache:
+                        # cached vectors are only valid for the same model and backend
+                        self.cache = EmbeddingCache(self.model_id, self._dimension)
+                    if self.use_batcher:
+                        # concurrent callers share forward passes through one micro-batching queue
+                        self.batcher = EmbeddingBatcher(self._encode_batch)
+                    self._model = model
+                    print('Load vector model:', self.model_name, 'backend:', self.backend,
+                          'on device:', self.device, 'with dim:', self._dimension)
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """The size of the vectors produced by the model."""
+        if self._dimension is None:
+            self.load()
+        return self._dimension
+
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+
+    def _lookup(self, texts, use_cache):
+        # dedupe the valid texts and fill the rows already in the keyword cache.
+        # The normalized text is encoded, the one the cache is keyed on, so a vector never depends on
+        # which spelling of a text was encoded first.
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        unique_texts = []
+        rows_by_text = {}
+        for i, text in enumerate(texts):
+            text = normalize_text(text) if isinstance(text, str) else text
+            if not text or not isinstance(text, str):
+                print(f"Error: Invalid text input for embedding: {texts[i]}")
+                continue
+            if text not in rows_by_text:
+                rows_by_text[text] = []
+                unique_texts.append(text)
+            rows_by_text[text].append(i)
+
+        cache = self.cache if use_cache else None
+        if cache is not None and len(unique_texts) > 0:
+            cached, unique_texts = cache.get_many(unique_texts)
+            for text, embedding in cached.items():
+                vectors[rows_by_text[text]] = embedding
+        return vectors, unique_texts, rows_by_text, cache
+
+    def _fill(self, vectors, missing_texts, embeddings, rows_by_text, cache):
+        for text, embedding in zip(missing_texts, embeddings):
+            vectors[rows_by_text[text]] = embedding
+        if cache is not None:
+            cache.put_many(dict(zip(missing_texts, embeddings)))
+        return vectors
+
+    def encode(self, texts, use_cache=True) -> np.ndarray:
+        """Encodes many texts in batched forward passes.
+
+        Texts are normalized (unicode NFC, trimmed, single spaces) and each distinct one is encoded once,
+        texts found in the keyword cache are not encoded at all, and invalid texts (empty or not a string)
+        get a zero vector. With EMBEDDING_BATCHER_ENABLED the remaining texts join the shared
+        micro-batching queue.
+
+        Args:
+            texts (list): The texts to encode.
+            use_cache (bool, optional): Set to False for free-form texts that are unlikely to repeat.
+
+        Returns:
+            np.ndarray: A float32 matrix with one row per input text.
+        """
+        vectors, missing_texts, rows_by_text, cache = self._lookup(texts, use_cache)
+        if len(missing_texts) > 0:
+            if self.batcher is not None:
+                embeddings = self.batcher.encode(missing_texts)
+            else:
+                embeddings = self._encode_batch(missing_texts)
+            self._fill(vectors, missing_texts, embeddings, rows_by_text, cache)
+        return vectors
+
+    def encode_one(self, text, use_cache=True) -> np.ndarray:
+        """Encodes a single text, see encode()."""
+        return self.encode([text], use_cache)[0]
+
+    async def aencode(self, texts, use_cache=True) -> np.ndarray:
+        """Same as encode(), but never blocks the event loop: the model is loaded and runs in a worker thread
+        or, with EMBEDDING_BATCHER_ENABLED, in the micro-batching queue."""
+        if self._model is None:
+            await asyncio.to_thread(self.load)
+        if self.batcher is None:
+            return await asyncio.to_thread(self.encode, texts, use_cache)
+        vectors, missing_texts, rows_by_text, cache = self._lookup(texts, use_cache)
+        if len(missing_texts) > 0:
+            embeddings = await self.batcher.aencode(missing_texts)
+            self._fill(vectors, missing_texts, embeddings, rows_by_text, cache)
+        return vectors
+
+    async def aencode_one(self, text, use_cache=True) -> np.ndarray:
+        """Same as encode_one(), but never blocks the event loop."""
+        return (await self.aencode([text], use_cache))[0]
+
+    def get_stats(self):
+        """Returns the model settings and the keyword cache statistics."""
+        stats = {"model_name": self.model_name, "backend": self.backend, "device": self.device, "loaded": self.is_loaded(),
+                 "dimension": self._dimension, "batch_size": self.batch_size}
+        stats["cache"] = self.cache.get_stats() if self.cache is not None else {"enabled": False}
+        stats["batcher"] = self.batcher.get_metrics() if self.batcher is not None else {"enabled": False}
+        return stats
+
+
+# One provider per (model, device, backend) in this process
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(model_name: str, device: str = None, backend: str = None) -> EmbeddingProvider:
+    """Returns the process-wide provider for a model, creating it on first use.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        device (str, optional): The torch device. Defaults to TRANSFORMER_DEVICE.
+        backend (str, optional): 'torch', 'onnx' or 'onnx-int8'. Defaults to EMBEDDING_BACKEND.
+
+    Returns:
+        EmbeddingProvider: The shared provider, the model itself is loaded on first encode.
+    """
+    key = (normalize_model_name(model_name), device or TRANSFORMER_DEVICE, backend or EMBEDDING_BACKEND)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = EmbeddingProvider(key[0], key[1], key[2])
+            _providers[key] = provider
+        return provider
+
+
+def get_embedding_providers_stats():
+    """Returns the statistics of every provider created in this process."""
+    with _providers_lock:
+        providers = list(_providers.values())
+    return [provider.get_stats() for provider in providers]
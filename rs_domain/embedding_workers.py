@@ -0,0 +1,128 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker pool configuration from environment variables
+EMBEDDING_WORKERS = int(os.getenv('EMBEDDING_WORKERS', 0))  # 0 embeds in the calling process
+EMBEDDING_WORKER_CHUNK_SIZE = int(os.getenv('EMBEDDING_WORKER_CHUNK_SIZE', 32))  # items per task sent to a worker
+
+
+def _init_worker():
+    # load the model once per worker process, before the first chunk arrives
+    from rs_domain.personalization import embedding_provider
+    embedding_provider.encode(['warmup'], use_cache=False)
+
+
+def _embed_chunk(kind, items):
+    from rs_domain.personalization import embed_items, vector_to_list
+    results = []
+    for vector, error in embed_items(kind, items):
+        # send plain lists back, numpy arrays pickle larger and slower
+        results.append((vector_to_list(vector) if vector is not None else None, error))
+    return results
+
+
+class EmbeddingWorkerPool:
+    """A pool of worker processes, each with the embedding model preloaded.
+
+    Processes are started with 'spawn', so they never inherit a forked copy of the
+    parent's model or Qdrant connections. When a worker process dies, the executor is broken
+    for good: the chunks in flight fail and a new executor is started for the next chunks.
+    """
+
+    def __init__(self, workers=EMBEDDING_WORKERS, chunk_size=EMBEDDING_WORKER_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.executor = self._new_executor()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   mp_context=multiprocessing.get_context('spawn'))
+
+    def _restart(self, broken_executor):
+        # every future of the broken executor fails, only the first one restarts it
+        with self.lock:
+            if self.executor is not broken_executor:
+                return
+            print("Embedding worker pool is broken, starting new worker processes")
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._new_executor()
+            self.restarts += 1
+
+    def _submit(self, kind, chunk):
+        executor = self.executor
+        try:
+            return executor, executor.submit(_embed_chunk, kind, chunk)
+        except BrokenProcessPool:
+            self._restart(executor)
+        executor = self.executor
+        try:
+            return executor, executor.submit(_embed_chunk, kind, chunk)
+        except BrokenProcessPool as e:
+            return executor, e
+
+    def embed_in_order(self, kind, items):
+        """Embeds items across the workers and yields (vector, error) per item, in input order.
+
+        At most two chunks per worker are in flight, so results stream back while the
+        rest of a large payload is still being embedded.
+        """
+        chunks = (items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size))
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((*self._submit(kind, chunk), len(chunk)))
+            if len(in_flight) >= 2 * self.workers:
+                yield from self._results(*in_flight.popleft())
+        while in_flight:
+            yield from self._results(*in_flight.popleft())
+
+    def _results(self, executor, future, size):
+        try:
+            if isinstance(future, Exception):
+                raise future
+            results = future.result()
+        except BrokenProcessPool as e:
+            # a crashed worker fails the chunks in flight, the next chunks go to new worker processes
+            self._restart(executor)
+            results = [(None, f"Embedding worker failed: {e}")] * size
+        except Exception as e:
+            results = [(None, f"Embedding worker failed: {e}")] * size
+        from rs_domain.personalization import vector_from_list
+        for vector, error in results:
+            yield (vector_from_list(vector) if vector is not None else None, error)
+
+    def shutdown(self):
+        with self.lock:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_embedding_worker_pool():
+    """Returns the process-wide worker pool, or None when EMBEDDING_WORKERS is 0."""
+    global _worker_pool
+    if EMBEDDING_WORKERS <= 0:
+        return None
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = EmbeddingWorkerPool()
+            print(f"Started {EMBEDDING_WORKERS} embedding worker processes")
+        return _worker_pool
+
+
+def embed_items_in_order(kind, items):
+    """Yields (vector, error) for each item in input order, using the worker pool if configured."""
+    pool = get_embedding_worker_pool()
+    if pool is None:
+        from rs_domain.personalization import embed_items
+        for i in range(0, len(items), EMBEDDING_WORKER_CHUNK_SIZE):
+            yield from embed_items(kind, items[i:i + EMBEDDING_WORKER_CHUNK_SIZE])
+    else:
+        yield from pool.embed_in_order(kind, items)
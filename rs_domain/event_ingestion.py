@@ -0,0 +1,280 @@
+import os
+import json
+import codecs
+import time
+import asyncio
+from rs_domain.personalization_async import aappend_profile_keywords
+
+# Event ingestion configuration from environment variables
+EVENT_QUEUE_MAX_SIZE = int(os.getenv('EVENT_QUEUE_MAX_SIZE', 10000))  # keyword updates waiting to be applied
+EVENT_QUEUE_PUT_TIMEOUT_MS = int(os.getenv('EVENT_QUEUE_PUT_TIMEOUT_MS', 1000))  # wait for room, then reject
+EVENT_COALESCE_WINDOW_MS = int(os.getenv('EVENT_COALESCE_WINDOW_MS', 200))  # events merged per profile in this window
+EVENT_BATCH_MAX_PROFILES = int(os.getenv('EVENT_BATCH_MAX_PROFILES', 256))  # profiles per batched vector update
+EVENT_MAX_RETRIES = int(os.getenv('EVENT_MAX_RETRIES', 3))  # a failed update is queued again this many times, then dropped
+EVENT_RETRY_DELAY_MS = int(os.getenv('EVENT_RETRY_DELAY_MS', 1000))  # pause of the consumer after a failed batch
+
+# LEO observer events (resources/js/leocdp.observer.js) and the profile facet their keywords go to.
+# Events that say nothing about interests (login, tracking consent, ...) are accepted and ignored.
+EVENT_FACETS = {
+    "page-view": "page_view_keywords",
+    "content-view": "page_view_keywords",
+    "item-view": "page_view_keywords",
+    "click-details": "page_view_keywords",
+    "play-video": "page_view_keywords",
+    "file-download": "page_view_keywords",
+    "search": "interest_keywords",
+    "like": "interest_keywords",
+    "ask-question": "interest_keywords",
+    "add-to-cart": "purchase_keywords",
+    "purchase": "purchase_keywords",
+    "order-checkout": "purchase_keywords",
+}
+
+# Event data fields read as keywords when the event has no "keywords" list
+EVENT_KEYWORD_FIELDS = ["keywords", "query", "search_term", "item_name", "item_category", "content_title", "title"]
+
+
+class EventRejected(Exception):
+    """Raised when the queue stayed full for EVENT_QUEUE_PUT_TIMEOUT_MS."""
+
+
+# Map one event to (profile_id, {facet field: keywords}), None when the event does not change the profile.
+# An event is {"profile_id", "event", "keywords"?, "journey_maps"?, "data"?}, data is the observer eventData.
+# Raises ValueError when the event has no profile_id or a field of the wrong type.
+def map_event_to_keywords(event):
+    profile_id = event.get("profile_id") or event.get("visitor_id")
+    event_name = str(event.get("event", "")).lower()
+    if not profile_id or not isinstance(profile_id, (str, int)):
+        raise ValueError("Event has no valid profile_id")
+
+    keywords = {}
+    field = EVENT_FACETS.get(event_name)
+    if field is not None:
+        data = event.get("data") or {}
+        if not isinstance(data, dict):
+            raise ValueError("Event data must be an object")
+        values = event.get("keywords")
+        if values is None:
+            values = [data.get(name) for name in EVENT_KEYWORD_FIELDS if data.get(name)]
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, list):
+            raise ValueError("Event keywords must be a list of strings")
+        flat = []
+        for value in values:
+            flat += value if isinstance(value, list) else [value]
+        if not all(isinstance(k, (str, int, float)) or k is None for k in flat):
+            raise ValueError("Event keywords must be a list of strings")
+        flat = [str(k).strip() for k in flat if k is not None and str(k).strip()]
+        if len(flat) > 0:
+            keywords[field] = flat
+
+    journey_maps = event.get("journey_maps") or ([event["journey_map"]] if event.get("journey_map") else [])
+    if not isinstance(journey_maps, list) or not all(isinstance(j, str) for j in journey_maps):
+        raise ValueError("Event journey maps must be a list of strings")
+    if len(journey_maps) > 0:
+        keywords["journey_maps"] = list(journey_maps)
+    if len(keywords) == 0:
+        return None
+    return str(profile_id), keywords
+
+
+# Parse events from the chunks of a request body: one JSON array or NDJSON, both read event by event as they arrive.
+# Yields the event dicts, and None for each line or array item that is not a JSON object. An array that is not
+# valid JSON yields the events before the error, then None.
+async def aiter_events(chunks):
+    chunks = chunks.__aiter__()
+    buffer = b""
+    while not buffer.strip():
+        chunk = await _anext_chunk(chunks)
+        if chunk is None:
+            return
+        buffer += chunk
+    if buffer.lstrip().startswith(b"["):
+        async for event in _aiter_array_events(buffer, chunks):
+            yield event
+        return
+    while True:
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_event_line(line)
+        chunk = await _anext_chunk(chunks)
+        if chunk is None:
+            break
+        buffer += chunk
+    if buffer.strip():
+        yield _parse_event_line(buffer)
+
+
+async def _anext_chunk(chunks):
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+# Decode the array items one by one, like bulk_jobs.iter_json_items: only the item being read is kept
+async def _aiter_array_events(buffer, chunks):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")  # a character can be split between chunks
+    text = utf8.decode(buffer)
+    position = text.index("[") + 1
+    ended = False
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position < len(text) and text[position] == "]":
+            return
+        end = None
+        if position < len(text):
+            try:
+                event, end = decoder.raw_decode(text, position)
+            except ValueError:
+                end = None
+        # an item that ends the text may continue in the next chunk (a number), unless the body ended
+        if end is not None and (end < len(text) or ended):
+            yield event if isinstance(event, dict) else None
+            position = end
+            continue
+        if ended:
+            yield None
+            return
+        chunk = await _anext_chunk(chunks)
+        ended = chunk is None
+        text = text[position:] + (utf8.decode(b"", final=True) if ended else utf8.decode(chunk))
+        position = 0
+
+
+def _parse_event_line(line):
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+class ProfileEventIngestor:
+    """Applies observer events to profile vectors in the background.
+
+    Events are mapped to keyword updates and queued. A single consumer task merges the updates of the same
+    profile that arrive within EVENT_COALESCE_WINDOW_MS and applies them with one batched incremental vector
+    update (see append_profile_keywords). When the queue is full, producers wait up to
+    EVENT_QUEUE_PUT_TIMEOUT_MS, which slows down the request that is sending events, then get EventRejected.
+    When a batch fails (a profile locked too long, Qdrant unavailable), its merged updates are queued again
+    after EVENT_RETRY_DELAY_MS, up to EVENT_MAX_RETRIES times, then dropped and counted in events_dropped.
+    """
+
+    def __init__(self, on_profiles_updated=None, max_size=EVENT_QUEUE_MAX_SIZE, put_timeout_ms=EVENT_QUEUE_PUT_TIMEOUT_MS,
+                 window_ms=EVENT_COALESCE_WINDOW_MS, max_profiles=EVENT_BATCH_MAX_PROFILES,
+                 max_retries=EVENT_MAX_RETRIES, retry_delay_ms=EVENT_RETRY_DELAY_MS):
+        self.on_profiles_updated = on_profiles_updated
+        self.max_size = max_size
+        self.put_timeout = put_timeout_ms / 1000.0
+        self.window = window_ms / 1000.0
+        self.max_profiles = max_profiles
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay_ms / 1000.0
+        self.queue = None
+        self.task = None
+        self.stats = {"queued": 0, "rejected": 0, "batches": 0, "events_applied": 0, "profiles_updated": 0,
+                      "profiles_not_found": 0, "batch_errors": 0, "events_retried": 0, "events_dropped": 0,
+                      "last_batch_seconds": 0.0}
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        # apply what is still queued before the process exits
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def put(self, profile_id, keywords):
+        # (profile_id, keywords, failed attempts, events merged in this update)
+        try:
+            await asyncio.wait_for(self.queue.put((profile_id, keywords, 0, 1)), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise EventRejected(f"Event queue is full ({self.max_size} updates)")
+        self.stats["queued"] += 1
+
+    async def _next_batch(self):
+        updates = {}
+        items = 0
+
+        def merge(update):
+            profile_id, keywords, attempts, events = update
+            merged, merged_attempts, merged_events = updates.get(profile_id, ({}, 0, 0))
+            for field, values in keywords.items():
+                merged[field] = merged.get(field, []) + values
+            updates[profile_id] = (merged, max(merged_attempts, attempts), merged_events + events)
+
+        merge(await self.queue.get())
+        items += 1
+        deadline = time.monotonic() + self.window
+        while len(updates) < self.max_profiles:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                merge(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+                items += 1
+            except asyncio.TimeoutError:
+                break
+        return updates, items
+
+    async def _consume(self):
+        while True:
+            updates, items = await self._next_batch()
+            keywords_by_profile = {profile_id: keywords for profile_id, (keywords, _, _) in updates.items()}
+            events = sum(update_events for _, _, update_events in updates.values())
+            started_at = time.perf_counter()
+            try:
+                updated_profiles = await aappend_profile_keywords(keywords_by_profile)
+            except Exception as e:
+                self.stats["batch_errors"] += 1
+                await self._retry_failed_batch(updates, e)
+                updated_profiles = None
+            finally:
+                self.stats["batches"] += 1
+                self.stats["last_batch_seconds"] = round(time.perf_counter() - started_at, 3)
+                for _ in range(items):
+                    self.queue.task_done()
+            if updated_profiles is None:
+                continue
+            self.stats["profiles_updated"] += len(updated_profiles)
+            self.stats["profiles_not_found"] += len(keywords_by_profile) - len(updated_profiles)
+            self.stats["events_applied"] += events
+            if self.on_profiles_updated is not None and len(updated_profiles) > 0:
+                try:
+                    await self.on_profiles_updated(list(updated_profiles))
+                except Exception as e:
+                    # the vectors are written, only the callback failed: not retried
+                    print(f"Event batch callback failed for {len(updated_profiles)} profiles: {e}")
+
+    # Queue the updates of a failed batch again, the ones that failed max_retries times are dropped
+    async def _retry_failed_batch(self, updates, error):
+        await asyncio.sleep(self.retry_delay)
+        retried, dropped = 0, 0
+        for profile_id, (keywords, attempts, events) in updates.items():
+            if attempts < self.max_retries and not self.queue.full():
+                # never wait here, the consumer is the one emptying the queue
+                self.queue.put_nowait((profile_id, keywords, attempts + 1, events))
+                retried += events
+            else:
+                dropped += events
+        self.stats["events_retried"] += retried
+        self.stats["events_dropped"] += dropped
+        print(f"Event batch of {len(updates)} profiles failed: {error}. "
+              f"{retried} events queued again, {dropped} events dropped")
+
+    def get_stats(self):
+        return {**self.stats, "queue_size": self.queue.qsize() if self.queue is not None else 0,
+                "queue_max_size": self.max_size}
@@ -0,0 +1,131 @@
+"""Migrate the product collection from one concatenated vector to named vectors.
+
+Older versions stored each product as [name | category | keywords] concatenated into a single
+vector of 3 x the model dimension. This tool copies every point into a new collection that
+stores the three parts as the named vectors 'name', 'category' and 'keywords'.
+
+With --swap the API is switched to the new collection without any change on its side:
+- when 'cdp_product' is an alias, one alias update points it at the new collection, then the collection
+  it pointed at is deleted. Requests never see a missing collection.
+- when 'cdp_product' is a collection, an alias cannot take its name while it exists. --swap then stops
+  and --delete-source is needed: the collection is deleted and the alias created right after, requests
+  fail with "collection not found" in between. Later migrations go through the alias.
+
+Usage:
+    python -m rs_domain.migrate_product_vectors [--source cdp_product] [--target cdp_product_named]
+                                                [--batch-size 256] [--swap] [--delete-source]
+"""
+import argparse
+
+from dotenv import load_dotenv
+load_dotenv(override=True)
+
+from qdrant_client.http.models import (
+    PointStruct, CreateAliasOperation, CreateAlias, DeleteAliasOperation, DeleteAlias
+)
+
+from rs_domain.qdrant_batch_writer import QdrantBatchWriter
+
+from rs_domain.personalization import get_qdrant_client, PRODUCT_COLLECTION, PRODUCT_VECTOR_NAMES, COLLECTION_PAYLOAD_INDEXES
+from rs_domain.qdrant_schema import reconcile_payload_indexes
+from rs_domain.qdrant_storage import build_collection_config
+
+
+def split_concatenated_vector(vector, dim):
+    return {name: vector[i * dim:(i + 1) * dim] for i, name in enumerate(PRODUCT_VECTOR_NAMES)}
+
+
+def migrate_product_vectors(source: str, target: str, batch_size: int = 256, swap: bool = False,
+                            delete_source: bool = False):
+    client = get_qdrant_client()
+
+    source_vectors = client.get_collection(source).config.params.vectors
+    if isinstance(source_vectors, dict):
+        print(f"Collection '{source}' already uses named vectors {sorted(source_vectors)}, nothing to migrate.")
+        return 0
+    if source_vectors.size % len(PRODUCT_VECTOR_NAMES) != 0:
+        raise ValueError(f"Vector size {source_vectors.size} of '{source}' is not a concatenation of "
+                         f"{len(PRODUCT_VECTOR_NAMES)} vectors")
+    dim = source_vectors.size // len(PRODUCT_VECTOR_NAMES)
+    if swap and not delete_source and source not in [alias.alias_name for alias in client.get_aliases().aliases]:
+        # checked before copying, the swap would stop at the end
+        raise RuntimeError(f"'{source}' is a collection, an alias cannot take its name while it exists. "
+                           f"Use --delete-source to delete it and create the alias, requests fail until the alias exists")
+
+    if not client.collection_exists(target):
+        # the target replaces the product collection, so it gets the product storage profile
+        client.create_collection(
+            collection_name=target,
+            **build_collection_config(PRODUCT_COLLECTION, dim, PRODUCT_VECTOR_NAMES)
+        )
+        print(f"Collection '{target}' created with named vectors {PRODUCT_VECTOR_NAMES} of size {dim}.")
+    reconcile_payload_indexes(client, target, COLLECTION_PAYLOAD_INDEXES[PRODUCT_COLLECTION])
+
+    # copy every point, splitting its concatenated vector into named vectors
+    migrated = 0
+    offset = None
+    # wait=True, the counts below must see every point before a swap
+    with QdrantBatchWriter(client, target, chunk_size=batch_size, wait=True) as writer:
+        while True:
+            points, offset = client.scroll(collection_name=source, limit=batch_size, offset=offset,
+                                           with_payload=True, with_vectors=True)
+            for p in points:
+                writer.add_point(PointStruct(id=p.id, vector=split_concatenated_vector(p.vector, dim), payload=p.payload))
+            migrated += len(points)
+            if len(points) > 0:
+                print(f"Migrated {migrated} products")
+            if offset is None:
+                break
+    print(f"Upsert stats: {writer.get_stats()}")
+    if len(writer.get_failed_items()) > 0:
+        raise RuntimeError(f"{len(writer.get_failed_items())} products could not be written to '{target}', not swapping")
+
+    source_count = client.count(source, exact=True).count
+    target_count = client.count(target, exact=True).count
+    if target_count < source_count:
+        raise RuntimeError(f"'{target}' has {target_count} points but '{source}' has {source_count}, not swapping")
+
+    if swap:
+        swap_collection_alias(client, source, target, delete_source)
+    return migrated
+
+
+# Point the alias `source` at `target`, then delete the collection it pointed at
+def swap_collection_alias(client, source: str, target: str, delete_source: bool = False):
+    aliases = {alias.alias_name: alias.collection_name for alias in client.get_aliases().aliases}
+    if source in aliases:
+        previous = aliases[source]
+        # one update, readers and writers see either the old or the new collection
+        client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=source)),
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=source)),
+        ])
+        print(f"Alias '{source}' now points to '{target}'.")
+        if previous != target:
+            client.delete_collection(previous)
+            print(f"Deleted '{previous}'.")
+        return
+
+    if not delete_source:
+        raise RuntimeError(f"'{source}' is a collection, an alias cannot take its name while it exists. "
+                           f"Use --delete-source to delete it and create the alias, requests fail until the alias exists")
+    # an alias cannot share the name of a collection, requests fail between these two calls
+    client.delete_collection(source)
+    client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=source))
+    ])
+    print(f"Deleted '{source}' and created alias '{source}' -> '{target}'.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate products from a concatenated vector to named vectors")
+    parser.add_argument("--source", default=PRODUCT_COLLECTION, help="collection with concatenated vectors")
+    parser.add_argument("--target", default=PRODUCT_COLLECTION + "_named", help="collection to create with named vectors")
+    parser.add_argument("--batch-size", type=int, default=256, help="points per scroll and upsert")
+    parser.add_argument("--swap", action="store_true", help="point the source alias at the target, then delete the old collection")
+    parser.add_argument("--delete-source", action="store_true",
+                        help="with --swap, when the source is a collection: delete it, then create the alias")
+    args = parser.parse_args()
+
+    count = migrate_product_vectors(args.source, args.target, args.batch_size, args.swap, args.delete_source)
+    print(f"Done, {count} products migrated.")
@@ -1,85 +1,157 @@
 
 import numpy as np
-from qdrant_client import QdrantClient
 from qdrant_client.http.models import PointStruct, MatchExcept, Filter, MatchAny
-from qdrant_client.http.models import VectorParams, Distance, FieldCondition
-from sentence_transformers import SentenceTransformer
+from qdrant_client.http.models import FieldCondition, QueryRequest, SearchParams, PayloadSelectorExclude
+from qdrant_client.http.models import PayloadSelectorInclude, SetPayload, SetPayloadOperation
+from qdrant_client.http.models import Prefetch, FormulaQuery, SumExpression, MultExpression
 from rs_model.personalization_models import ContentRequest, ProfileRequest, ProductRequest
+from rs_domain.embedding_provider import get_embedding_provider
+from rs_domain.qdrant_factory import get_qdrant_client
+from rs_domain.qdrant_schema import reconcile_payload_indexes, KEYWORD
+from rs_domain.qdrant_storage import build_collection_config, get_quantization_search_params, describe_storage_profile
+from rs_domain.product_catalog_index import ProductCatalogIndex, PRODUCT_CATALOG_INDEX_ENABLED
+from rs_domain.profile_locks import profile_locks
 import hashlib
+import json
 import os
 
-# Fetch the host and port from environment variables
-QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')  # default is 'localhost'
-QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))  # default is 6333
-
-# Fetch the host and port from environment variables
-QDRANT_CLOUD_HOST = os.getenv('QDRANT_CLOUD_HOST', '')  # default is empty
-QDRANT_CLOUD_API_KEY = os.getenv('QDRANT_CLOUD_API_KEY', '')  # default is empty
-
-# Initialize QdrantClient with the loaded values
-qdrant_client = False
-if QDRANT_CLOUD_HOST != "" and QDRANT_CLOUD_API_KEY != "":
-    qdrant_client = QdrantClient(host=QDRANT_CLOUD_HOST, api_key=QDRANT_CLOUD_API_KEY)
-    print('USING QDRANT CLOUD DB ' + QDRANT_CLOUD_HOST)
-else:
-    qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-    print('USING LOCAL QDRANT DB ' + QDRANT_HOST)
+# The Qdrant client is shared with every subsystem, see rs_domain/qdrant_factory.py
 
 # Data collections in Qdrant
 PROFILE_COLLECTION = "cdp_profile"
 PRODUCT_COLLECTION = "cdp_product"
 CONTENT_COLLECTION = "cdp_content"
 
-# vector model
-MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
-VECTOR_MODEL = SentenceTransformer(MODEL_NAME)
-VECTOR_DIM_SIZE = VECTOR_MODEL.get_sentence_embedding_dimension()
-print('Load vector model:', MODEL_NAME, 'with dim:', VECTOR_DIM_SIZE)
+# vector model, shared with every other module that uses the same model name.
+# The model is loaded on first use or by warmup_embedding_model() at startup.
+MODEL_NAME = os.getenv('PERSONALIZATION_MODEL_NAME', 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
+embedding_provider = get_embedding_provider(MODEL_NAME)
+
+# a few keywords encoded at startup, so the first request does not pay for the first inference
+WARMUP_TEXTS = ["helmet", "travel", "Electronics", "du lịch Đà Lạt", "noise-cancelling headphones"]
 
 # vector size
-PROFILE_VECTOR_SIZE = VECTOR_DIM_SIZE
-PRODUCT_VECTOR_SIZE = VECTOR_DIM_SIZE * 3
-CONTENT_VECTOR_SIZE = VECTOR_DIM_SIZE
+def get_vector_dim_size():
+    return embedding_provider.dimension
+
+def get_collection_vector_sizes():
+    dim = get_vector_dim_size()
+    return {PROFILE_COLLECTION: dim, PRODUCT_COLLECTION: dim, CONTENT_COLLECTION: dim}
+
+# Products are stored as named vectors, each of the model dimension, so the weights can change per request.
+# This keeps the 3 * dim floats of the legacy concatenated vector and builds one HNSW graph per name:
+# it does not save product memory, see test_poc/benchmark_catalog_index.py for both layouts.
+PRODUCT_VECTOR_NAMES = ["name", "category", "keywords"]
+COLLECTION_VECTOR_NAMES = {PRODUCT_COLLECTION: PRODUCT_VECTOR_NAMES}
+
+# Payload indexes of every filtered field, created or fixed at startup
+COLLECTION_PAYLOAD_INDEXES = {
+    PROFILE_COLLECTION: {"profile_id": KEYWORD, "journey_maps": KEYWORD},
+    PRODUCT_COLLECTION: {"product_id": KEYWORD, "journey_maps": KEYWORD, "category": KEYWORD},
+    CONTENT_COLLECTION: {"content_id": KEYWORD, "journey_maps": KEYWORD, "category": KEYWORD},
+}
+
+# Default weight of each named product vector when ranking products for a profile
+DEFAULT_PRODUCT_VECTOR_WEIGHTS = {"name": 1.0, "category": 1.0, "keywords": 1.0}
+
+# Candidates fetched per named vector = top_n * PRODUCT_PREFETCH_FACTOR, before the weighted fusion
+PRODUCT_PREFETCH_FACTOR = int(os.getenv('PRODUCT_PREFETCH_FACTOR', 4))
+
+# Profiles per retrieve and query_batch_points call of a batch recommendation
+RECOMMEND_BATCH_SIZE = int(os.getenv('RECOMMEND_BATCH_SIZE', 64))
+
+# Items sent again with the same fields are not embedded and upserted again, see split_unchanged_items()
+INGESTION_SKIP_UNCHANGED = os.getenv('INGESTION_SKIP_UNCHANGED', 'true') == 'true'
+
+# Exact in-memory search of small product catalogs, see rs_domain/product_catalog_index.py. None when disabled.
+product_catalog_index = ProductCatalogIndex(PRODUCT_COLLECTION, PRODUCT_VECTOR_NAMES) if PRODUCT_CATALOG_INDEX_ENABLED else None
 
 # Function to get the text embeddings
 def get_text_embedding(text):
     if not text or not isinstance(text, str):
         print(f"Error: Invalid text input for embedding: {text}")
         # Return a zero vector if the text is invalid
-        return np.zeros(VECTOR_DIM_SIZE)
+        return np.zeros(get_vector_dim_size())
 
-    # Generate embeddings using the VECTOR_MODEL
-    text_embedding = VECTOR_MODEL.encode(text, convert_to_tensor=True)
-
-    # Ensure tensor is on CPU before converting to NumPy
-    if text_embedding.is_cuda:
-        numpy_embedding = text_embedding.cpu().numpy()
-    else:
-        numpy_embedding = text_embedding.numpy()
-
-    return numpy_embedding
+    return get_text_embeddings([text])[0]
 
 # get all collections in Qdrant
 def get_all_collection_names_in_qdrant():
-    existing_collections = qdrant_client.get_collections().collections
+    existing_collections = get_qdrant_client().get_collections().collections
     return existing_collections
 
-# Updated function to create collection in Qdrant
-def create_qdrant_collection_if_not_exists(collection_name: str, vector_size: int):
+# Check if a collection, or an alias pointing to one, exists in Qdrant
+def collection_or_alias_exists(collection_name: str):
+    client = get_qdrant_client()
+    names = [col.name for col in client.get_collections().collections]
+    names += [alias.alias_name for alias in client.get_aliases().aliases]
+    return collection_name in names
+
+# Updated function to create collection in Qdrant, with named vectors when vector_names is given.
+# Quantization, on-disk vectors and HNSW settings come from the storage profile of the collection.
+def create_qdrant_collection_if_not_exists(collection_name: str, vector_size: int, vector_names=None):
     # Check if collection already exists
-    existing_collections = qdrant_client.get_collections().collections
-    if collection_name not in [col.name for col in existing_collections]:
-        # Create collection with vectors_config
-        qdrant_client.create_collection(
+    if not collection_or_alias_exists(collection_name):
+        get_qdrant_client().create_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(
-                size=vector_size, distance=Distance.COSINE)
+            **build_collection_config(collection_name, vector_size, vector_names)
         )
-        print(f"Collection '{collection_name}' created successfully.")
+        print(f"Collection '{collection_name}' created successfully with storage {describe_storage_profile(collection_name)}.")
     else:
         print(f"Collection '{collection_name}' already exists.")
 
 
+# Function to get the text embeddings of many texts in a single model call
+def get_text_embeddings(texts):
+    return embedding_provider.encode(texts)
+
+# Hit/miss counters and sizes of the embedding cache
+def get_embedding_cache_stats():
+    if embedding_provider.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_provider.cache.get_stats()}
+
+# Embed all keyword facets in one batch, then split the matrix back per facet
+def get_facet_embeddings(facets):
+    keywords = [k for facet in facets for k in facet]
+    embeddings = get_text_embeddings(keywords)
+    offsets = np.cumsum([len(facet) for facet in facets])[:-1]
+    return np.split(embeddings, offsets)
+
+# Profile facets and the payload field of their keywords
+PROFILE_FACETS = {"page_view": "page_view_keywords", "purchase": "purchase_keywords",
+                  "interest": "interest_keywords", "journey": "journey_maps"}
+REQUIRED_PROFILE_FACETS = ["page_view", "purchase", "interest"]
+
+# Weight of each facet mean in the profile vector, without and with journey maps (weights can be adjusted)
+PROFILE_FACET_WEIGHTS = {"page_view": 0.3, "purchase": 0.4, "interest": 0.3}
+PROFILE_FACET_WEIGHTS_WITH_JOURNEYS = {"page_view": 0.2, "purchase": 0.3, "interest": 0.4, "journey": 0.1}
+
+# Payload field of the running sum and count of each facet, so new keywords update the vector
+# without embedding the whole history again
+FACET_STATS_FIELD = "facet_stats"
+
+# The facet stats are large and only used to update vectors, they are not read with the profile
+PROFILE_PAYLOAD_SELECTOR = PayloadSelectorExclude(exclude=[FACET_STATS_FIELD])
+
+# Sum and count of the keyword embeddings of each facet, embedded in one batch
+def build_profile_facet_stats(page_view_keywords, purchase_keywords, interest_keywords, journey_maps=[]):
+    keywords = [page_view_keywords, purchase_keywords, interest_keywords, journey_maps]
+    facet_vectors = get_facet_embeddings(keywords)
+    return {
+        name: {"sum": np.sum(vectors, axis=0, dtype=np.float32) if len(vectors) > 0 else None, "count": len(vectors)}
+        for name, vectors in zip(PROFILE_FACETS, facet_vectors)
+    }
+
+# Weighted combination of the facet means, None when a required facet has no keyword
+def combine_profile_facet_stats(facet_stats):
+    if any(facet_stats[name]["count"] == 0 for name in REQUIRED_PROFILE_FACETS):
+        print("Error: One or more keyword lists are empty.")
+        return None
+    weights = PROFILE_FACET_WEIGHTS_WITH_JOURNEYS if facet_stats["journey"]["count"] > 0 else PROFILE_FACET_WEIGHTS
+    return sum(w * (np.asarray(facet_stats[name]["sum"], dtype=np.float32) / facet_stats[name]["count"])
+               for name, w in weights.items())
+
 # Build profile vector based on attributes
 def build_profile_vector(page_view_keywords, purchase_keywords, interest_keywords, journey_maps=[]):
     # Ensure none of the input lists are empty to avoid issues
@@ -87,29 +159,9 @@ def build_profile_vector(page_view_keywords, purchase_keywords, interest_keyword
         print("Error: One or more keyword lists are empty.")
         return None
 
-    # Get embeddings for page views, purchases, and interests
-    page_view_vectors = np.array([get_text_embedding(k)
-                                 for k in page_view_keywords])
-    purchase_vectors = np.array([get_text_embedding(k)
-                                for k in purchase_keywords])
-    interest_vectors = np.array([get_text_embedding(k)
-                                for k in interest_keywords])
-
-    # Aggregate vectors by averaging or weighted sum
-    page_view_vector = np.mean(page_view_vectors, axis=0)
-    purchase_vector = np.mean(purchase_vectors, axis=0)
-    interest_vector = np.mean(interest_vectors, axis=0)
-
-    # Final profile vector by combining (weights can be adjusted)
-    if len(journey_maps) > 0:
-        journey_vectors = np.array([get_text_embedding(k) for k in journey_maps])
-        journey_vector = np.mean(journey_vectors, axis=0)
-        profile_vector = 0.2 * page_view_vector + 0.3 * \
-            purchase_vector + 0.4 * interest_vector + 0.1 * journey_vector
-    else:
-        profile_vector = 0.3 * page_view_vector + 0.4 * \
-            purchase_vector + 0.3 * interest_vector
-    return profile_vector
+    # Average the embeddings of each facet and combine the facet means with their weights
+    facet_stats = build_profile_facet_stats(page_view_keywords, purchase_keywords, interest_keywords, journey_maps)
+    return combine_profile_facet_stats(facet_stats)
 
 
 
@@ -120,11 +172,9 @@ def build_content_vector(content_title, content_category, content_keywords):
         print("Error: One or more keyword lists are empty.")
         return None
 
-    # Get embeddings for title, category and keywords
-    title_embedding = np.array([get_text_embedding(content_title)])
-    category_embedding = np.array([get_text_embedding(content_category)])
-    keyword_embeddings = np.array([get_text_embedding(k)
-                                for k in content_keywords])
+    # Get embeddings for title, category and keywords in one batch
+    title_embedding, category_embedding, keyword_embeddings = get_facet_embeddings(
+        [[content_title], [content_category], content_keywords])
 
     # Aggregate vectors by averaging or weighted sum
     title_vector = np.mean(title_embedding, axis=0)
@@ -138,32 +188,45 @@ def build_content_vector(content_title, content_category, content_keywords):
 
 # Build product vector based on attributes
 def build_product_vector(product_name, product_category, product_keywords, journey_maps=[]):
-    # Can use advanced models like BERT for better embeddings
-    name_vector = get_text_embedding(product_name)
-    category_vector = get_text_embedding(product_category)
-    keyword_vectors = np.array([get_text_embedding(k)
-                               for k in product_keywords])
+    # Get embeddings for name, category, keywords and journeys in one batch
+    facets = [[product_name], [product_category], product_keywords]
+    if len(journey_maps) > 0:
+        facets.append(journey_maps)
+    facet_vectors = get_facet_embeddings(facets)
+    name_vector = facet_vectors[0][0]
+    category_vector = facet_vectors[1][0]
+    keyword_vectors = facet_vectors[2]
 
-    # Final product vector by concatenating all (can use other combination strategies)
+    # Final product vectors, one per name in PRODUCT_VECTOR_NAMES
     if len(journey_maps) > 0:
-        journey_vectors = np.array([get_text_embedding(k)
-                                   for k in journey_maps])
+        journey_vectors = facet_vectors[3]
 
         weight_keywords = 0.4
         weight_journeys = 0.6
 
         # Calculate the weighted mean along the desired axis (usually axis=0 for combining vectors)
-        mean_of_keywords_journeys = (weight_keywords * np.mean(keyword_vectors, axis=0) +
-                                     weight_journeys * np.mean(journey_vectors, axis=0))
-
-        product_vector = np.concatenate(
-            [name_vector, category_vector, mean_of_keywords_journeys])
+        keyword_vector = (weight_keywords * np.mean(keyword_vectors, axis=0) +
+                          weight_journeys * np.mean(journey_vectors, axis=0))
     else:
         # Aggregate keyword vectors by averaging
         keyword_vector = np.mean(keyword_vectors, axis=0)
-        product_vector = np.concatenate(
-            [name_vector, category_vector, keyword_vector])
-    return product_vector
+    return {"name": name_vector, "category": category_vector, "keywords": keyword_vector}
+
+# Convert a vector, or a dict of named vectors, to plain lists for Qdrant and pickling
+def vector_to_list(vector):
+    if isinstance(vector, dict):
+        return {name: v.tolist() for name, v in vector.items()}
+    return vector.tolist()
+
+def vector_from_list(vector):
+    if isinstance(vector, dict):
+        return {name: np.array(v, dtype=np.float32) for name, v in vector.items()}
+    return np.array(vector, dtype=np.float32)
+
+def is_finite_vector(vector):
+    if isinstance(vector, dict):
+        return all(np.all(np.isfinite(v)) for v in vector.values())
+    return bool(np.all(np.isfinite(vector)))
 
 # Convert string to point_id using hashlib for large dataset
 def string_to_point_id(input_string):
@@ -171,38 +234,166 @@ def string_to_point_id(input_string):
     # the resulting integer to a range between 0 and 99,999,999,999,999,999 (16 digits).
     return int(hashlib.sha256(input_string.encode('utf-8')).hexdigest(), 16) % (10 ** 16)
 
+# Bump when the way vectors are built changes, so every stored vector is seen as stale
+VECTOR_SCHEMA_VERSION = 1
+
+# Payload fields each kind of vector is built from
+VECTOR_FIELDS = {
+    "profile": ["page_view_keywords", "purchase_keywords", "interest_keywords", "journey_maps"],
+    "product": ["name", "category", "keywords", "journey_maps"],
+    "content": ["title", "category", "keywords"],
+}
+
+# Fingerprint of the model and of the payload fields a vector was built from.
+# A stored vector is stale when its fingerprint differs from the one of its payload.
+def compute_vector_fingerprint(kind: str, payload: dict):
+    source = {"model": embedding_provider.model_id, "schema": VECTOR_SCHEMA_VERSION,
+              "fields": [payload.get(field) for field in VECTOR_FIELDS[kind]]}
+    return hashlib.sha1(json.dumps(source, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# Fingerprint of every field of an item payload, the fields derived from them are left out
+def compute_payload_fingerprint(payload: dict):
+    source = {k: v for k, v in payload.items() if k not in ("vector_fingerprint", "payload_fingerprint", FACET_STATS_FIELD)}
+    return hashlib.sha1(json.dumps(source, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+# Only the fingerprints are read to compare stored items with the ones sent again
+FINGERPRINT_PAYLOAD_SELECTOR = PayloadSelectorInclude(include=["vector_fingerprint", "payload_fingerprint"])
+
+# "changed" when the vector must be built again, "payload" when only fields outside the vector changed,
+# "unchanged" when the stored point is the same as the one the payload would give
+def compare_item_fingerprints(stored_payload, payload):
+    if not stored_payload or stored_payload.get("vector_fingerprint") != payload["vector_fingerprint"]:
+        return "changed"
+    if stored_payload.get("payload_fingerprint") != payload["payload_fingerprint"]:
+        return "payload"
+    return "unchanged"
+
+# Items embedded, items whose payload only was updated, and items skipped because nothing changed
+ingestion_stats = {"embedded": 0, "payload_updated": 0, "unchanged": 0}
+
+def get_ingestion_stats():
+    return {"skip_unchanged": INGESTION_SKIP_UNCHANGED, **ingestion_stats}
+
 # Helper function to add vectors to Qdrant collection
 def add_vector_to_qdrant(collection_name: str, object_id, vector, payload):
     point_id = string_to_point_id(str(object_id))
     point = PointStruct(
         id=point_id,  # Use profile_id as the point ID
-        vector=vector.tolist(),  # Store the vector
+        vector=vector_to_list(vector),  # Store the vector, or the named vectors
         payload=payload
     )
-    qdrant_client.upsert(
+    get_qdrant_client().upsert(
         collection_name=collection_name,
         points=[point]
     )
+    if collection_name == PRODUCT_COLLECTION:
+        index_saved_products([(object_id, vector, payload)])
+
+# Build the payload stored with a profile vector
+def build_profile_payload(p: ProfileRequest):
+    payload = {"profile_id": p.profile_id, "additional_info": p.additional_info}
+    payload['page_view_keywords'] = p.page_view_keywords
+    payload['purchase_keywords'] = p.purchase_keywords
+    payload['interest_keywords'] = p.interest_keywords
+    payload['journey_maps'] = p.journey_maps
+    return payload
+
+# Build the payload stored with a product vector
+def build_product_payload(p: ProductRequest):
+    return {"product_id": p.product_id, "name": p.product_name,
+            "keywords": p.product_keywords, "url": p.url,
+            "category": p.product_category, "additional_info": p.additional_info,
+            "journey_maps": p.journey_maps}
+
+# Build the payload stored with a content vector
+def build_content_payload(c: ContentRequest):
+    return {"content_id": c.content_id, "title": c.title, "url": c.url,
+            "description": c.description, "content": c.content,
+            "content_type": c.content_type, "keywords": c.content_keywords,
+            "category": c.content_category, "additional_info": c.additional_info,
+            "journey_maps": c.journey_maps}
+
+# Build the vector of a profile, product or content request
+def build_profile_request_vector(p: ProfileRequest):
+    return build_profile_vector(p.page_view_keywords, p.purchase_keywords, p.interest_keywords, p.journey_maps)
+
+def build_product_request_vector(p: ProductRequest):
+    return build_product_vector(p.product_name, p.product_category, p.product_keywords, p.journey_maps)
+
+def build_content_request_vector(c: ContentRequest):
+    return build_content_vector(c.title, c.content_category, c.content_keywords)
+
+# How each kind of item is embedded and stored, used by the bulk ingestion paths
+ITEM_KINDS = {
+    "profile": {"collection": PROFILE_COLLECTION, "id_field": "profile_id",
+                "build_vector": build_profile_request_vector, "build_payload": build_profile_payload},
+    "product": {"collection": PRODUCT_COLLECTION, "id_field": "product_id",
+                "build_vector": build_product_request_vector, "build_payload": build_product_payload},
+    "content": {"collection": CONTENT_COLLECTION, "id_field": "content_id",
+                "build_vector": build_content_request_vector, "build_payload": build_content_payload},
+}
+
+# Build the payload of an item, with the fingerprint of the vector built from it
+def build_item_payload(kind: str, item):
+    payload = ITEM_KINDS[kind]["build_payload"](item)
+    payload["vector_fingerprint"] = compute_vector_fingerprint(kind, payload)
+    payload["payload_fingerprint"] = compute_payload_fingerprint(payload)
+    return payload
+
+# Reuse the stored vector of an item sent again with the same vector fields: only its payload is updated,
+# when other fields changed. Returns the stored vector, or None when the item must be embedded.
+def reuse_unchanged_item(kind: str, object_id, payload):
+    if not INGESTION_SKIP_UNCHANGED:
+        return None
+    collection_name = ITEM_KINDS[kind]["collection"]
+    point_id = string_to_point_id(str(object_id))
+    points = get_qdrant_client().retrieve(collection_name=collection_name, ids=[point_id],
+                                          with_payload=FINGERPRINT_PAYLOAD_SELECTOR, with_vectors=True)
+    if len(points) == 0 or not points[0].vector:
+        return None
+    change = compare_item_fingerprints(points[0].payload, payload)
+    if change == "changed":
+        return None
+    if change == "payload":
+        get_qdrant_client().set_payload(collection_name=collection_name, payload=payload, points=[point_id])
+        if kind == "product":
+            index_saved_payloads([(object_id, payload)])
+        ingestion_stats["payload_updated"] += 1
+    else:
+        ingestion_stats["unchanged"] += 1
+    return vector_from_list(points[0].vector)
+
+# Save a profile and return its id, vector and payload, so callers can reuse the vector
+def save_profile_to_qdrant(p: ProfileRequest):
+    with profile_locks([p.profile_id]):
+        return _save_profile_to_qdrant(p)
+
+def _save_profile_to_qdrant(p: ProfileRequest):
+    profile_id = p.profile_id
+    payload = build_item_payload("profile", p)
+    profile_vector = reuse_unchanged_item("profile", profile_id, payload)
+    if profile_vector is not None:
+        print(f"Profile {profile_id} has the same vector fields, not embedded again")
+        return profile_id, profile_vector, payload
+
+    profile_vector = build_profile_request_vector(p)
+    if profile_vector is None:
+        print(
+            f"Error: Could not generate a valid vector for profile {profile_id}.")
+        return None, None, None
+
+    # Save profile vector to Qdrant
+    ingestion_stats["embedded"] += 1
+    add_vector_to_qdrant(PROFILE_COLLECTION, profile_id, profile_vector, payload)
+    print(f"Profile {profile_id} added to Qdrant")
+    return profile_id, profile_vector, payload
 
 # Function to add profile to Qdrant
 def add_profile_to_qdrant(p: ProfileRequest):
     try: 
-        profile_id = p.profile_id
-        profile_vector = build_profile_vector(p.page_view_keywords, p.purchase_keywords, p.interest_keywords, p.journey_maps)
-
-        if profile_vector is None:
-            print(
-                f"Error: Could not generate a valid vector for profile {profile_id}.")
+        profile_id, profile_vector, payload = save_profile_to_qdrant(p)
+        if profile_id is None:
             return
-
-        # Save profile vector to Qdrant
-        payload = {"profile_id": profile_id, "additional_info": p.additional_info}
-        payload['page_view_keywords'] = p.page_view_keywords
-        payload['purchase_keywords'] = p.purchase_keywords
-        payload['interest_keywords'] = p.interest_keywords
-        payload['journey_maps'] = p.journey_maps
-        add_vector_to_qdrant(PROFILE_COLLECTION, profile_id, profile_vector, payload)
-        print(f"Profile {profile_id} added to Qdrant")
         return profile_id
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -214,18 +405,20 @@ def add_profile_to_qdrant(p: ProfileRequest):
 # Function to add product to Qdrant
 def add_product_to_qdrant(p: ProductRequest):
     product_id = p.product_id
+    payload = build_item_payload("product", p)
+    if reuse_unchanged_item("product", product_id, payload) is not None:
+        print(f"Product {product_id} has the same vector fields, not embedded again")
+        return product_id
+
     # Generate product vector
-    product_vector = build_product_vector(p.product_name, p.product_category, p.product_keywords, p.journey_maps)
+    product_vector = build_product_request_vector(p)
     if product_vector is None:
         print(
             f"Error: Could not generate a valid vector for product {p.product_name} with ID {product_id}.")
         return
 
     # Save product vector to Qdrant
-    payload = {"product_id": product_id, "name": p.product_name,  
-               "keywords": p.product_keywords, "url": p.url,
-               "category": p.product_category, "additional_info": p.additional_info,
-               "journey_maps": p.journey_maps}
+    ingestion_stats["embedded"] += 1
     add_vector_to_qdrant(PRODUCT_COLLECTION, product_id, product_vector, payload)
     print(f"Product {product_id} added to Qdrant")
     return product_id
@@ -233,101 +426,457 @@ def add_product_to_qdrant(p: ProductRequest):
 # Function to add content to Qdrant
 def add_content_to_qdrant(c: ContentRequest):
     content_id = c.content_id
+    payload = build_item_payload("content", c)
+    if reuse_unchanged_item("content", content_id, payload) is not None:
+        print(f"Content {content_id} has the same vector fields, not embedded again")
+        return content_id
+
     # Generate content vector
-    content_vector = build_content_vector(c.title, c.content_category, c.content_keywords)
+    content_vector = build_content_request_vector(c)
     if content_vector is None:
         print(
             f"Error: Could not generate a valid vector for content title {c.title} with ID {content_id}.")
         return
 
-    # Save product vector to Qdrant
-    payload = {"content_id": content_id, "title": c.title, "url": c.url, 
-               "description": c.description, "content": c.content,
-               "content_type": c.content_type, "keywords": c.content_keywords,
-               "category": c.content_category, "additional_info": c.additional_info,
-               "journey_maps": c.journey_maps}
+    # Save content vector to Qdrant
+    ingestion_stats["embedded"] += 1
     add_vector_to_qdrant(CONTENT_COLLECTION, content_id, content_vector, payload)
     print(f"Content {content_id} added to Qdrant")
     return content_id
 
-# Recommend products based on profile vector
-def recommend_products_for_profile(profile_id, top_n=8, except_product_ids=[], in_journey_maps=[]):
-    try:
-        point_id = string_to_point_id(profile_id)
-        profile_data = qdrant_client.retrieve(
-            collection_name=PROFILE_COLLECTION,
-            ids=[point_id]  # Fetch the point with the given profile_id
-        )
-        print(profile_data)
-
-        # Check if profile exists and has a vector
-        if not profile_data or len(profile_data) == 0:
-            print(f"Profile {profile_id} not found in Qdrant.")
-            return []
-
-        profile = profile_data[0]
-        if len(profile.payload) == 0:
-            print(f"Profile {profile_id} does not have a vector in Qdrant.")
-            return []
-
-        profile_vector = build_profile_vector(
-            profile.payload['page_view_keywords'],
-            profile.payload['purchase_keywords'],
-            profile.payload['interest_keywords'],
-            profile.payload['journey_maps']
-        )
-
-        # the vector to query
-        search_vector = np.concatenate(
-            [profile_vector, profile_vector, profile_vector])
+# Embed a list of items of one kind and return (vector, error) per item, in input order
+def embed_items(kind: str, items):
+    results = []
+    build_vector = ITEM_KINDS[kind]["build_vector"]
+    for item in items:
+        try:
+            vector = build_vector(item)
+            if vector is None:
+                results.append((None, "Could not generate a valid vector"))
+            elif not is_finite_vector(vector):
+                results.append((None, "Vector is not finite, check for empty keyword lists"))
+            else:
+                results.append((vector, None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+# Compare the (item, payload) entries with the stored points, with one retrieve of their fingerprints.
+# Returns the entries to embed, the entries whose vector fields did not change but other fields did,
+# and the ids of the items that did not change at all. Items sent twice in the batch are embedded.
+def split_unchanged_items(kind: str, entries):
+    id_field = ITEM_KINDS[kind]["id_field"]
+    point_ids = [string_to_point_id(str(getattr(item, id_field))) for item, _ in entries]
+    stored = get_qdrant_client().retrieve(collection_name=ITEM_KINDS[kind]["collection"], ids=list(set(point_ids)),
+                                          with_payload=FINGERPRINT_PAYLOAD_SELECTOR, with_vectors=False)
+    stored_payloads = {point.id: point.payload for point in stored}
+    sent = {}
+    for point_id in point_ids:
+        sent[point_id] = sent.get(point_id, 0) + 1
+
+    changed_entries, payload_updates, unchanged_ids = [], [], []
+    for (item, payload), point_id in zip(entries, point_ids):
+        change = compare_item_fingerprints(stored_payloads.get(point_id), payload) if sent[point_id] == 1 else "changed"
+        if change == "changed":
+            changed_entries.append((item, payload))
+        elif change == "payload":
+            payload_updates.append((item, payload))
+        else:
+            unchanged_ids.append(getattr(item, id_field))
+    return changed_entries, payload_updates, unchanged_ids
+
+# Store the new payloads of items whose vectors did not change, in one request. Returns their ids.
+def set_item_payloads(kind: str, payload_updates):
+    id_field = ITEM_KINDS[kind]["id_field"]
+    operations = [SetPayloadOperation(set_payload=SetPayload(payload=payload,
+                                                             points=[string_to_point_id(str(getattr(item, id_field)))]))
+                  for item, payload in payload_updates]
+    get_qdrant_client().batch_update_points(collection_name=ITEM_KINDS[kind]["collection"], update_operations=operations)
+    object_ids = [getattr(item, id_field) for item, _ in payload_updates]
+    if kind == "product":
+        index_saved_payloads([(object_id, payload) for object_id, (_, payload) in zip(object_ids, payload_updates)])
+    return object_ids
+
+# Function to add many profiles, products or contents to Qdrant.
+# Returns the ids of the items added or updated, the failed items, and the ids of the items that did not
+# change since they were stored and were skipped, see split_unchanged_items().
+# Embedding is fanned out to the worker pool when EMBEDDING_WORKERS > 0.
+# With wait=True the points are applied when it returns, callers invalidate the recommendation caches next.
+# Profiles stay locked from the fingerprint comparison to the last upsert, see profile_locks().
+def add_items_to_qdrant(kind: str, items, wait=True):
+    if kind != "profile":
+        return _add_items_to_qdrant(kind, items, wait)
+    with profile_locks([item.profile_id for item in items]):
+        return _add_items_to_qdrant(kind, items, wait)
+
+def _add_items_to_qdrant(kind: str, items, wait=True):
+    from rs_domain.embedding_workers import embed_items_in_order
+    from rs_domain.qdrant_batch_writer import QdrantBatchWriter
+
+    collection_name = ITEM_KINDS[kind]["collection"]
+    id_field = ITEM_KINDS[kind]["id_field"]
+
+    queued_ids = []
+    queued_products = []
+    failed_items = []
+    updated_ids = []
+    unchanged_ids = []
+    # the payloads and their fingerprints are built once, for the comparison and the upsert
+    entries = []
+    for item in items:
+        try:
+            entries.append((item, build_item_payload(kind, item)))
+        except Exception as e:
+            print(f"Error: Could not add {kind} {getattr(item, id_field)} to Qdrant: {e}")
+            failed_items.append({"id": getattr(item, id_field), "error": str(e)})
+
+    if INGESTION_SKIP_UNCHANGED and len(entries) > 0:
+        try:
+            entries, payload_updates, unchanged_ids = split_unchanged_items(kind, entries)
+        except Exception as e:
+            print(f"Could not compare {kind} fingerprints, embedding every item: {e}")
+            payload_updates = []
+        if len(payload_updates) > 0:
+            try:
+                updated_ids = set_item_payloads(kind, payload_updates)
+            except Exception as e:
+                print(f"Error: Could not update {len(payload_updates)} {kind} payloads in Qdrant: {e}")
+                failed_items += [{"id": getattr(item, id_field), "error": str(e)} for item, _ in payload_updates]
+        ingestion_stats["unchanged"] += len(unchanged_ids)
+        ingestion_stats["payload_updated"] += len(updated_ids)
+        print(f"{len(unchanged_ids)} {kind} items unchanged, {len(updated_ids)} payloads updated, {len(entries)} to embed")
+
+    # points are upserted in chunks, several in flight, while the next items are still embedding
+    with QdrantBatchWriter(get_qdrant_client(), collection_name, wait=wait) as writer:
+        embedded = embed_items_in_order(kind, [item for item, _ in entries])
+        for (item, payload), (vector, error) in zip(entries, embedded):
+            object_id = getattr(item, id_field)
+            if error is None:
+                ingestion_stats["embedded"] += 1
+                try:
+                    writer.add(string_to_point_id(str(object_id)), vector_to_list(vector), payload, object_id)
+                    queued_ids.append(object_id)
+                    if kind == "product":
+                        queued_products.append((object_id, vector, payload))
+                    continue
+                except Exception as e:
+                    error = str(e)
+            print(f"Error: Could not add {kind} {object_id} to Qdrant: {error}")
+            failed_items.append({"id": object_id, "error": error})
+
+    stats = writer.get_stats()
+    print(f"Upserted {stats['points_written']} {kind} points to '{collection_name}' in {stats['seconds']} s "
+          f"({stats['points_per_second']} points/s, {stats['chunks_written']} chunks, {stats['retries']} retries)")
+
+    upsert_failures = writer.get_failed_items()
+    failed_ids = {f["id"] for f in upsert_failures}
+    added_ids = [object_id for object_id in queued_ids if object_id not in failed_ids]
+    index_saved_products([product for product in queued_products if product[0] not in failed_ids])
+    return added_ids + updated_ids, failed_items + upsert_failures, unchanged_ids
+
+# Load the stored vector and payload of a profile.
+# The vector is rebuilt from the keywords, and stored again, only when it is missing or stale.
+def load_profile_vector(profile_id):
+    point_id = string_to_point_id(profile_id)
+    profile_data = get_qdrant_client().retrieve(
+        collection_name=PROFILE_COLLECTION,
+        ids=[point_id],  # Fetch the point with the given profile_id
+        with_payload=PROFILE_PAYLOAD_SELECTOR,
+        with_vectors=True
+    )
 
-        # filters
-        must_filter = []
-        if len(in_journey_maps) > 0:
-            must_filter.append(FieldCondition(key="journey_maps", match=MatchAny(any=in_journey_maps)))
-        if len(except_product_ids) > 0:
-            must_filter.append(FieldCondition(key="product_id", match=MatchExcept(**{"except": except_product_ids})))
-        
-        print(len(in_journey_maps))
-        print(len(except_product_ids))
-        print(must_filter)
-            
-        # Use profile vector to search for closest products in the product collection
-        search_results = qdrant_client.search(
-            collection_name=PRODUCT_COLLECTION,
-            query_vector=search_vector,
-            query_filter=Filter( must=must_filter),
-            limit=top_n
-        )
+    # Check if profile exists and has a payload
+    if not profile_data or len(profile_data) == 0:
+        print(f"Profile {profile_id} not found in Qdrant.")
+        return None, None
+
+    profile = profile_data[0]
+    if not profile.payload:
+        print(f"Profile {profile_id} does not have a payload in Qdrant.")
+        return None, None
+
+    payload = profile.payload
+    profile_vector = get_stored_profile_vector(profile)
+    if profile_vector is not None:
+        return profile_vector, payload
+
+    print(f"Profile {profile_id} has a stale vector, rebuilding it.")
+    return rebuild_stored_profile_vectors([profile_id]).get(profile_id, (None, None))
+
+# Return the vector of a retrieved profile point, or None when it is missing or stale
+def get_stored_profile_vector(point):
+    if point.vector is not None and point.payload.get("vector_fingerprint") == compute_vector_fingerprint("profile", point.payload):
+        return np.array(point.vector, dtype=np.float32)
+    return None
+
+# Facet stats as stored in the payload, with the fingerprint of the keywords they were built from
+def facet_stats_to_payload(facet_stats, vector_fingerprint):
+    return {"fingerprint": vector_fingerprint,
+            "facets": {name: {"sum": None if f["sum"] is None else np.asarray(f["sum"]).tolist(), "count": f["count"]}
+                       for name, f in facet_stats.items()}}
+
+# Facet stats of a payload, None when missing or built from other keywords or another model
+def facet_stats_from_payload(payload):
+    stored = payload.get(FACET_STATS_FIELD)
+    if not stored or stored.get("fingerprint") != compute_vector_fingerprint("profile", payload):
+        return None
+    return {name: {"sum": None if f["sum"] is None else np.array(f["sum"], dtype=np.float32), "count": f["count"]}
+            for name, f in stored["facets"].items()}
+
+# Rebuild the vector and the facet stats of a profile from every keyword of its payload
+def rebuild_profile_vector_with_stats(payload):
+    facet_stats = build_profile_facet_stats(*[payload.get(field) or [] for field in PROFILE_FACETS.values()])
+    profile_vector = combine_profile_facet_stats(facet_stats)
+    if profile_vector is not None:
+        payload["vector_fingerprint"] = compute_vector_fingerprint("profile", payload)
+        payload["payload_fingerprint"] = compute_payload_fingerprint(payload)
+        payload[FACET_STATS_FIELD] = facet_stats_to_payload(facet_stats, payload["vector_fingerprint"])
+    return profile_vector
 
-        # Extract product information from the search results
-        recommended_products = [
-            {
-                "product_id": result.payload.get('product_id'),
-                "product_name": result.payload.get('name'),
-                "product_category": result.payload.get('category'),
-                "brand": result.payload.get('additional_info')['brand'],
-                "price": result.payload.get('additional_info')['price'],
-                "journey_maps": result.payload.get('journey_maps'),
-                "score": result.score
-            }
-            for result in search_results
-        ]
-
-        return {"profile": profile.payload, "recommended_products": recommended_products}
+# Add the embeddings of new keywords to the facet stats, new_keywords is [(facet name, keyword)]
+def add_keywords_to_facet_stats(facet_stats, new_keywords, embeddings):
+    for (name, keyword), embedding in zip(new_keywords, embeddings):
+        facet = facet_stats[name]
+        facet["sum"] = embedding.astype(np.float32) if facet["sum"] is None else facet["sum"] + embedding
+        facet["count"] += 1
+
+# Merge keyword updates of the same profile, updates have a profile_id and one keyword list per facet field
+def merge_profile_keyword_updates(updates):
+    merged = {}
+    for update in updates:
+        keywords = merged.setdefault(update.profile_id, {field: [] for field in PROFILE_FACETS.values()})
+        for field in PROFILE_FACETS.values():
+            keywords[field] += getattr(update, field)
+    return merged
+
+# Append keywords to stored profiles and update their vectors.
+# Profiles with valid facet stats embed only the new keywords, in one batch for all profiles,
+# the others are rebuilt from all their keywords once and get facet stats for the next updates.
+# keywords_by_profile is {profile_id: {payload keyword field: new keywords}}, see merge_profile_keyword_updates().
+# Returns {profile_id: (vector, payload)} of the updated profiles, unknown profiles are left out.
+# The profiles stay locked from the read to the upsert, see profile_locks(), so concurrent updates are not lost.
+def append_profile_keywords(keywords_by_profile):
+    with profile_locks(keywords_by_profile):
+        return _append_profile_keywords(keywords_by_profile)
+
+def _append_profile_keywords(keywords_by_profile):
+    client = get_qdrant_client()
+    points = client.retrieve(collection_name=PROFILE_COLLECTION, with_payload=True,
+                             ids=list({string_to_point_id(profile_id) for profile_id in keywords_by_profile}))
+
+    incremental, rebuilt = [], []
+    new_keywords = []
+    for point in points:
+        payload = point.payload
+        if not payload or payload.get("profile_id") not in keywords_by_profile:
+            continue
+        facet_stats = facet_stats_from_payload(payload)
+        keywords = keywords_by_profile[payload["profile_id"]]
+        for name, field in PROFILE_FACETS.items():
+            payload[field] = (payload.get(field) or []) + keywords.get(field, [])
+        if facet_stats is None:
+            rebuilt.append(payload)
+            continue
+        profile_keywords = [(name, k) for name, field in PROFILE_FACETS.items() for k in keywords.get(field, [])]
+        incremental.append((payload, facet_stats, profile_keywords))
+        new_keywords += [k for _, k in profile_keywords]
+
+    results = {}
+    embeddings = get_text_embeddings(new_keywords) if len(new_keywords) > 0 else []
+    offset = 0
+    for payload, facet_stats, profile_keywords in incremental:
+        add_keywords_to_facet_stats(facet_stats, profile_keywords, embeddings[offset:offset + len(profile_keywords)])
+        offset += len(profile_keywords)
+        profile_vector = combine_profile_facet_stats(facet_stats)
+        if profile_vector is not None:
+            payload["vector_fingerprint"] = compute_vector_fingerprint("profile", payload)
+            payload["payload_fingerprint"] = compute_payload_fingerprint(payload)
+            payload[FACET_STATS_FIELD] = facet_stats_to_payload(facet_stats, payload["vector_fingerprint"])
+            results[payload["profile_id"]] = (profile_vector, payload)
+    for payload in rebuilt:
+        profile_vector = rebuild_profile_vector_with_stats(payload)
+        if profile_vector is not None:
+            results[payload["profile_id"]] = (profile_vector, payload)
+
+    if len(results) > 0:
+        client.upsert(collection_name=PROFILE_COLLECTION, points=[
+            PointStruct(id=string_to_point_id(profile_id), vector=vector_to_list(vector), payload=payload)
+            for profile_id, (vector, payload) in results.items()
+        ])
+    print(f"Appended keywords to {len(results)} profiles: {len(incremental)} incremental, {len(rebuilt)} rebuilt")
+    return {profile_id: (vector, without_facet_stats(payload)) for profile_id, (vector, payload) in results.items()}
+
+# Rebuild the vector of a stored profile from all its keywords, on demand.
+# Returns (vector, payload), or (None, None) if the profile is not found or has no valid vector.
+def rebuild_stored_profile_vector(profile_id):
+    return rebuild_stored_profile_vectors([profile_id], only_stale=False).get(profile_id, (None, None))
+
+# Rebuild the vectors and facet stats of stored profiles from all their keywords, with one retrieve and one upsert.
+# The profiles are locked and read again with their facet stats, so nothing another update wrote is lost,
+# and with only_stale the vectors made fresh in between are kept as they are.
+# Returns {profile_id: (vector, payload)}, profiles not found or without a valid vector are left out.
+def rebuild_stored_profile_vectors(profile_ids, only_stale=True):
+    with profile_locks(profile_ids):
+        client = get_qdrant_client()
+        points = client.retrieve(collection_name=PROFILE_COLLECTION, with_payload=True, with_vectors=only_stale,
+                                 ids=list({string_to_point_id(profile_id) for profile_id in profile_ids}))
+        profiles, rebuilt = {}, {}
+        for point in points:
+            if not point.payload:
+                continue
+            payload = point.payload
+            profile_vector = get_stored_profile_vector(point) if only_stale else None
+            if profile_vector is None:
+                profile_vector = rebuild_profile_vector_with_stats(payload)
+                if profile_vector is None:
+                    continue
+                rebuilt[payload["profile_id"]] = (profile_vector, payload)
+            profiles[payload["profile_id"]] = (profile_vector, without_facet_stats(payload))
+
+        if len(rebuilt) > 0:
+            client.upsert(collection_name=PROFILE_COLLECTION, points=[
+                PointStruct(id=string_to_point_id(profile_id), vector=vector_to_list(vector), payload=payload)
+                for profile_id, (vector, payload) in rebuilt.items()
+            ])
+        return profiles
+
+def without_facet_stats(payload):
+    return {k: v for k, v in payload.items() if k != FACET_STATS_FIELD}
+
+# Recommend products based on profile vector.
+# Pass profile_vector and profile_payload when the caller has just built them, to skip the lookup.
+def recommend_products_for_profile(profile_id, top_n=8, except_product_ids=[], in_journey_maps=[],
+                                   profile_vector=None, profile_payload=None, product_vector_weights=None):
+    try:
+        if profile_vector is None:
+            profile_vector, profile_payload = load_profile_vector(profile_id)
+            if profile_vector is None:
+                return []
+
+        # Use profile vector to search for closest products, in memory or in the product collection
+        catalog_index = get_ready_catalog_index()
+        if catalog_index is not None:
+            weights = normalize_product_vector_weights(product_vector_weights)
+            scored_products = catalog_index.search(profile_vector, top_n, except_product_ids, in_journey_maps, weights)
+        else:
+            query_filter = build_product_filter(except_product_ids, in_journey_maps)
+            scored_products = search_products_by_vector(profile_vector, top_n, query_filter, product_vector_weights)
+        recommended_products = to_recommended_products(scored_products)
+
+        return {"profile": profile_payload, "recommended_products": recommended_products}
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return []
 
+# Build the product filter of a recommendation request
+def build_product_filter(except_product_ids=[], in_journey_maps=[]):
+    must_filter = []
+    if len(in_journey_maps) > 0:
+        must_filter.append(FieldCondition(key="journey_maps", match=MatchAny(any=in_journey_maps)))
+    if len(except_product_ids) > 0:
+        must_filter.append(FieldCondition(key="product_id", match=MatchExcept(**{"except": except_product_ids})))
+    return Filter(must=must_filter)
+
+# Merge request weights with the defaults, drop zero weights and make them sum to 1
+def normalize_product_vector_weights(weights=None):
+    weights = {**DEFAULT_PRODUCT_VECTOR_WEIGHTS, **(weights or {})}
+    unknown_names = set(weights) - set(PRODUCT_VECTOR_NAMES)
+    if unknown_names:
+        raise ValueError(f"Unknown product vector names: {sorted(unknown_names)}, expected {PRODUCT_VECTOR_NAMES}")
+    weights = {name: float(w) for name, w in weights.items() if w and w > 0}
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("At least one product vector weight must be positive")
+    return {name: w / total for name, w in weights.items()}
+
+# One query that fuses the named vectors in Qdrant: each named vector prefetches top_n * PRODUCT_PREFETCH_FACTOR
+# candidates, each branch scores the union of them with one named vector, and the formula adds the weighted scores.
+# Every candidate is scored with every vector, so the result is the weighted cosine over all named vectors,
+# and only the top_n payloads are returned, without vectors.
+def build_product_query_request(profile_vector, top_n, query_filter, weights):
+    query_vector = profile_vector.tolist()
+    # rescore with the original vectors when the collection is quantized
+    search_params = SearchParams(quantization=get_quantization_search_params(PRODUCT_COLLECTION))
+    candidates = [Prefetch(query=query_vector, using=name, filter=query_filter, params=search_params,
+                           limit=top_n * PRODUCT_PREFETCH_FACTOR)
+                  for name in weights]
+    branches = [Prefetch(prefetch=candidates, query=query_vector, using=name, params=search_params,
+                         limit=top_n * PRODUCT_PREFETCH_FACTOR * len(weights))
+                for name in weights]
+    formula = FormulaQuery(formula=SumExpression(sum=[MultExpression(mult=[weight, f"$score[{i}]"])
+                                                      for i, weight in enumerate(weights.values())]))
+    return QueryRequest(prefetch=branches, query=formula, limit=top_n, with_payload=True, with_vector=False)
+
+# (score, payload) of the products of a fused query response
+def scored_products_from_response(response):
+    return [(point.score, point.payload) for point in response.points]
+
+# Search products for a profile vector, with the weighted fusion of the named vectors done by Qdrant
+def search_products_by_vector(profile_vector, top_n, query_filter, product_vector_weights=None):
+    weights = normalize_product_vector_weights(product_vector_weights)
+    request = build_product_query_request(profile_vector, top_n, query_filter, weights)
+    responses = get_qdrant_client().query_batch_points(collection_name=PRODUCT_COLLECTION, requests=[request])
+    return scored_products_from_response(responses[0])
+
+# The in-memory catalog index when it can serve searches, None to search Qdrant
+def get_ready_catalog_index():
+    if product_catalog_index is None:
+        return None
+    product_catalog_index.refresh_if_stale(get_qdrant_client())
+    return product_catalog_index if product_catalog_index.is_ready() else None
+
+# Keep the in-memory catalog index in sync with products saved by this process, a list of (id, vectors, payload)
+def index_saved_products(products):
+    if product_catalog_index is not None and len(products) > 0:
+        product_catalog_index.upsert_products(products)
+
+def index_saved_payloads(products):
+    if product_catalog_index is not None and len(products) > 0:
+        product_catalog_index.update_payloads(products)
+
+def load_product_catalog_index():
+    if product_catalog_index is not None:
+        product_catalog_index.load_from_qdrant(get_qdrant_client())
+
+def get_product_catalog_index_stats():
+    if product_catalog_index is None:
+        return {"enabled": False}
+    return product_catalog_index.get_stats()
+
+# Extract product information from the scored products
+def to_recommended_products(scored_products):
+    return [
+        {
+            "product_id": payload.get('product_id'),
+            "product_name": payload.get('name'),
+            "product_category": payload.get('category'),
+            "brand": (payload.get('additional_info') or {}).get('brand'),
+            "price": (payload.get('additional_info') or {}).get('price'),
+            "journey_maps": payload.get('journey_maps'),
+            "score": score
+        }
+        for score, payload in scored_products
+    ]
+
 
 def init_db_personalization():
-    if qdrant_client == False:
-        raise Exception("qdrant_client is NULL")
     ### Create collections if not exist ###
-    create_qdrant_collection_if_not_exists(
-        PROFILE_COLLECTION, PROFILE_VECTOR_SIZE)
-    create_qdrant_collection_if_not_exists(
-        PRODUCT_COLLECTION, PRODUCT_VECTOR_SIZE)
-    create_qdrant_collection_if_not_exists(
-        CONTENT_COLLECTION, CONTENT_VECTOR_SIZE)
+    for collection_name, vector_size in get_collection_vector_sizes().items():
+        create_qdrant_collection_if_not_exists(collection_name, vector_size, COLLECTION_VECTOR_NAMES.get(collection_name))
+        reconcile_payload_indexes(get_qdrant_client(), collection_name, COLLECTION_PAYLOAD_INDEXES[collection_name])
+
+    # products stored as one concatenated vector must be migrated to named vectors
+    product_vectors = get_qdrant_client().get_collection(PRODUCT_COLLECTION).config.params.vectors
+    if not isinstance(product_vectors, dict):
+        print(f"Warning: '{PRODUCT_COLLECTION}' still uses a single concatenated vector, "
+              "run: python -m rs_domain.migrate_product_vectors --swap")
+
+# Load the embedding model and run a first inference on a few keywords
+def warmup_embedding_model():
+    embedding_provider.load()
+    embedding_provider.encode(WARMUP_TEXTS, use_cache=False)
+
+# Check that Qdrant answers, raise an exception if not
+def check_qdrant_connection():
+    get_qdrant_client().get_collections()
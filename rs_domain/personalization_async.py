@@ -0,0 +1,230 @@
+import asyncio
+from qdrant_client.http.models import PointStruct
+from rs_model.personalization_models import ProfileRequest
+from rs_domain.qdrant_factory import get_async_qdrant_client, close_async_qdrant_client
+from rs_domain.personalization import ITEM_KINDS, PROFILE_COLLECTION, PRODUCT_COLLECTION
+from rs_domain.personalization import build_item_payload, get_stored_profile_vector, rebuild_stored_profile_vectors
+from rs_domain.personalization import string_to_point_id, vector_to_list, add_items_to_qdrant
+from rs_domain.personalization import build_product_filter, normalize_product_vector_weights, build_product_query_request
+from rs_domain.personalization import scored_products_from_response, to_recommended_products, RECOMMEND_BATCH_SIZE
+from rs_domain.personalization import get_ready_catalog_index, index_saved_products, PROFILE_PAYLOAD_SELECTOR
+from rs_domain.personalization import append_profile_keywords, rebuild_stored_profile_vector, save_profile_to_qdrant
+from rs_domain.personalization import INGESTION_SKIP_UNCHANGED, FINGERPRINT_PAYLOAD_SELECTOR, compare_item_fingerprints
+from rs_domain.personalization import ingestion_stats, index_saved_payloads, vector_from_list
+
+# Async data access for the personalization API: Qdrant calls are awaited on the event loop
+# and the embedding model runs in worker threads, so a slow request never blocks the others.
+
+# Build the vector of a profile, product or content without blocking the event loop
+async def abuild_item_vector(kind: str, item):
+    return await asyncio.to_thread(ITEM_KINDS[kind]["build_vector"], item)
+
+async def aadd_vector_to_qdrant(collection_name: str, object_id, vector, payload):
+    point = PointStruct(id=string_to_point_id(str(object_id)), vector=vector_to_list(vector), payload=payload)
+    await get_async_qdrant_client().upsert(collection_name=collection_name, points=[point])
+    if collection_name == PRODUCT_COLLECTION:
+        index_saved_products([(object_id, vector, payload)])
+
+# Same as reuse_unchanged_item(), with the Qdrant calls awaited
+async def areuse_unchanged_item(kind: str, object_id, payload):
+    if not INGESTION_SKIP_UNCHANGED:
+        return None
+    collection_name = ITEM_KINDS[kind]["collection"]
+    point_id = string_to_point_id(str(object_id))
+    points = await get_async_qdrant_client().retrieve(collection_name=collection_name, ids=[point_id],
+                                                      with_payload=FINGERPRINT_PAYLOAD_SELECTOR, with_vectors=True)
+    if len(points) == 0 or not points[0].vector:
+        return None
+    change = compare_item_fingerprints(points[0].payload, payload)
+    if change == "changed":
+        return None
+    if change == "payload":
+        await get_async_qdrant_client().set_payload(collection_name=collection_name, payload=payload, points=[point_id])
+        if kind == "product":
+            index_saved_payloads([(object_id, payload)])
+        ingestion_stats["payload_updated"] += 1
+    else:
+        ingestion_stats["unchanged"] += 1
+    return vector_from_list(points[0].vector)
+
+# Save one item and return its id, vector and payload, or (None, None, None) if no vector could be built.
+# An item sent again with the same vector fields is not embedded, its stored vector is returned.
+# Profiles are saved in a worker thread, under their profile lock.
+async def asave_item_to_qdrant(kind: str, item):
+    if kind == "profile":
+        return await asyncio.to_thread(save_profile_to_qdrant, item)
+    object_id = getattr(item, ITEM_KINDS[kind]["id_field"])
+    payload = build_item_payload(kind, item)
+    vector = await areuse_unchanged_item(kind, object_id, payload)
+    if vector is not None:
+        print(f"{kind.capitalize()} {object_id} has the same vector fields, not embedded again")
+        return object_id, vector, payload
+
+    vector = await abuild_item_vector(kind, item)
+    if vector is None:
+        print(f"Error: Could not generate a valid vector for {kind} {object_id}.")
+        return None, None, None
+
+    ingestion_stats["embedded"] += 1
+    await aadd_vector_to_qdrant(ITEM_KINDS[kind]["collection"], object_id, vector, payload)
+    print(f"{kind.capitalize()} {object_id} added to Qdrant")
+    return object_id, vector, payload
+
+async def asave_profile_to_qdrant(p: ProfileRequest):
+    return await asave_item_to_qdrant("profile", p)
+
+# Add one profile, product or content and return its id, or None
+async def aadd_item_to_qdrant(kind: str, item):
+    object_id, vector, payload = await asave_item_to_qdrant(kind, item)
+    return object_id
+
+# Add many items: embedding and the chunked batch writer run in a worker thread
+async def aadd_items_to_qdrant(kind: str, items):
+    return await asyncio.to_thread(add_items_to_qdrant, kind, items)
+
+# Same as load_profile_vector(), with the Qdrant calls awaited
+async def aload_profile_vector(profile_id):
+    profile_data = await get_async_qdrant_client().retrieve(
+        collection_name=PROFILE_COLLECTION,
+        ids=[string_to_point_id(profile_id)],
+        with_payload=PROFILE_PAYLOAD_SELECTOR,
+        with_vectors=True
+    )
+    if not profile_data or len(profile_data) == 0:
+        print(f"Profile {profile_id} not found in Qdrant.")
+        return None, None
+
+    profile = profile_data[0]
+    if not profile.payload:
+        print(f"Profile {profile_id} does not have a payload in Qdrant.")
+        return None, None
+
+    payload = profile.payload
+    profile_vector = get_stored_profile_vector(profile)
+    if profile_vector is not None:
+        return profile_vector, payload
+
+    print(f"Profile {profile_id} has a stale vector, rebuilding it.")
+    profiles = await asyncio.to_thread(rebuild_stored_profile_vectors, [profile_id])
+    return profiles.get(profile_id, (None, None))
+
+# Load many profiles with one retrieve, stale vectors are rebuilt and stored again with one upsert.
+# Returns {profile_id: (vector, payload)} of the profiles found.
+async def aload_profile_vectors(profile_ids):
+    points = await get_async_qdrant_client().retrieve(
+        collection_name=PROFILE_COLLECTION,
+        ids=list({string_to_point_id(profile_id) for profile_id in profile_ids}),
+        with_payload=PROFILE_PAYLOAD_SELECTOR,
+        with_vectors=True
+    )
+    profiles = {}
+    stale_ids = []
+    for point in points:
+        if not point.payload:
+            continue
+        profile_vector = get_stored_profile_vector(point)
+        if profile_vector is None:
+            stale_ids.append(point.payload["profile_id"])
+        else:
+            profiles[point.payload["profile_id"]] = (profile_vector, point.payload)
+
+    if len(stale_ids) > 0:
+        print(f"Rebuilding {len(stale_ids)} stale profile vectors.")
+        profiles.update(await asyncio.to_thread(rebuild_stored_profile_vectors, stale_ids))
+    return profiles
+
+# Append keywords to stored profiles, the embedding and the Qdrant calls run in a worker thread
+async def aappend_profile_keywords(keywords_by_profile):
+    return await asyncio.to_thread(append_profile_keywords, keywords_by_profile)
+
+async def arebuild_stored_profile_vector(profile_id):
+    return await asyncio.to_thread(rebuild_stored_profile_vector, profile_id)
+
+async def asearch_products_by_vector(profile_vector, top_n, query_filter, product_vector_weights=None):
+    weights = normalize_product_vector_weights(product_vector_weights)
+    request = build_product_query_request(profile_vector, top_n, query_filter, weights)
+    responses = await get_async_qdrant_client().query_batch_points(collection_name=PRODUCT_COLLECTION, requests=[request])
+    return scored_products_from_response(responses[0])
+
+# Same as recommend_products_for_profile(), with the Qdrant calls awaited
+async def arecommend_products_for_profile(profile_id, top_n=8, except_product_ids=[], in_journey_maps=[],
+                                          profile_vector=None, profile_payload=None, product_vector_weights=None):
+    try:
+        if profile_vector is None:
+            profile_vector, profile_payload = await aload_profile_vector(profile_id)
+            if profile_vector is None:
+                return []
+
+        catalog_index = get_ready_catalog_index()
+        if catalog_index is not None:
+            # the matrix product runs in a worker thread, numpy releases the GIL
+            weights = normalize_product_vector_weights(product_vector_weights)
+            scored_products = await asyncio.to_thread(catalog_index.search, profile_vector, top_n,
+                                                      except_product_ids, in_journey_maps, weights)
+        else:
+            query_filter = build_product_filter(except_product_ids, in_journey_maps)
+            scored_products = await asearch_products_by_vector(profile_vector, top_n, query_filter, product_vector_weights)
+        recommended_products = to_recommended_products(scored_products)
+
+        return {"profile": profile_payload, "recommended_products": recommended_products}
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return []
+
+# Recommend products for a chunk of profiles with one retrieve and one query_batch_points call
+async def _arecommend_products_for_chunk(queries, top_n, weights):
+    profiles = await aload_profile_vectors([q.profile_id for q in queries])
+
+    catalog_index = get_ready_catalog_index()
+    if catalog_index is not None:
+        return await asyncio.to_thread(_recommend_products_in_catalog_index, catalog_index, queries, profiles, top_n, weights)
+
+    requests = []
+    for q in queries:
+        if q.profile_id in profiles:
+            query_filter = build_product_filter(q.except_product_ids, q.journey_maps)
+            requests.append(build_product_query_request(profiles[q.profile_id][0], top_n, query_filter, weights))
+    responses = []
+    if len(requests) > 0:
+        responses = await get_async_qdrant_client().query_batch_points(collection_name=PRODUCT_COLLECTION, requests=requests)
+
+    # one response per found profile, in the order of the queries
+    results = []
+    offset = 0
+    for q in queries:
+        if q.profile_id not in profiles:
+            results.append({"profile_id": q.profile_id, "error": "Profile not found"})
+            continue
+        scored_products = scored_products_from_response(responses[offset])
+        offset += 1
+        results.append({"profile_id": q.profile_id, "recommended_products": to_recommended_products(scored_products)})
+    return results
+
+# Score the found profiles of a chunk against the in-memory catalog with one matrix product per named vector
+def _recommend_products_in_catalog_index(catalog_index, queries, profiles, top_n, weights):
+    found = [q for q in queries if q.profile_id in profiles]
+    scored = []
+    if len(found) > 0:
+        scored = catalog_index.search_batch([profiles[q.profile_id][0] for q in found],
+                                            [(q.except_product_ids, q.journey_maps) for q in found], top_n, weights)
+    scored_by_id = {id(q): products for q, products in zip(found, scored)}
+    return [
+        {"profile_id": q.profile_id, "recommended_products": to_recommended_products(scored_by_id[id(q)])}
+        if q.profile_id in profiles else {"profile_id": q.profile_id, "error": "Profile not found"}
+        for q in queries
+    ]
+
+# Recommend products for many profiles, yielding one result per query in input order.
+# Each query has a profile_id, except_product_ids and journey_maps.
+async def arecommend_products_for_profiles(queries, top_n=8, product_vector_weights=None):
+    weights = normalize_product_vector_weights(product_vector_weights)
+    for start in range(0, len(queries), RECOMMEND_BATCH_SIZE):
+        chunk = queries[start:start + RECOMMEND_BATCH_SIZE]
+        try:
+            results = await _arecommend_products_for_chunk(chunk, top_n, weights)
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            results = [{"profile_id": q.profile_id, "error": str(e)} for q in chunk]
+        for result in results:
+            yield result
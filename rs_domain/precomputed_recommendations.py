@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import argparse
+import redis
+from rs_domain.qdrant_factory import get_qdrant_client
+from rs_domain.recommendation_cache import catalog_version_key, decode_catalog_version, get_catalog_version
+from rs_domain.product_catalog_index import ProductCatalogIndex
+from rs_domain.personalization import PROFILE_COLLECTION, PRODUCT_COLLECTION, PRODUCT_VECTOR_NAMES
+from rs_domain.personalization import get_stored_profile_vector, rebuild_stored_profile_vectors
+from rs_domain.personalization import normalize_product_vector_weights, build_product_filter, build_product_query_request
+from rs_domain.personalization import scored_products_from_response, to_recommended_products, PROFILE_PAYLOAD_SELECTOR
+
+# Precomputed recommendations: a batch job (airflow-dag/cdp_profile_analytics.py) scores every profile
+# and stores its top products in Redis, the API serves them before computing anything in real time.
+PRECOMPUTED_RECOMMENDATIONS_ENABLED = os.getenv('PRECOMPUTED_RECOMMENDATIONS_ENABLED', 'true') == 'true'
+PRECOMPUTED_TOP_N = int(os.getenv('PRECOMPUTED_TOP_N', 32))  # stored per profile, enough to drop excluded products
+PRECOMPUTED_TTL = int(os.getenv('PRECOMPUTED_TTL', 129600))  # seconds, longer than the time between two runs
+PRECOMPUTE_BATCH_SIZE = int(os.getenv('PRECOMPUTE_BATCH_SIZE', 512))  # profiles scored per matrix product
+PRECOMPUTE_CATALOG_MAX_SIZE = int(os.getenv('PRECOMPUTE_CATALOG_MAX_SIZE', 200000))  # above it, score with Qdrant
+
+PRECOMPUTED_KEY_PREFIX = "rs:precomputed"
+PRECOMPUTED_LAST_RUN_KEY = PRECOMPUTED_KEY_PREFIX + ":last_run"
+
+
+def precomputed_key(profile_id):
+    return f"{PRECOMPUTED_KEY_PREFIX}:{profile_id}"
+
+
+# Products of a precomputed entry that answer the request, or None when it must be computed in real time.
+# Entries scored against another catalog version are never served: products were added, changed or removed since.
+def select_precomputed_products(entry, top_n, except_product_ids=[], in_journey_maps=[], product_vector_weights=None,
+                                catalog_version="0"):
+    if entry.get("catalog_version") != catalog_version:
+        return None
+    if normalize_product_vector_weights(product_vector_weights) != normalize_product_vector_weights(entry.get("weights")):
+        return None
+    if top_n > entry["top_n"]:
+        return None
+
+    stored_products = entry["recommended_products"]
+    except_ids = set(except_product_ids or [])
+    journeys = set(in_journey_maps or [])
+    # the stored list is ranked over the whole catalog, so its filtered prefix is the filtered ranking
+    products = [p for p in stored_products
+                if p["product_id"] not in except_ids and (not journeys or journeys & set(p.get("journey_maps") or []))]
+    # a list shorter than its top_n holds every product of the catalog
+    catalog_exhausted = len(stored_products) < entry["top_n"]
+    if len(products) < top_n and not catalog_exhausted:
+        return None
+    return products[:top_n]
+
+
+# Read the precomputed recommendations of a profile, from the async Redis client of the API
+async def aload_precomputed_recommendations(redis_client, profile_id, top_n, except_product_ids=[], in_journey_maps=[],
+                                            product_vector_weights=None):
+    try:
+        cached, catalog_version = await redis_client.mget(precomputed_key(profile_id), catalog_version_key())
+    except Exception as e:
+        print(f"Precomputed recommendations error: {e}")
+        return None
+    if cached is None:
+        return None
+    entry = json.loads(cached)
+    products = select_precomputed_products(entry, top_n, except_product_ids, in_journey_maps, product_vector_weights,
+                                           decode_catalog_version(catalog_version))
+    if products is None:
+        return None
+    return {"profile": entry["profile"], "recommended_products": products}
+
+
+# Drop the precomputed recommendations of profiles that changed, they are computed in real time until the next run
+async def adelete_precomputed_recommendations(redis_client, profile_ids):
+    try:
+        await redis_client.delete(*[precomputed_key(profile_id) for profile_id in profile_ids])
+    except Exception as e:
+        print(f"Precomputed recommendations error: {e}")
+
+
+# Load the product catalog in memory for the batch job, None when it is larger than PRECOMPUTE_CATALOG_MAX_SIZE
+def load_precompute_catalog_index():
+    catalog_index = ProductCatalogIndex(PRODUCT_COLLECTION, PRODUCT_VECTOR_NAMES, max_size=PRECOMPUTE_CATALOG_MAX_SIZE)
+    catalog_index.load_from_qdrant(get_qdrant_client())
+    return catalog_index if catalog_index.is_ready() else None
+
+
+# Score a batch of profile vectors, with one matrix product per named vector or one Qdrant batch call
+def score_profile_batch(profile_vectors, top_n, weights, catalog_index=None):
+    if catalog_index is not None:
+        return catalog_index.search_batch(profile_vectors, [([], [])] * len(profile_vectors), top_n, weights)
+
+    query_filter = build_product_filter()
+    requests = [build_product_query_request(profile_vector, top_n, query_filter, weights) for profile_vector in profile_vectors]
+    responses = get_qdrant_client().query_batch_points(collection_name=PRODUCT_COLLECTION, requests=requests)
+    return [scored_products_from_response(response) for response in responses]
+
+
+# Scroll every profile, score it against the catalog and store its top products in Redis.
+# Stale profile vectors are rebuilt and stored again, so the API does not rebuild them at peak time.
+# Entries keep the catalog version read before the catalog was loaded, pass it when catalog_index was loaded
+# before this call: a product change during the run makes them unused, as it makes the catalog index stale.
+def precompute_recommendations(redis_client, top_n=PRECOMPUTED_TOP_N, batch_size=PRECOMPUTE_BATCH_SIZE,
+                               ttl=PRECOMPUTED_TTL, catalog_index=None, product_vector_weights=None, catalog_version=None):
+    catalog_version = catalog_version if catalog_version is not None else get_catalog_version(redis_client)
+    started_at = time.perf_counter()
+    weights = normalize_product_vector_weights(product_vector_weights)
+    client = get_qdrant_client()
+    stats = {"profiles": 0, "stored": 0, "rebuilt": 0, "skipped": 0,
+             "scoring": "memory" if catalog_index is not None else "qdrant"}
+
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=PROFILE_COLLECTION, limit=batch_size, offset=offset,
+                                       with_payload=PROFILE_PAYLOAD_SELECTOR, with_vectors=True)
+        profiles = []
+        stale_ids = []
+        for point in points:
+            if not point.payload:
+                stats["skipped"] += 1
+                continue
+            profile_vector = get_stored_profile_vector(point)
+            if profile_vector is None:
+                stale_ids.append(point.payload["profile_id"])
+            else:
+                profiles.append((profile_vector, point.payload))
+        if len(stale_ids) > 0:
+            # rebuilt under their profile locks, from the full payload with its facet stats
+            rebuilt = rebuild_stored_profile_vectors(stale_ids)
+            profiles += list(rebuilt.values())
+            stats["rebuilt"] += len(rebuilt)
+            stats["skipped"] += len(stale_ids) - len(rebuilt)
+
+        if len(profiles) > 0:
+            scored = score_profile_batch([vector for vector, _ in profiles], top_n, weights, catalog_index)
+            computed_at = int(time.time())
+            pipeline = redis_client.pipeline(transaction=False)
+            for (_, payload), scored_products in zip(profiles, scored):
+                entry = {"profile": payload, "top_n": top_n, "weights": product_vector_weights or {},
+                         "computed_at": computed_at, "catalog_version": catalog_version,
+                         "recommended_products": to_recommended_products(scored_products)}
+                pipeline.set(precomputed_key(payload["profile_id"]), json.dumps(entry, ensure_ascii=False), ex=ttl)
+            pipeline.execute()
+            stats["stored"] += len(profiles)
+
+        stats["profiles"] += len(points)
+        print(f"Precomputed recommendations of {stats['stored']} / {stats['profiles']} profiles")
+        if offset is None:
+            break
+
+    stats["seconds"] = round(time.perf_counter() - started_at, 3)
+    stats["profiles_per_second"] = round(stats["stored"] / stats["seconds"], 1) if stats["seconds"] > 0 else 0.0
+    return stats
+
+
+# Record the stats of the last run, read back by get_last_precompute_run()
+def save_precompute_run(redis_client, stats):
+    redis_client.set(PRECOMPUTED_LAST_RUN_KEY, json.dumps({**stats, "finished_at": int(time.time())}))
+
+async def aget_last_precompute_run(redis_client):
+    try:
+        last_run = await redis_client.get(PRECOMPUTED_LAST_RUN_KEY)
+    except Exception as e:
+        print(f"Precomputed recommendations error: {e}")
+        return None
+    return json.loads(last_run) if last_run else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the top products of every profile into Redis")
+    parser.add_argument("--top-n", type=int, default=PRECOMPUTED_TOP_N, help="products stored per profile")
+    parser.add_argument("--batch-size", type=int, default=PRECOMPUTE_BATCH_SIZE, help="profiles per scroll and scoring batch")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)), db=0)
+    catalog_version = get_catalog_version(redis_client)
+    stats = precompute_recommendations(redis_client, args.top_n, args.batch_size, catalog_index=load_precompute_catalog_index(),
+                                       catalog_version=catalog_version)
+    save_precompute_run(redis_client, stats)
+    print(f"Done: {stats}")
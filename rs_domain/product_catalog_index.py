@@ -0,0 +1,287 @@
+import os
+import time
+import threading
+import numpy as np
+
+# In-memory product catalog index configuration from environment variables
+PRODUCT_CATALOG_INDEX_ENABLED = os.getenv('PRODUCT_CATALOG_INDEX_ENABLED', 'false') == 'true'
+PRODUCT_CATALOG_INDEX_MAX_SIZE = int(os.getenv('PRODUCT_CATALOG_INDEX_MAX_SIZE', 20000))  # above it, search Qdrant
+PRODUCT_CATALOG_INDEX_REFRESH_SECONDS = float(os.getenv('PRODUCT_CATALOG_INDEX_REFRESH_SECONDS', 300))  # reload from Qdrant
+
+SCROLL_PAGE_SIZE = 1000
+INITIAL_CAPACITY = 1024
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class ProductCatalogIndex:
+    """Exact product search in memory, for catalogs small enough that a round trip to Qdrant costs more
+    than scoring every product.
+
+    Each named product vector is a contiguous float32 matrix of normalized rows, so the weighted cosine
+    similarity of a batch of profiles is one matrix product per name. Journey map and exclusion filters are
+    boolean masks over the rows. The index is loaded from Qdrant, updated when products are ingested by this
+    process and reloaded every PRODUCT_CATALOG_INDEX_REFRESH_SECONDS for the products ingested by others.
+    Above max_size products the index is emptied and is_ready() is False, callers then search Qdrant.
+    """
+
+    def __init__(self, collection_name, vector_names, max_size=PRODUCT_CATALOG_INDEX_MAX_SIZE,
+                 refresh_seconds=PRODUCT_CATALOG_INDEX_REFRESH_SECONDS):
+        self.collection_name = collection_name
+        self.vector_names = list(vector_names)
+        self.max_size = max_size
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.loaded_at = None
+        self.too_large = False
+        self.searches = 0
+        self.replay = None  # products written during a load, written again after it
+        self._reset()
+
+    def _reset(self, dimension=0, capacity=0):
+        self.size = 0  # rows written, live or replaced
+        self.matrices = {name: np.zeros((capacity, dimension), dtype=np.float32) for name in self.vector_names}
+        self.live = np.zeros(capacity, dtype=bool)  # False for the rows of replaced products
+        self.product_ids = []
+        self.payloads = []
+        self.rows = {}  # product_id -> row
+        self.journey_rows = {}  # journey map -> rows of its products
+
+    def _grow(self, dimension):
+        capacity = len(self.matrices[self.vector_names[0]])
+        if self.size < capacity and self.matrices[self.vector_names[0]].shape[1] == dimension:
+            return
+        new_capacity = max(INITIAL_CAPACITY, 2 * capacity)
+        for name in self.vector_names:
+            matrix = np.zeros((new_capacity, dimension), dtype=np.float32)
+            matrix[:self.size] = self.matrices[name][:self.size]
+            self.matrices[name] = matrix
+        live = np.zeros(new_capacity, dtype=bool)
+        live[:self.size] = self.live[:self.size]
+        self.live = live
+
+    # Replace the arrays with the given rows, the ones a search already took are left as they are
+    def _install(self, product_ids, payloads, matrices):
+        dimension = matrices[self.vector_names[0]].shape[1] if product_ids else 0
+        self._reset(dimension, max(INITIAL_CAPACITY, len(product_ids)))
+        for name, matrix in matrices.items():
+            self.matrices[name][:len(product_ids)] = matrix
+        self.live[:len(product_ids)] = True
+        for row, (product_id, payload) in enumerate(zip(product_ids, payloads)):
+            self.rows[product_id] = row
+            for journey in payload.get("journey_maps") or []:
+                self.journey_rows.setdefault(journey, set()).add(row)
+        self.product_ids = list(product_ids)
+        self.payloads = list(payloads)
+        self.size = len(product_ids)
+
+    # Rows are written once: a changed product gets a new row and its old row is marked replaced, so a search
+    # that took the arrays before never reads a half written row. Rows past `size` are not read by searches.
+    def _upsert_row(self, product_id, vectors, payload):
+        previous = self.rows.get(product_id)
+        if previous is not None:
+            self.live[previous] = False
+            for rows in self.journey_rows.values():
+                rows.discard(previous)
+        self._grow(len(vectors[self.vector_names[0]]))
+        row = self.size
+        for name in self.vector_names:
+            self.matrices[name][row] = vectors[name]
+        self.live[row] = True
+        self.product_ids.append(product_id)
+        self.payloads.append(payload)
+        self.size += 1
+        self.rows[product_id] = row
+        for journey in payload.get("journey_maps") or []:
+            self.journey_rows.setdefault(journey, set()).add(row)
+
+    # Drop the replaced rows once they are more than the live ones, into new arrays
+    def _compact_if_sparse(self):
+        if self.size - len(self.rows) <= max(INITIAL_CAPACITY, len(self.rows)):
+            return
+        rows = np.flatnonzero(self.live[:self.size])
+        self._install([self.product_ids[row] for row in rows], [self.payloads[row] for row in rows],
+                      {name: matrix[rows] for name, matrix in self.matrices.items()})
+
+    def _apply_products(self, products):
+        for product_id, vectors, payload in products:
+            self._upsert_row(product_id, vectors, payload)
+        if len(self.rows) > self.max_size:
+            print(f"Product catalog index disabled: '{self.collection_name}' has more than {self.max_size} products")
+            self.too_large = True
+            self._reset()
+        else:
+            self._compact_if_sparse()
+
+    def _apply_payloads(self, products):
+        for product_id, payload in products:
+            row = self.rows.get(product_id)
+            if row is not None:
+                self.payloads[row] = payload
+
+    def upsert_products(self, products):
+        """Adds or replaces products, a list of (product_id, {name: vector}, payload)."""
+        normalized = []
+        for product_id, vectors, payload in products:
+            vectors = {name: np.asarray(vectors[name], dtype=np.float32) for name in self.vector_names}
+            vectors = {name: v / max(np.linalg.norm(v), 1e-12) for name, v in vectors.items()}
+            normalized.append((product_id, vectors, payload))
+        with self.lock:
+            if self.replay is not None:
+                self.replay.append((self._apply_products, normalized))
+            if self.too_large or self.loaded_at is None:
+                return
+            self._apply_products(normalized)
+
+    def update_payloads(self, products):
+        """Replaces the payloads of indexed products, a list of (product_id, payload) whose vectors did not change."""
+        with self.lock:
+            if self.replay is not None:
+                self.replay.append((self._apply_payloads, products))
+            self._apply_payloads(products)
+
+    def load_from_qdrant(self, client):
+        """Loads every product of the collection, or disables the index when the catalog is too large.
+
+        The products written while the collection is scrolled are kept and written again after the load,
+        the scroll may have read them before they changed.
+        """
+        started_at = time.perf_counter()
+        if not isinstance(client.get_collection(self.collection_name).config.params.vectors, dict):
+            print(f"Product catalog index not loaded: '{self.collection_name}' has no named vectors")
+            return
+        with self.lock:
+            self.replay = []
+        try:
+            self._load_from_qdrant(client, started_at)
+        finally:
+            with self.lock:
+                self.replay = None
+
+    def _load_from_qdrant(self, client, started_at):
+        count = client.count(self.collection_name, exact=True).count
+        if count > self.max_size:
+            with self.lock:
+                self.too_large = True
+                self.loaded_at = time.monotonic()
+                self._reset()
+            print(f"Product catalog index disabled: '{self.collection_name}' has {count} products, "
+                  f"more than {self.max_size}")
+            return
+
+        product_ids, payloads = [], []
+        vectors = {name: [] for name in self.vector_names}
+        offset = None
+        while True:
+            points, offset = client.scroll(collection_name=self.collection_name, limit=SCROLL_PAGE_SIZE, offset=offset,
+                                           with_payload=True, with_vectors=self.vector_names)
+            for point in points:
+                if not point.payload:
+                    continue
+                product_ids.append(point.payload.get("product_id"))
+                payloads.append(point.payload)
+                for name in self.vector_names:
+                    vectors[name].append(point.vector[name])
+            if offset is None:
+                break
+
+        # Qdrant returns cosine vectors normalized, they are normalized again in case of a different distance
+        matrices = {}
+        if product_ids:
+            matrices = {name: _normalize_rows(np.array(rows, dtype=np.float32)) for name, rows in vectors.items()}
+        with self.lock:
+            self.too_large = len(product_ids) > self.max_size
+            if self.too_large:
+                self._reset()
+            else:
+                self._install(product_ids, payloads, matrices)
+                for apply, products in self.replay:
+                    if not self.too_large:
+                        apply(products)
+            self.loaded_at = time.monotonic()
+        print(f"Product catalog index loaded {len(self.rows)} products from '{self.collection_name}' "
+              f"in {time.perf_counter() - started_at:.3f}s")
+
+    def refresh_if_stale(self, client):
+        """Reloads the index from Qdrant in a background thread when it is older than refresh_seconds."""
+        with self.lock:
+            if self.refreshing or self.loaded_at is None or time.monotonic() - self.loaded_at < self.refresh_seconds:
+                return
+            self.refreshing = True
+
+        def refresh():
+            try:
+                self.load_from_qdrant(client)
+            except Exception as e:
+                print(f"Product catalog index refresh failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing = False
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def is_ready(self):
+        return self.loaded_at is not None and not self.too_large
+
+    def _snapshot(self, queries):
+        # rows are never written again once below `size` and the arrays are replaced, not changed, when they
+        # grow or are compacted, so a view of the first `size` rows stays consistent after the lock is released
+        with self.lock:
+            size = self.size
+            matrices = {name: matrix[:size] for name, matrix in self.matrices.items()}
+            payloads = self.payloads
+            masks = []
+            for except_product_ids, journey_maps in queries:
+                mask = self.live[:size].copy()
+                if journey_maps:
+                    in_journeys = np.zeros(size, dtype=bool)
+                    for journey in journey_maps:
+                        in_journeys[[row for row in self.journey_rows.get(journey, ()) if row < size]] = True
+                    mask &= in_journeys
+                mask[[self.rows[i] for i in except_product_ids or [] if self.rows.get(i, size) < size]] = False
+                masks.append(mask)
+            self.searches += len(queries)
+        return size, matrices, payloads, masks
+
+    def search_batch(self, profile_vectors, queries, top_n, weights):
+        """Exact top_n products of each profile vector, queries is a list of (except_product_ids, journey_maps)
+        and weights the normalized weight of each named vector. Returns one [(score, payload)] per profile."""
+        size, matrices, payloads, masks = self._snapshot(queries)
+        if size == 0:
+            return [[] for _ in queries]
+
+        query_matrix = _normalize_rows(np.asarray(profile_vectors, dtype=np.float32))
+        scores = np.zeros((len(query_matrix), size), dtype=np.float32)
+        for name, weight in weights.items():
+            scores += weight * (query_matrix @ matrices[name].T)
+
+        results = []
+        for row_scores, mask in zip(scores, masks):
+            candidates = np.flatnonzero(mask)
+            k = min(top_n, len(candidates))
+            if k == 0:
+                results.append([])
+                continue
+            candidate_scores = row_scores[candidates]
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+            top = top[np.argsort(-candidate_scores[top])]
+            results.append([(float(candidate_scores[i]), payloads[candidates[i]]) for i in top])
+        return results
+
+    def search(self, profile_vector, top_n, except_product_ids, journey_maps, weights):
+        return self.search_batch([profile_vector], [(except_product_ids, journey_maps)], top_n, weights)[0]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "enabled": True,
+                "ready": self.is_ready(),
+                "products": len(self.rows),
+                "max_size": self.max_size,
+                "too_large": self.too_large,
+                "searches": self.searches,
+                "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            }
@@ -0,0 +1,142 @@
+import os
+import time
+import uuid
+import zlib
+import threading
+from contextlib import contextmanager
+import redis
+from rs_domain.recommendation_cache import RELEASE_LOCK_SCRIPT
+
+# Profile lock configuration from environment variables
+REDIS_HOST = os.getenv('REDIS_HOST', "localhost")  # empty: profiles are locked in this process only
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+PROFILE_LOCK_TTL_MS = int(os.getenv('PROFILE_LOCK_TTL_MS', 10000))  # a crashed holder frees its profiles after this
+PROFILE_LOCK_WAIT_MS = int(os.getenv('PROFILE_LOCK_WAIT_MS', 5000))  # then ProfileLockTimeout is raised
+
+PROFILE_LOCK_PREFIX = "rs:profile-lock"
+LOCK_POLL_SECONDS = 0.02
+
+# Extend the locks that still hold the token of the caller
+EXTEND_LOCKS_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        redis.call('pexpire', key, ARGV[2])
+    end
+end
+return 0
+"""
+
+# Without Redis, the profiles of this process are serialized with striped locks
+_local_locks = [threading.Lock() for _ in range(256)]
+
+_redis_client = None
+
+
+class ProfileLockTimeout(Exception):
+    """Raised when a profile stayed locked by another update for PROFILE_LOCK_WAIT_MS."""
+
+
+def get_profile_lock_redis():
+    global _redis_client
+    if _redis_client is None and REDIS_HOST != "" and REDIS_PORT > 0:
+        _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+    return _redis_client
+
+
+def profile_lock_key(profile_id):
+    return f"{PROFILE_LOCK_PREFIX}:{profile_id}"
+
+
+def _release_redis_locks(redis_client, keys, token):
+    if len(keys) == 0:
+        return
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+        pipeline.execute()
+    except Exception as e:
+        print(f"Profile lock error: {e}")
+
+
+# Take the locks of the sorted keys, one pipeline per attempt. The locks before the first busy key are kept
+# and the ones after it released, so two callers never hold locks the other waits for.
+def _acquire_redis_locks(redis_client, keys, token, ttl_ms, wait_ms):
+    deadline = time.monotonic() + wait_ms / 1000.0
+    acquired = 0
+    try:
+        while acquired < len(keys):
+            pipeline = redis_client.pipeline(transaction=False)
+            for key in keys[acquired:]:
+                pipeline.set(key, token, nx=True, px=ttl_ms)
+            results = pipeline.execute()
+            held = next((i for i, ok in enumerate(results) if not ok), len(results))
+            _release_redis_locks(redis_client, [key for key, ok in zip(keys[acquired + held:], results[held:]) if ok], token)
+            acquired += held
+            if acquired < len(keys):
+                if time.monotonic() > deadline:
+                    raise ProfileLockTimeout(f"Profile lock {keys[acquired]} is held by another update for more than {wait_ms} ms")
+                time.sleep(LOCK_POLL_SECONDS)
+    except BaseException:
+        _release_redis_locks(redis_client, keys[:acquired], token)
+        raise
+
+
+# Extend the locks every third of their TTL until stopped, a long batch keeps its profiles
+def _extend_redis_locks(redis_client, keys, token, ttl_ms, stopped):
+    while not stopped.wait(ttl_ms / 3000.0):
+        try:
+            redis_client.eval(EXTEND_LOCKS_SCRIPT, len(keys), *keys, token, ttl_ms)
+        except Exception as e:
+            print(f"Profile lock error: {e}")
+
+
+@contextmanager
+def _local_profile_locks(profile_ids, wait_ms):
+    stripes = sorted({zlib.crc32(str(profile_id).encode('utf-8')) % len(_local_locks) for profile_id in profile_ids})
+    acquired = []
+    try:
+        for stripe in stripes:
+            if not _local_locks[stripe].acquire(timeout=wait_ms / 1000.0):
+                raise ProfileLockTimeout(f"Profiles are locked by another update for more than {wait_ms} ms")
+            acquired.append(stripe)
+        yield
+    finally:
+        for stripe in acquired:
+            _local_locks[stripe].release()
+
+
+@contextmanager
+def profile_locks(profile_ids, redis_client=None, ttl_ms=PROFILE_LOCK_TTL_MS, wait_ms=PROFILE_LOCK_WAIT_MS):
+    """Holds a lock on each profile while it is read, changed and written back, or replaced.
+
+    Every write of a stored profile takes these locks, so an update never writes back a payload read before
+    another update. With Redis the lock is a key per profile set with NX and a TTL, shared by every API
+    process and worker, extended while it is held and released only by its holder. Without Redis, or when
+    it cannot be reached, the profiles are locked in this process only.
+    """
+    redis_client = redis_client if redis_client is not None else get_profile_lock_redis()
+    keys = sorted({profile_lock_key(profile_id) for profile_id in profile_ids})
+    token = uuid.uuid4().hex
+    locked = False
+    if redis_client is not None and len(keys) > 0:
+        try:
+            _acquire_redis_locks(redis_client, keys, token, ttl_ms, wait_ms)
+            locked = True
+        except redis.ConnectionError as e:
+            print(f"Profile lock error, locking in this process only: {e}")
+
+    if not locked:
+        with _local_profile_locks(profile_ids, wait_ms):
+            yield
+        return
+
+    stopped = threading.Event()
+    extender = threading.Thread(target=_extend_redis_locks, args=(redis_client, keys, token, ttl_ms, stopped), daemon=True)
+    extender.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        extender.join()
+        _release_redis_locks(redis_client, keys, token)
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from qdrant_client.http.models import PointStruct
+
+# Batch writer configuration from environment variables
+QDRANT_BATCH_SIZE = int(os.getenv('QDRANT_BATCH_SIZE', 256))  # points per upsert request
+QDRANT_BATCH_MAX_IN_FLIGHT = int(os.getenv('QDRANT_BATCH_MAX_IN_FLIGHT', 4))  # concurrent upsert requests
+QDRANT_BATCH_WAIT = os.getenv('QDRANT_BATCH_WAIT', 'false') == 'true'  # wait until each chunk is applied
+QDRANT_BATCH_RETRIES = int(os.getenv('QDRANT_BATCH_RETRIES', 3))  # retries of a failed chunk
+
+
+class QdrantBatchWriter:
+    """Accumulates points into chunks and upserts them to one collection with several chunks in flight.
+
+    With wait=False Qdrant acknowledges a chunk once it is written to its WAL, without waiting
+    for indexing, which is durable enough for the bulk ingestion paths. Failed chunks are retried
+    with exponential backoff, the ids of points still failing are reported in get_stats().
+    Callers that read the points back right after close(), or invalidate caches, pass wait=True.
+
+    A point added twice replaces the pending one, the last one wins. A chunk that shares point ids
+    with a chunk still in flight is sent only after that chunk, so the order of the writes is kept.
+
+    Usage:
+        with QdrantBatchWriter(client, "cdp_product") as writer:
+            writer.add(point_id, vector, payload, item_id)
+        print(writer.get_stats())
+    """
+
+    def __init__(self, client, collection_name: str, chunk_size=QDRANT_BATCH_SIZE, max_in_flight=QDRANT_BATCH_MAX_IN_FLIGHT,
+                 wait=QDRANT_BATCH_WAIT, retries=QDRANT_BATCH_RETRIES, retry_backoff=0.5):
+        self.client = client
+        self.collection_name = collection_name
+        self.chunk_size = chunk_size
+        self.wait = wait
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.pending_points = []
+        self.pending_ids = []
+        self.pending_rows = {}  # point id -> index in pending_points
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"qdrant-writer-{collection_name}")
+        self.futures = []  # (future, point ids of its chunk)
+        self.stats_lock = threading.Lock()
+        self.points_written = 0
+        self.chunks_written = 0
+        self.chunks_failed = 0
+        self.retried = 0
+        self.failed_items = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, point_id, vector, payload, item_id=None):
+        """Queues one point, item_id is the business id reported if the point fails."""
+        self.add_point(PointStruct(id=point_id, vector=vector, payload=payload), item_id)
+
+    def add_point(self, point: PointStruct, item_id=None):
+        item_id = item_id if item_id is not None else point.id
+        row = self.pending_rows.get(point.id)
+        if row is not None:
+            self.pending_points[row] = point
+            self.pending_ids[row] = item_id
+            return
+        self.pending_rows[point.id] = len(self.pending_points)
+        self.pending_points.append(point)
+        self.pending_ids.append(item_id)
+        if len(self.pending_points) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Sends the pending points as one chunk, blocking only while max_in_flight chunks are running."""
+        if len(self.pending_points) == 0:
+            return
+        points, ids = self.pending_points, self.pending_ids
+        point_ids = set(self.pending_rows)
+        self.pending_points, self.pending_ids, self.pending_rows = [], [], {}
+        # chunks already written are forgotten, _write_chunk records their failures
+        self.futures = [(future, chunk_point_ids) for future, chunk_point_ids in self.futures if not future.done()]
+        # a point written again waits for its previous write, otherwise either one could be applied last
+        for future, chunk_point_ids in self.futures:
+            if not future.done() and not point_ids.isdisjoint(chunk_point_ids):
+                future.result()
+        self.in_flight.acquire()
+        self.futures.append((self.executor.submit(self._write_chunk, points, ids), point_ids))
+
+    def _write_chunk(self, points, ids):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self.client.upsert(collection_name=self.collection_name, points=points, wait=self.wait)
+                    with self.stats_lock:
+                        self.points_written += len(points)
+                        self.chunks_written += 1
+                    return
+                except Exception as e:
+                    if attempt == self.retries:
+                        print(f"Error: Could not upsert {len(points)} points to '{self.collection_name}': {e}")
+                        with self.stats_lock:
+                            self.chunks_failed += 1
+                            self.failed_items.extend({"id": item_id, "error": str(e)} for item_id in ids)
+                        return
+                    with self.stats_lock:
+                        self.retried += 1
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        finally:
+            self.in_flight.release()
+
+    def close(self):
+        """Flushes the last chunk and waits for every chunk in flight."""
+        self.flush()
+        for future, _ in self.futures:
+            future.result()
+        self.futures = []
+        self.executor.shutdown(wait=True)
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    def get_failed_items(self):
+        with self.stats_lock:
+            return list(self.failed_items)
+
+    def get_stats(self):
+        """Returns points and chunks written, failures, retries and throughput."""
+        with self.stats_lock:
+            seconds = (self.finished_at or time.perf_counter()) - self.started_at
+            return {
+                "collection": self.collection_name,
+                "points_written": self.points_written,
+                "points_failed": len(self.failed_items),
+                "chunks_written": self.chunks_written,
+                "chunks_failed": self.chunks_failed,
+                "retries": self.retried,
+                "seconds": round(seconds, 3),
+                "points_per_second": round(self.points_written / seconds, 1) if seconds > 0 else 0.0,
+            }
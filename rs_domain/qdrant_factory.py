@@ -0,0 +1,113 @@
+import os
+import json
+import threading
+import httpx
+from qdrant_client import QdrantClient, AsyncQdrantClient
+
+# Fetch the host and port from environment variables
+QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')  # default is 'localhost'
+QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))  # default is 6333
+
+# Fetch the host and port from environment variables
+QDRANT_CLOUD_HOST = os.getenv('QDRANT_CLOUD_HOST', '')  # default is empty
+QDRANT_CLOUD_API_KEY = os.getenv('QDRANT_CLOUD_API_KEY', '')  # default is empty
+
+# Transport: gRPC sends vectors as packed floats instead of JSON text, much cheaper for large vectors
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', 'false') == 'true'
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', 6334))
+QDRANT_TIMEOUT = int(os.getenv('QDRANT_TIMEOUT', 10))  # seconds per request
+
+# Connection pool and retries of the REST transport, keep-alive of the gRPC channel
+QDRANT_POOL_MAX_CONNECTIONS = int(os.getenv('QDRANT_POOL_MAX_CONNECTIONS', 32))
+QDRANT_POOL_MAX_KEEPALIVE = int(os.getenv('QDRANT_POOL_MAX_KEEPALIVE', 16))  # idle connections kept open
+QDRANT_POOL_KEEPALIVE_EXPIRY = float(os.getenv('QDRANT_POOL_KEEPALIVE_EXPIRY', 30))  # seconds an idle connection is kept
+QDRANT_RETRIES = int(os.getenv('QDRANT_RETRIES', 3))  # retries of requests that could not connect
+QDRANT_GRPC_KEEPALIVE_MS = int(os.getenv('QDRANT_GRPC_KEEPALIVE_MS', 30000))  # ping interval of idle gRPC channels
+
+
+# Connection settings, from the cloud configuration if set, else the local one
+def get_qdrant_settings(prefer_grpc=QDRANT_PREFER_GRPC):
+    settings = {"prefer_grpc": prefer_grpc, "grpc_port": QDRANT_GRPC_PORT, "timeout": QDRANT_TIMEOUT}
+    if QDRANT_CLOUD_HOST != "" and QDRANT_CLOUD_API_KEY != "":
+        settings.update(host=QDRANT_CLOUD_HOST, api_key=QDRANT_CLOUD_API_KEY)
+    else:
+        settings.update(host=QDRANT_HOST, port=QDRANT_PORT)
+    return settings
+
+def get_http_limits():
+    return httpx.Limits(max_connections=QDRANT_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=QDRANT_POOL_MAX_KEEPALIVE,
+                        keepalive_expiry=QDRANT_POOL_KEEPALIVE_EXPIRY)
+
+# gRPC channel options: keep idle channels alive and retry calls when the server is unavailable
+def get_grpc_options():
+    service_config = {"methodConfig": [{
+        "name": [{}],
+        "retryPolicy": {
+            "maxAttempts": QDRANT_RETRIES + 1,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "2s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"],
+        },
+    }]}
+    return {
+        "grpc.keepalive_time_ms": QDRANT_GRPC_KEEPALIVE_MS,
+        "grpc.keepalive_permit_without_calls": 1,
+        "grpc.enable_retries": 1,
+        "grpc.service_config": json.dumps(service_config),
+    }
+
+# Create a new QdrantClient, pass keyword arguments to override the configured settings
+def create_qdrant_client(**overrides):
+    limits = get_http_limits()
+    settings = get_qdrant_settings()
+    settings.update(limits=limits, transport=httpx.HTTPTransport(retries=QDRANT_RETRIES, limits=limits),
+                    grpc_options=get_grpc_options())
+    settings.update(overrides)
+    return QdrantClient(**settings)
+
+# Create a new AsyncQdrantClient, pass keyword arguments to override the configured settings
+def create_async_qdrant_client(**overrides):
+    limits = get_http_limits()
+    settings = get_qdrant_settings()
+    settings.update(limits=limits, transport=httpx.AsyncHTTPTransport(retries=QDRANT_RETRIES, limits=limits),
+                    grpc_options=get_grpc_options())
+    settings.update(overrides)
+    return AsyncQdrantClient(**settings)
+
+def describe_qdrant_settings():
+    settings = get_qdrant_settings()
+    location = 'QDRANT CLOUD DB ' if "api_key" in settings else 'LOCAL QDRANT DB '
+    transport = f"gRPC :{QDRANT_GRPC_PORT}" if QDRANT_PREFER_GRPC else f"REST :{settings.get('port', 6333)}"
+    return location + settings["host"] + " over " + transport
+
+
+# The clients shared by every subsystem of the process, created on first use
+qdrant_client = None
+async_qdrant_client = None
+qdrant_client_lock = threading.Lock()
+
+# Function to get the shared QdrantClient
+def get_qdrant_client():
+    global qdrant_client
+    with qdrant_client_lock:
+        if qdrant_client is None:
+            qdrant_client = create_qdrant_client()
+            print('USING ' + describe_qdrant_settings())
+        return qdrant_client
+
+# Function to get the shared AsyncQdrantClient
+def get_async_qdrant_client():
+    global async_qdrant_client
+    with qdrant_client_lock:
+        if async_qdrant_client is None:
+            async_qdrant_client = create_async_qdrant_client()
+        return async_qdrant_client
+
+# Close the shared async client, called when the API shuts down
+async def close_async_qdrant_client():
+    global async_qdrant_client
+    if async_qdrant_client is not None:
+        await async_qdrant_client.close()
+        async_qdrant_client = None
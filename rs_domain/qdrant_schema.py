@@ -0,0 +1,39 @@
+from qdrant_client.http.models import PayloadSchemaType
+
+# Payload indexes let Qdrant filter with an index lookup instead of scanning every payload.
+# Each module declares the indexes of its collections as {collection_name: {field_name: PayloadSchemaType}}
+# and calls reconcile_payload_indexes() at startup.
+
+KEYWORD = PayloadSchemaType.KEYWORD
+INTEGER = PayloadSchemaType.INTEGER
+
+
+def get_payload_schema(client, collection_name: str):
+    """Returns {field_name: PayloadSchemaType} of the payload indexes existing in the collection."""
+    payload_schema = client.get_collection(collection_name).payload_schema or {}
+    return {field_name: info.data_type for field_name, info in payload_schema.items()}
+
+
+def reconcile_payload_indexes(client, collection_name: str, index_schema: dict):
+    """Creates the missing payload indexes and recreates those of another type, the others are kept.
+
+    It is idempotent and safe to call at every startup. Indexes not in index_schema are left untouched.
+    Returns {field_name: 'created' | 'recreated' | 'unchanged'}.
+    """
+    existing = get_payload_schema(client, collection_name)
+    actions = {}
+    for field_name, field_schema in index_schema.items():
+        current = existing.get(field_name)
+        if current == field_schema:
+            actions[field_name] = "unchanged"
+            continue
+        if current is not None:
+            client.delete_payload_index(collection_name=collection_name, field_name=field_name, wait=True)
+        client.create_payload_index(collection_name=collection_name, field_name=field_name,
+                                    field_schema=field_schema, wait=True)
+        actions[field_name] = "created" if current is None else "recreated"
+
+    changed = {f: a for f, a in actions.items() if a != "unchanged"}
+    if changed:
+        print(f"Payload indexes of '{collection_name}': {changed}")
+    return actions
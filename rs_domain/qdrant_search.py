@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+from qdrant_client.http.models import SearchParams
+from rs_domain.qdrant_storage import get_quantization_search_params
+
+# Search profiles: exact scans every point, the others walk the HNSW graph with a larger or smaller beam (hnsw_ef).
+# "auto" scans small collections exactly, where a scan is as fast as the graph and always exact,
+# and uses the HNSW graph with QDRANT_SEARCH_HNSW_EF above QDRANT_EXACT_SEARCH_THRESHOLD points.
+SEARCH_PROFILES = {
+    "exact": {"exact": True, "hnsw_ef": None},
+    "fast": {"exact": False, "hnsw_ef": 64},
+    "balanced": {"exact": False, "hnsw_ef": 128},
+    "accurate": {"exact": False, "hnsw_ef": 256},
+}
+
+QDRANT_SEARCH_PROFILE = os.getenv('QDRANT_SEARCH_PROFILE', 'auto')  # default profile of every search
+QDRANT_EXACT_SEARCH_THRESHOLD = int(os.getenv('QDRANT_EXACT_SEARCH_THRESHOLD', 10000))  # points
+QDRANT_SEARCH_HNSW_EF = int(os.getenv('QDRANT_SEARCH_HNSW_EF', 128))  # beam of "auto" on large collections
+QDRANT_COLLECTION_SIZE_TTL = float(os.getenv('QDRANT_COLLECTION_SIZE_TTL', 60))  # seconds a collection size is cached
+
+# collection name -> (point count, time it was counted)
+collection_sizes = {}
+collection_sizes_lock = threading.Lock()
+
+
+def _cached_collection_size(collection_name: str):
+    with collection_sizes_lock:
+        cached = collection_sizes.get(collection_name)
+    if cached is not None and time.monotonic() - cached[1] < QDRANT_COLLECTION_SIZE_TTL:
+        return cached[0]
+    return None
+
+
+def _store_collection_size(collection_name: str, size: int):
+    with collection_sizes_lock:
+        collection_sizes[collection_name] = (size, time.monotonic())
+    return size
+
+
+def get_collection_size(client, collection_name: str):
+    """Approximate point count of the collection, cached for QDRANT_COLLECTION_SIZE_TTL seconds."""
+    size = _cached_collection_size(collection_name)
+    if size is None:
+        size = _store_collection_size(collection_name, client.count(collection_name, exact=False).count)
+    return size
+
+
+async def aget_collection_size(async_client, collection_name: str):
+    size = _cached_collection_size(collection_name)
+    if size is None:
+        size = _store_collection_size(collection_name, (await async_client.count(collection_name, exact=False)).count)
+    return size
+
+
+def resolve_search_profile(profile: str, collection_size: int):
+    """Returns the name of the profile to use, "auto" is resolved from the collection size."""
+    if profile == "auto":
+        return "exact" if collection_size <= QDRANT_EXACT_SEARCH_THRESHOLD else None
+    if profile not in SEARCH_PROFILES:
+        raise ValueError(f"Unknown search profile '{profile}', expected auto or one of {sorted(SEARCH_PROFILES)}")
+    return profile
+
+
+def build_search_params(collection_name: str, profile: str, collection_size: int = 0):
+    name = resolve_search_profile(profile, collection_size)
+    if name is None:
+        settings = {"exact": False, "hnsw_ef": QDRANT_SEARCH_HNSW_EF}
+    else:
+        settings = SEARCH_PROFILES[name]
+    # an exact scan compares the original vectors, rescoring only applies to the HNSW search
+    quantization = None if settings["exact"] else get_quantization_search_params(collection_name)
+    return SearchParams(exact=settings["exact"], hnsw_ef=settings["hnsw_ef"], quantization=quantization)
+
+
+def get_search_params(client, collection_name: str, profile: str = QDRANT_SEARCH_PROFILE):
+    """SearchParams of one search call, profile is "auto" or a name of SEARCH_PROFILES."""
+    collection_size = get_collection_size(client, collection_name) if profile == "auto" else 0
+    return build_search_params(collection_name, profile, collection_size)
+
+
+async def aget_search_params(async_client, collection_name: str, profile: str = QDRANT_SEARCH_PROFILE):
+    collection_size = await aget_collection_size(async_client, collection_name) if profile == "auto" else 0
+    return build_search_params(collection_name, profile, collection_size)
@@ -0,0 +1,94 @@
+import os
+import json
+from qdrant_client.http.models import (
+    VectorParams, Distance, HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, QuantizationSearchParams
+)
+
+# Storage profiles: how the vectors of a collection are kept in memory and on disk.
+#   quantization: "none", "scalar" (int8, 4x smaller) or "binary" (1 bit per dimension, 32x smaller)
+#   on_disk: keep the original float32 vectors on disk (memmap), only the quantized ones stay in RAM
+#   rescore / oversampling: search the quantized vectors for limit * oversampling candidates,
+#                           then rescore them with the original vectors
+#   hnsw_m / hnsw_ef_construct: HNSW graph links per node and build-time beam, None keeps the Qdrant default
+STORAGE_PROFILES = {
+    "default": {"quantization": "none", "on_disk": False, "rescore": False, "oversampling": None,
+                "hnsw_m": None, "hnsw_ef_construct": None},
+    "scalar": {"quantization": "scalar", "on_disk": True, "rescore": True, "oversampling": 2.0,
+               "hnsw_m": None, "hnsw_ef_construct": None},
+    "binary": {"quantization": "binary", "on_disk": True, "rescore": True, "oversampling": 3.0,
+               "hnsw_m": None, "hnsw_ef_construct": None},
+}
+
+# Profile of each collection, as JSON: a profile name, or a profile name with overrides, e.g.
+# {"cdp_profile": "scalar", "om_user_conversations": {"profile": "binary", "hnsw_m": 32}}
+QDRANT_STORAGE_PROFILES = os.getenv('QDRANT_STORAGE_PROFILES', '{}')
+QDRANT_DEFAULT_STORAGE_PROFILE = os.getenv('QDRANT_DEFAULT_STORAGE_PROFILE', 'default')  # for collections not listed
+
+collection_storage_profiles = json.loads(QDRANT_STORAGE_PROFILES or '{}')
+
+
+def resolve_storage_profile(config):
+    """Returns the full profile dict of a profile name or of {"profile": name, **overrides}."""
+    if isinstance(config, str):
+        config = {"profile": config}
+    name = config.get("profile", QDRANT_DEFAULT_STORAGE_PROFILE)
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{name}', expected one of {sorted(STORAGE_PROFILES)}")
+    profile = {**STORAGE_PROFILES[name], **{k: v for k, v in config.items() if k != "profile"}}
+    unknown_keys = set(profile) - set(STORAGE_PROFILES["default"])
+    if unknown_keys:
+        raise ValueError(f"Unknown storage profile settings: {sorted(unknown_keys)}")
+    return profile
+
+
+def get_storage_profile(collection_name: str):
+    return resolve_storage_profile(collection_storage_profiles.get(collection_name, QDRANT_DEFAULT_STORAGE_PROFILE))
+
+
+def build_vectors_config(vector_size: int, profile, vector_names=None):
+    """VectorParams of the collection, one per name when vector_names is given."""
+    def vector_params():
+        return VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=profile["on_disk"] or None)
+    if vector_names:
+        return {name: vector_params() for name in vector_names}
+    return vector_params()
+
+
+def build_quantization_config(profile):
+    if profile["quantization"] == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if profile["quantization"] == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    if profile["quantization"] != "none":
+        raise ValueError(f"Unknown quantization '{profile['quantization']}', expected none, scalar or binary")
+    return None
+
+
+def build_hnsw_config(profile):
+    if profile["hnsw_m"] is None and profile["hnsw_ef_construct"] is None:
+        return None
+    return HnswConfigDiff(m=profile["hnsw_m"], ef_construct=profile["hnsw_ef_construct"])
+
+
+def build_collection_config(collection_name: str, vector_size: int, vector_names=None, profile=None):
+    """Keyword arguments of create_collection() for the storage profile of the collection."""
+    profile = profile or get_storage_profile(collection_name)
+    return {
+        "vectors_config": build_vectors_config(vector_size, profile, vector_names),
+        "quantization_config": build_quantization_config(profile),
+        "hnsw_config": build_hnsw_config(profile),
+    }
+
+
+def get_quantization_search_params(collection_name: str, profile=None):
+    """QuantizationSearchParams to pass in SearchParams(quantization=...), None when not quantized."""
+    profile = profile or get_storage_profile(collection_name)
+    if profile["quantization"] == "none":
+        return None
+    return QuantizationSearchParams(rescore=profile["rescore"], oversampling=profile["oversampling"])
+
+
+def describe_storage_profile(collection_name: str):
+    profile = get_storage_profile(collection_name)
+    return ", ".join(f"{k}={v}" for k, v in profile.items() if v is not None)
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import random
+import asyncio
+import uuid
+import hashlib
+import threading
+
+# Recommendation cache configuration from environment variables
+RECOMMENDATION_CACHE_ENABLED = os.getenv('RECOMMENDATION_CACHE_ENABLED', 'true') == 'true'
+RECOMMENDATION_CACHE_TTL = int(os.getenv('RECOMMENDATION_CACHE_TTL', 300))  # seconds a result is served
+RECOMMENDATION_CACHE_LOCK_TTL_MS = int(os.getenv('RECOMMENDATION_CACHE_LOCK_TTL_MS', 5000))  # max time to recompute a key
+RECOMMENDATION_CACHE_LOCK_WAIT_MS = int(os.getenv('RECOMMENDATION_CACHE_LOCK_WAIT_MS', 2000))  # max wait for another recompute
+
+CACHE_KEY_PREFIX = "rs:rec"
+LOCK_POLL_SECONDS = 0.05
+
+# Delete the lock only if it still holds the token of the caller, it may have expired and been taken by another
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# Catalog version key, set to a new value whenever products are added or updated
+def catalog_version_key(prefix=CACHE_KEY_PREFIX):
+    return f"{prefix}:cv"
+
+def decode_catalog_version(value):
+    return value.decode() if value else "0"
+
+# Current catalog version, from a synchronous Redis client (batch jobs)
+def get_catalog_version(redis_client, prefix=CACHE_KEY_PREFIX):
+    return decode_catalog_version(redis_client.get(catalog_version_key(prefix)))
+
+
+class RecommendationCache:
+    """Caches recommendation results in Redis.
+
+    A cache key is made of the profile id, the profile version, the catalog version and a hash of the
+    request filters. Upserting a profile sets a new profile version and adding products sets a new catalog
+    version, so older entries are never read again and simply expire after their TTL.
+
+    When a key is missing, only one caller recomputes it (a short Redis lock), the others wait for its result
+    instead of all hitting Qdrant at once. Redis errors never fail a request: the result is computed directly.
+    """
+
+    def __init__(self, redis_client, ttl=RECOMMENDATION_CACHE_TTL, lock_ttl_ms=RECOMMENDATION_CACHE_LOCK_TTL_MS,
+                 lock_wait_ms=RECOMMENDATION_CACHE_LOCK_WAIT_MS, prefix=CACHE_KEY_PREFIX):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait = lock_wait_ms / 1000.0
+        self.prefix = prefix
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waited_hits = 0
+        self.errors = 0
+
+    def _count(self, name):
+        with self.stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _profile_version_key(self, profile_id):
+        return f"{self.prefix}:pv:{profile_id}"
+
+    def _catalog_version_key(self):
+        return catalog_version_key(self.prefix)
+
+    @staticmethod
+    def build_request_hash(top_n, except_product_ids, journey_maps, product_vector_weights):
+        request = {"top_n": top_n, "except": sorted(except_product_ids or []), "journeys": sorted(journey_maps or []),
+                   "weights": sorted((product_vector_weights or {}).items())}
+        return hashlib.sha1(json.dumps(request).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _new_version():
+        # a new unique value, never equal to a version seen before, even after a version key expired
+        return str(time.time_ns())
+
+    async def _build_key(self, profile_id, request_hash):
+        profile_version, catalog_version = await self.redis.mget(self._profile_version_key(profile_id), self._catalog_version_key())
+        profile_version = profile_version.decode() if profile_version else "0"
+        catalog_version = decode_catalog_version(catalog_version)
+        return f"{self.prefix}:{profile_id}:{profile_version}:{catalog_version}:{request_hash}"
+
+    async def _wait_for_result(self, key):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            cached = await self.redis.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        return None
+
+    async def get_or_compute(self, profile_id, top_n, except_product_ids, journey_maps, product_vector_weights, compute):
+        """Returns the cached result, or awaits compute() and caches its result if it is not empty."""
+        request_hash = self.build_request_hash(top_n, except_product_ids, journey_maps, product_vector_weights)
+        try:
+            key = await self._build_key(profile_id, request_hash)
+            cached = await self.redis.get(key)
+            if cached is not None:
+                self._count("hits")
+                return json.loads(cached)
+
+            self._count("misses")
+            lock_key = key + ":lock"
+            lock_token = uuid.uuid4().hex
+            if not await self.redis.set(lock_key, lock_token, nx=True, px=self.lock_ttl_ms):
+                # another request is computing this key, wait for its result, then compute it without the lock
+                lock_token = None
+                result = await self._wait_for_result(key)
+                if result is not None:
+                    self._count("waited_hits")
+                    return result
+        except Exception as e:
+            print(f"Recommendation cache error: {e}")
+            self._count("errors")
+            return await compute()
+
+        try:
+            result = await compute()
+        except Exception:
+            await self._release_lock(lock_key, lock_token)
+            raise
+
+        try:
+            if result:
+                # a little jitter, so keys written together do not all expire together
+                ttl = self.ttl + random.randint(0, max(1, self.ttl // 10))
+                await self.redis.set(key, json.dumps(result, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            print(f"Recommendation cache error: {e}")
+            self._count("errors")
+        await self._release_lock(lock_key, lock_token)
+        return result
+
+    async def _release_lock(self, lock_key, lock_token):
+        if lock_token is None:
+            return
+        try:
+            await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+        except Exception:
+            pass
+
+    async def invalidate_profiles(self, profile_ids):
+        """Sets a new version for each profile, called after the profiles are upserted."""
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for profile_id in profile_ids:
+                # the version outlives every entry written with the previous one
+                pipeline.set(self._profile_version_key(profile_id), self._new_version(), ex=2 * self.ttl + 60)
+            await pipeline.execute()
+        except Exception as e:
+            print(f"Recommendation cache error: {e}")
+            self._count("errors")
+
+    async def bump_catalog_version(self):
+        """Sets a new catalog version, called after products are added or updated."""
+        try:
+            await self.redis.set(self._catalog_version_key(), self._new_version())
+        except Exception as e:
+            print(f"Recommendation cache error: {e}")
+            self._count("errors")
+
+    def get_stats(self):
+        """Returns hit, miss and error counters of this process."""
+        with self.stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "waited_hits": self.waited_hits,
+                "errors": self.errors,
+                "hit_ratio": (self.hits + self.waited_hits) / lookups if lookups > 0 else 0.0,
+            }
+
+
+# Same invalidation as RecommendationCache, from a synchronous Redis client (write stream workers, batch jobs)
+def invalidate_recommendations_sync(redis_client, profile_ids=[], catalog_changed=False, ttl=RECOMMENDATION_CACHE_TTL,
+                                    prefix=CACHE_KEY_PREFIX):
+    cache = RecommendationCache(None, ttl=ttl, prefix=prefix)
+    pipeline = redis_client.pipeline(transaction=False)
+    for profile_id in profile_ids:
+        pipeline.set(cache._profile_version_key(profile_id), cache._new_version(), ex=2 * ttl + 60)
+    if catalog_changed:
+        pipeline.set(cache._catalog_version_key(), cache._new_version())
+    pipeline.execute()
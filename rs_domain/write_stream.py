@@ -0,0 +1,182 @@
+import os
+import time
+import socket
+import argparse
+import redis
+from rs_model.personalization_models import ProfileRequest, ProductRequest, ContentRequest
+from rs_domain.personalization import ITEM_KINDS, add_items_to_qdrant
+from rs_domain.recommendation_cache import invalidate_recommendations_sync
+from rs_domain.precomputed_recommendations import precomputed_key
+
+# Write stream configuration from environment variables
+WRITE_STREAM_ENABLED = os.getenv('WRITE_STREAM_ENABLED', 'false') == 'true'  # the API publishes writes instead of applying them
+WRITE_STREAM_NAME = os.getenv('WRITE_STREAM_NAME', 'rs:writes')
+WRITE_STREAM_GROUP = os.getenv('WRITE_STREAM_GROUP', 'rs-writers')
+WRITE_STREAM_MAXLEN = int(os.getenv('WRITE_STREAM_MAXLEN', 1000000))  # approximate cap of the stream length
+WRITE_STREAM_BATCH_SIZE = int(os.getenv('WRITE_STREAM_BATCH_SIZE', 256))  # messages read and upserted per batch
+WRITE_STREAM_BLOCK_MS = int(os.getenv('WRITE_STREAM_BLOCK_MS', 1000))  # wait for new messages
+WRITE_STREAM_CLAIM_IDLE_MS = int(os.getenv('WRITE_STREAM_CLAIM_IDLE_MS', 60000))  # retry messages of dead or failed workers
+WRITE_STREAM_MAX_DELIVERIES = int(os.getenv('WRITE_STREAM_MAX_DELIVERIES', 5))  # then the message goes to the dead letters
+
+WRITE_STREAM_DEAD_LETTERS = WRITE_STREAM_NAME + ":dead"
+WRITE_MODELS = {"profile": ProfileRequest, "product": ProductRequest, "content": ContentRequest}
+
+
+# Publish write requests of one kind, one stream message per item. Returns the message ids.
+async def apublish_writes(redis_client, kind: str, items):
+    pipeline = redis_client.pipeline(transaction=False)
+    for item in items:
+        pipeline.xadd(WRITE_STREAM_NAME, {"kind": kind, "item": item.model_dump_json()},
+                      maxlen=WRITE_STREAM_MAXLEN, approximate=True)
+    message_ids = await pipeline.execute()
+    return [m.decode() if isinstance(m, bytes) else m for m in message_ids]
+
+
+# Messages of the group pending for more than min_idle_time ms, claimed for the consumer.
+# XAUTOCLAIM replies [next id, messages, deleted ids] on Redis 7 and [next id, messages] on Redis 6.2.
+def autoclaim_messages(redis_client, stream, group, consumer, min_idle_time, count):
+    return redis_client.xautoclaim(stream, group, consumer, min_idle_time=min_idle_time, count=count)[1]
+
+
+# Length, consumer group lag and pending count, and dead letters of the write stream.
+# Lag is None when unknown: Redis 6.2 has no group lag, it is known there only when the group read every message.
+async def aget_write_stream_stats(redis_client):
+    stats = {"enabled": WRITE_STREAM_ENABLED, "stream": WRITE_STREAM_NAME, "group": WRITE_STREAM_GROUP}
+    try:
+        stats["length"] = await redis_client.xlen(WRITE_STREAM_NAME)
+        stats["dead_letters"] = await redis_client.xlen(WRITE_STREAM_DEAD_LETTERS)
+        groups = await redis_client.xinfo_groups(WRITE_STREAM_NAME)
+    except redis.ResponseError:
+        # the stream does not exist before the first message
+        return {**stats, "length": 0, "dead_letters": 0, "lag": 0, "pending": 0, "consumers": 0}
+    for group in groups:
+        name = group["name"].decode() if isinstance(group["name"], bytes) else group["name"]
+        if name == WRITE_STREAM_GROUP:
+            # lag: messages not yet delivered to the group, pending: delivered but not acknowledged
+            lag = group.get("lag")
+            if "lag" not in group:
+                last_id = (await redis_client.xinfo_stream(WRITE_STREAM_NAME))["last-generated-id"]
+                lag = 0 if group["last-delivered-id"] == last_id else None
+            stats.update({"lag": lag, "pending": group["pending"], "consumers": group["consumers"]})
+    return stats
+
+
+# Cached and precomputed recommendations are not served anymore for written profiles, or at all after products changed.
+# updated is {kind: [ids written]}.
+def invalidate_written_recommendations(redis_client, updated):
+    invalidate_recommendations_sync(redis_client, updated.get("profile", []), catalog_changed=len(updated.get("product", [])) > 0)
+    if len(updated.get("profile", [])) > 0:
+        redis_client.delete(*[precomputed_key(profile_id) for profile_id in updated["profile"]])
+
+
+class WriteStreamWorker:
+    """Applies the write requests of the stream with the other workers of the consumer group.
+
+    Each worker reads a batch of messages, embeds and upserts them with add_items_to_qdrant() and
+    acknowledges them. Delivery is at least once: a message is acknowledged only after its upsert, and
+    messages left pending by a failed or stopped worker are claimed by another one after
+    WRITE_STREAM_CLAIM_IDLE_MS. Point ids come from string_to_point_id(), so applying a message twice
+    writes the same point. After WRITE_STREAM_MAX_DELIVERIES deliveries, or when it cannot be parsed,
+    a message is moved to the dead-letter stream with its error.
+    """
+
+    def __init__(self, redis_client, consumer_name, batch_size=WRITE_STREAM_BATCH_SIZE, block_ms=WRITE_STREAM_BLOCK_MS,
+                 claim_idle_ms=WRITE_STREAM_CLAIM_IDLE_MS, max_deliveries=WRITE_STREAM_MAX_DELIVERIES):
+        self.redis = redis_client
+        self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.stats = {"applied": 0, "failed": 0, "dead_letters": 0, "batches": 0}
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(WRITE_STREAM_NAME, WRITE_STREAM_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read_batch(self):
+        # messages pending for too long first, their worker died or could not apply them
+        messages = autoclaim_messages(self.redis, WRITE_STREAM_NAME, WRITE_STREAM_GROUP, self.consumer_name,
+                                      self.claim_idle_ms, self.batch_size)
+        if len(messages) > 0:
+            return messages
+        response = self.redis.xreadgroup(WRITE_STREAM_GROUP, self.consumer_name, {WRITE_STREAM_NAME: ">"},
+                                         count=self.batch_size, block=self.block_ms)
+        return response[0][1] if response else []
+
+    def dead_letter(self, message_id, fields, error):
+        self.redis.xadd(WRITE_STREAM_DEAD_LETTERS, {**fields, "message_id": message_id, "error": error},
+                        maxlen=WRITE_STREAM_MAXLEN, approximate=True)
+        self.redis.xack(WRITE_STREAM_NAME, WRITE_STREAM_GROUP, message_id)
+        self.stats["dead_letters"] += 1
+
+    def delivery_count(self, message_id):
+        pending = self.redis.xpending_range(WRITE_STREAM_NAME, WRITE_STREAM_GROUP, min=message_id, max=message_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    def process_batch(self, messages):
+        items_by_kind = {kind: [] for kind in WRITE_MODELS}
+        for message_id, fields in messages:
+            message_id = message_id.decode() if isinstance(message_id, bytes) else message_id
+            fields = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+                      for k, v in fields.items()}
+            try:
+                item = WRITE_MODELS[fields["kind"]].model_validate_json(fields["item"])
+            except Exception as e:
+                self.dead_letter(message_id, fields, f"Invalid message: {e}")
+                continue
+            items_by_kind[fields["kind"]].append((message_id, fields, item))
+
+        updated = {kind: [] for kind in WRITE_MODELS}
+        failed = []
+        for kind, entries in items_by_kind.items():
+            if len(entries) == 0:
+                continue
+            id_field = ITEM_KINDS[kind]["id_field"]
+            try:
+                added_ids, failed_items, _ = add_items_to_qdrant(kind, [item for _, _, item in entries])
+                errors = {f["id"]: f["error"] for f in failed_items}
+            except Exception as e:
+                added_ids, errors = [], {getattr(item, id_field): str(e) for _, _, item in entries}
+            applied = [message_id for message_id, _, item in entries if getattr(item, id_field) not in errors]
+            if len(applied) > 0:
+                self.redis.xack(WRITE_STREAM_NAME, WRITE_STREAM_GROUP, *applied)
+            updated[kind] = added_ids
+            failed += [(message_id, fields, errors[getattr(item, id_field)])
+                       for message_id, fields, item in entries if getattr(item, id_field) in errors]
+            self.stats["applied"] += len(applied)
+
+        # failed messages stay pending and are claimed again, until they were delivered too many times
+        if len(failed) > 0:
+            self.stats["failed"] += len(failed)
+            for message_id, fields, error in failed:
+                if self.delivery_count(message_id) >= self.max_deliveries:
+                    self.dead_letter(message_id, fields, error)
+        self.stats["batches"] += 1
+        return updated
+
+    def run(self):
+        self.ensure_group()
+        print(f"Write stream worker '{self.consumer_name}' reading '{WRITE_STREAM_NAME}' in group '{WRITE_STREAM_GROUP}'")
+        while True:
+            messages = self.read_batch()
+            if len(messages) == 0:
+                continue
+            started_at = time.perf_counter()
+            updated = self.process_batch(messages)
+            invalidate_written_recommendations(self.redis, updated)
+            seconds = time.perf_counter() - started_at
+            print(f"Applied {len(messages)} write messages in {seconds:.3f}s ({len(messages) / seconds:.1f} messages/s), "
+                  f"totals: {self.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the profile, product and content writes of the Redis stream")
+    parser.add_argument("--consumer", default=f"{socket.gethostname()}-{os.getpid()}", help="unique consumer name in the group")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)), db=0)
+    WriteStreamWorker(redis_client, args.consumer).run()
@@ -135,5 +135,6 @@ This data class is used to store and pass around the conversation state in the A
             "persona_name": self.persona_name,
             "answer_in_format": self.answer_in_format,
             "answer_in_language": self.answer_in_language,
-            "response": self.response
+            "response": self.response,
+            "created_at": self.created_at
         }
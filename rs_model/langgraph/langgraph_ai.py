@@ -1,15 +1,17 @@
 import os
 import uuid
+import asyncio
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, SearchParams, Filter, FieldCondition, MatchValue
-
-from qdrant_client.http.models import Distance
+from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue
 
 from langgraph.graph import StateGraph
-from sentence_transformers import SentenceTransformer
 
 from rs_domain.user_management import get_user_profile_for_ai_agent
+from rs_domain.embedding_provider import get_embedding_provider
+from rs_domain.qdrant_factory import get_qdrant_client, get_async_qdrant_client
+from rs_domain.qdrant_schema import reconcile_payload_indexes, KEYWORD, INTEGER
+from rs_domain.qdrant_storage import build_collection_config, describe_storage_profile
+from rs_domain.qdrant_search import get_search_params, aget_search_params, QDRANT_SEARCH_PROFILE
 from rs_model.langgraph.conversation_models import ConversationState, UserConversationState
 from rs_model.chatbot_models import Message
 from rs_model.language_utils import remove_similar_keywords, split_string_to_keywords
@@ -30,9 +32,9 @@ TRANSFORMER_DEVICE = os.getenv("TRANSFORMER_DEVICE", "cpu")
 
 logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME} on device: {TRANSFORMER_DEVICE}")
 
-# Step 2: Load model
+# Step 2: Get the shared embedding provider (the model is loaded once per process)
 try:
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=TRANSFORMER_DEVICE)
+    embedding_provider = get_embedding_provider(EMBEDDING_MODEL_NAME, TRANSFORMER_DEVICE)
     logger.info("Model loaded successfully.")
 except Exception as e:
     logger.error(f"Error loading model: {e}")
@@ -40,7 +42,7 @@ except Exception as e:
 
 # Step 3: Get vector dimension
 try:
-    VECTOR_DIM_SIZE = embedding_model.get_sentence_embedding_dimension()
+    VECTOR_DIM_SIZE = embedding_provider.dimension
     logger.info(f"Embedding vector dimension: {VECTOR_DIM_SIZE}")
 except Exception as e:
     logger.error(f"Error getting vector dimension: {e}")
@@ -51,20 +53,23 @@ except Exception as e:
 DEFAULT_ERROR = "I'm sorry, I am unable to generate a response at this time."
 gemini_client = GeminiClient()
 
-# Fetch the host and port from environment variables
-QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')  # default is 'localhost'
-QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))  # default is 6333
-
 # Collection names
 COLLECTION_AGENT_ROLES = "om_agent_roles"
 COLLECTION_AGENT_CONVERSATION = "om_agent_conversations"
 COLLECTION_USER_CONVERSATION = "om_user_conversations"
 
+# Payload indexes of the filtered and sorted fields, created or fixed at startup
+COLLECTION_PAYLOAD_INDEXES = {
+    COLLECTION_AGENT_CONVERSATION: {"agent_role": KEYWORD, "journey_id": KEYWORD, "touchpoint_id": KEYWORD},
+    COLLECTION_USER_CONVERSATION: {"profile_id": KEYWORD, "created_at": INTEGER},
+    COLLECTION_AGENT_ROLES: {},
+}
+
 # 
 MIN_CONTEXT_TO_SAVE = 2
 
 def to_embedding_vector(s: str):
-    """Converts a string into an embedding vector using the SentenceTransformer model.
+    """Converts a string into an embedding vector using the shared embedding provider.
 
     Args:
         s (str): The input string to vectorize.
@@ -72,7 +77,13 @@ def to_embedding_vector(s: str):
     Returns:
         list: A list representing the embedding vector of the input string.
     """
-    return embedding_model.encode(s, convert_to_tensor=True).tolist()
+    # free-form messages rarely repeat, so they bypass the keyword cache
+    return embedding_provider.encode_one(s, use_cache=False).tolist()
+
+
+async def ato_embedding_vector(s: str):
+    """Same as to_embedding_vector(), but the model runs without blocking the event loop."""
+    return (await embedding_provider.aencode_one(s, use_cache=False)).tolist()
 
 
 def extract_keywords_from_message(user_message: str, max_keywords: int = 6) -> list[str]:
@@ -118,8 +129,10 @@ class DatabaseManager:
     def __init__(self):
         """Initializes the DatabaseManager, connects to Qdrant, and ensures the necessary collections exist."""
 
-        # Qdrant (Vector Search)
-        self.qdrant_client = QdrantClient(QDRANT_HOST, port=QDRANT_PORT)
+        # Qdrant (Vector Search), the clients are shared with the other subsystems of the process
+        self.qdrant_client = get_qdrant_client()
+        # Same database for the async methods, used by the async workflow
+        self.async_qdrant_client = get_async_qdrant_client()
         
         # Create collections if they don't exist
         self.check_and_create_collection(COLLECTION_AGENT_CONVERSATION)
@@ -142,16 +155,17 @@ class DatabaseManager:
         # Get existing collections
         existing_collections = [col.name for col in self.qdrant_client.get_collections().collections]
         if cl_name not in existing_collections:
+            # quantization, on-disk vectors and HNSW settings come from the storage profile of the collection
             self.qdrant_client.create_collection(
                 collection_name=cl_name,
-                vectors_config=VectorParams(
-                    size=vector_size, distance=Distance.COSINE
-                ),
+                **build_collection_config(cl_name, vector_size)
             )
-            print(f"✅ Created Qdrant collection: {cl_name} with vector size: {vector_size}")
+            print(f"✅ Created Qdrant collection: {cl_name} with vector size: {vector_size}, storage: {describe_storage_profile(cl_name)}")
         else:
             print(f"⚠️ Collection `{cl_name}` already exists. Skipping creation.")
 
+        reconcile_payload_indexes(self.qdrant_client, cl_name, COLLECTION_PAYLOAD_INDEXES.get(cl_name, {}))
+
 
     def get_qdrant_client(self):
         """Returns the Qdrant client instance."""
@@ -207,12 +221,13 @@ class DatabaseManager:
             )
 
 
-    def load_conversation_state(self, context: str, limit=2):
+    def load_conversation_state(self, context: str, limit=2, search_profile=QDRANT_SEARCH_PROFILE):
         """Searches for relevant conversation context in the Qdrant vector database.
 
         Args:
             context (str): The context to search for.  This will be vectorized and used as the query.
             limit (int, optional): The maximum number of results to return. Defaults to 2.
+            search_profile (str, optional): "auto", "exact", "fast", "balanced" or "accurate", see rs_domain/qdrant_search.py.
 
         Returns:
             list: A list of search results from Qdrant. Each result contains the point ID, vector, and payload.
@@ -221,24 +236,25 @@ class DatabaseManager:
 
         if len(context) > 0:
             query_vector = to_embedding_vector(context)
-            search_results = self.qdrant_client.search(
+            response = self.qdrant_client.query_points(
                 collection_name=COLLECTION_AGENT_CONVERSATION,
-                query_vector=query_vector,
+                query=query_vector,
                 limit=limit,
                 with_payload=True,
-                search_params=SearchParams(hnsw_ef=128, exact=True)
+                search_params=get_search_params(self.qdrant_client, COLLECTION_AGENT_CONVERSATION, search_profile)
             )
-            return search_results
+            return response.points
         return []
     
     
-    def load_user_conversation_state(self, profile_id: str, user_message: str, limit=6):
+    def load_user_conversation_state(self, profile_id: str, user_message: str, limit=6, search_profile=QDRANT_SEARCH_PROFILE):
         """Searches for relevant user conversation context in the Qdrant vector database.
 
         Args:
             profile_id (str): The ID of the user to filter results.
             user_message (str): The user_message to search for. This will be vectorized and used as the query.
             limit (int, optional): The maximum number of results to return. Defaults to 2.
+            search_profile (str, optional): "auto", "exact", "fast", "balanced" or "accurate", see rs_domain/qdrant_search.py.
 
         Returns:
             list: A list of search results from Qdrant. Each result contains the point ID, vector, and payload.
@@ -248,12 +264,12 @@ class DatabaseManager:
         print(f'profile_id: {profile_id}, user_message:{user_message}')
         if len(profile_id) > 0 and len(user_message) > 0 :
             query_vector = to_embedding_vector(user_message)
-            search_results = self.qdrant_client.search(
+            response = self.qdrant_client.query_points(
                 collection_name=COLLECTION_USER_CONVERSATION,
-                query_vector=query_vector,
+                query=query_vector,
                 limit=limit,
                 with_payload=True,
-                search_params=SearchParams(hnsw_ef=128, exact=True),
+                search_params=get_search_params(self.qdrant_client, COLLECTION_USER_CONVERSATION, search_profile),
                 query_filter=Filter(
                     must=[
                         FieldCondition(key="profile_id", match=MatchValue(value=profile_id))
@@ -262,13 +278,113 @@ class DatabaseManager:
             )
             
             # Sort results by created_at in descending order at application level
-            sorted_results = sorted(search_results, key=lambda x: x.payload.get("created_at", 0), reverse=True)
+            sorted_results = sorted(response.points, key=lambda x: x.payload.get("created_at", 0), reverse=True)
             return sorted_results
         else:
             print(f'profile_id and context is empty ')
 
         return []
 
+
+    async def asave_conversation_state(self, state: ConversationState):
+        """Async version of save_conversation_state()."""
+        embedding = await ato_embedding_vector(state.context)
+        training_id = str(uuid.uuid4())
+
+        await self.async_qdrant_client.upsert(
+            collection_name=COLLECTION_AGENT_CONVERSATION,
+            points=[PointStruct(id=training_id, vector=embedding, payload={
+                "agent_role": state.agent_role,
+                "journey_id": state.journey_id,
+                "touchpoint_id": state.touchpoint_id,
+                "context": state.context,
+                "response": state.response
+            })]
+        )
+
+
+    async def asave_user_conversation_state(self, state: UserConversationState):
+        """Async version of save_user_conversation_state(), the Gemini call runs in a worker thread."""
+        keywords = await asyncio.to_thread(extract_keywords_from_message, state.user_message)
+
+        if len(keywords) > 0:
+            state.keywords = remove_similar_keywords(keywords)
+            state.context = ", ".join(keywords)
+
+            print(f"=> Context to vectorize from AI model: {state.context}")
+            embedding = await ato_embedding_vector(state.context)
+            conversation_id = str(uuid.uuid4())
+
+            await self.async_qdrant_client.upsert(
+                collection_name=COLLECTION_USER_CONVERSATION,
+                points=[PointStruct(id=conversation_id, vector=embedding, payload=state.build_payload())]
+            )
+
+
+    async def aload_conversation_state(self, context: str, limit=2, search_profile=QDRANT_SEARCH_PROFILE):
+        """Async version of load_conversation_state()."""
+        if len(context) > 0:
+            query_vector = await ato_embedding_vector(context)
+            response = await self.async_qdrant_client.query_points(
+                collection_name=COLLECTION_AGENT_CONVERSATION,
+                query=query_vector,
+                limit=limit,
+                with_payload=True,
+                search_params=await aget_search_params(self.async_qdrant_client, COLLECTION_AGENT_CONVERSATION, search_profile)
+            )
+            return response.points
+        return []
+
+
+    async def aload_user_conversation_state(self, profile_id: str, user_message: str, limit=6, search_profile=QDRANT_SEARCH_PROFILE):
+        """Async version of load_user_conversation_state(), sorted by created_at in descending order."""
+        print(f'profile_id: {profile_id}, user_message:{user_message}')
+        if len(profile_id) > 0 and len(user_message) > 0:
+            query_vector = await ato_embedding_vector(user_message)
+            response = await self.async_qdrant_client.query_points(
+                collection_name=COLLECTION_USER_CONVERSATION,
+                query=query_vector,
+                limit=limit,
+                with_payload=True,
+                search_params=await aget_search_params(self.async_qdrant_client, COLLECTION_USER_CONVERSATION, search_profile),
+                query_filter=Filter(
+                    must=[
+                        FieldCondition(key="profile_id", match=MatchValue(value=profile_id))
+                    ]
+                )
+            )
+            return sorted(response.points, key=lambda x: x.payload.get("created_at", 0), reverse=True)
+        else:
+            print(f'profile_id and context is empty ')
+
+        return []
+
+
+    def search_agent_role(self, user_message: str, search_profile=QDRANT_SEARCH_PROFILE):
+        """Returns the payload of the agent role closest to the user message, or None."""
+        embedding = to_embedding_vector(user_message)
+        response = self.qdrant_client.query_points(
+            collection_name=COLLECTION_AGENT_ROLES,
+            query=embedding,
+            limit=1,
+            with_payload=True,
+            search_params=get_search_params(self.qdrant_client, COLLECTION_AGENT_ROLES, search_profile),
+        )
+        return response.points[0].payload if response.points else None
+
+
+    async def asearch_agent_role(self, user_message: str, search_profile=QDRANT_SEARCH_PROFILE):
+        """Async version of search_agent_role()."""
+        embedding = await ato_embedding_vector(user_message)
+        response = await self.async_qdrant_client.query_points(
+            collection_name=COLLECTION_AGENT_ROLES,
+            query=embedding,
+            limit=1,
+            with_payload=True,
+            search_params=await aget_search_params(self.async_qdrant_client, COLLECTION_AGENT_ROLES, search_profile),
+        )
+        return response.points[0].payload if response.points else None
+
    
 
 class LangGraphAI:
@@ -277,30 +393,33 @@ class LangGraphAI:
     def __init__(self, db_manager):
         """Initializes the LangGraphAI with a database manager and sets up the workflow."""
         self.db_manager = db_manager
-        self.workflow = StateGraph(UserConversationState)  # ✅ Initialize LangGraph
-        self._setup_workflow()  # ✅ Set up the workflow graph
+        self.workflow = self._setup_workflow(self.detect_ai_persona, self.retrieve_context, self.update_memory)
+        # the same graph for ainvoke(): the nodes that use Qdrant await the async client,
+        # the other nodes are run by LangGraph in a worker thread
+        self.async_workflow = self._setup_workflow(self.adetect_ai_persona, self.aretrieve_context, self.aupdate_memory)
 
-    def _setup_workflow(self):
+    def _setup_workflow(self, detect_ai_persona, retrieve_context, update_memory):
         """Defines the AI workflow graph."""
-        
+        workflow = StateGraph(UserConversationState)  # ✅ Initialize LangGraph
+
         # define agent nodes 
-        self.workflow.add_node("detect_ai_persona", self.detect_ai_persona)
-        self.workflow.add_node("retrieve_context", self.retrieve_context)
-        self.workflow.add_node("enrich_context", self.enrich_context)
-        self.workflow.add_node("generate_response", self.generate_response)
-        self.workflow.add_node("update_memory", self.update_memory)
+        workflow.add_node("detect_ai_persona", detect_ai_persona)
+        workflow.add_node("retrieve_context", retrieve_context)
+        workflow.add_node("enrich_context", self.enrich_context)
+        workflow.add_node("generate_response", self.generate_response)
+        workflow.add_node("update_memory", update_memory)
 
         # Define workflow transitions
-        self.workflow.add_edge("detect_ai_persona", "retrieve_context")
-        self.workflow.add_edge("retrieve_context", "enrich_context")
-        self.workflow.add_edge("enrich_context", "generate_response")
-        self.workflow.add_edge("generate_response", "update_memory")
+        workflow.add_edge("detect_ai_persona", "retrieve_context")
+        workflow.add_edge("retrieve_context", "enrich_context")
+        workflow.add_edge("enrich_context", "generate_response")
+        workflow.add_edge("generate_response", "update_memory")
 
         #  Set entry point for the workflow
-        self.workflow.set_entry_point("detect_ai_persona")
+        workflow.set_entry_point("detect_ai_persona")
 
         #  Compile the workflow properly
-        self.workflow = self.workflow.compile()
+        return workflow.compile()
 
     # 🔹 Hàm xác định vai trò của agent từ ngữ cảnh của người dùng
 
@@ -315,28 +434,23 @@ class LangGraphAI:
         """
         
         state = UserConversationState.from_dict(state_dict) 
-        embedding = to_embedding_vector(state.user_message)
         
         # Search for the most relevant agent role
-        search_results = self.db_manager.get_qdrant_client().search(
-            collection_name=COLLECTION_AGENT_ROLES,
-            query_vector=embedding,
-            limit=1,
-            with_payload=True,
-            search_params=SearchParams(hnsw_ef=128, exact=True),
-        )
+        payload = self.db_manager.search_agent_role(state.user_message)
         
-        if search_results:
-            # Assuming the payload contains the agent role information
-            # Adjust this based on how you store the agent role in the payload
-            
-            #Added error handling for cases with no 'agent_role' key in the payload
-            default_agent_role = "default_agent"
-            state.agent_role = search_results[0].payload.get("agent_role", default_agent_role)  
-            return state.to_dict()
-        else:
-            state.agent_role = "default_agent"
-            return state.to_dict()
+        return self._set_agent_role(state, payload)
+
+    async def adetect_ai_persona(self, state_dict):
+        """Async version of detect_ai_persona()."""
+        state = UserConversationState.from_dict(state_dict)
+        payload = await self.db_manager.asearch_agent_role(state.user_message)
+        return self._set_agent_role(state, payload)
+
+    def _set_agent_role(self, state, payload):
+        # Added error handling for cases with no 'agent_role' key in the payload
+        default_agent_role = "default_agent"
+        state.agent_role = payload.get("agent_role", default_agent_role) if payload else default_agent_role
+        return state.to_dict()
 
     def retrieve_context(self, state_dict) :
         """Retrieves past relevant context from Qdrant based on the user message.
@@ -360,6 +474,21 @@ class LangGraphAI:
         # Use load user conversation state from db_manager
         search_results = self.db_manager.load_user_conversation_state(state.profile_id, state.user_message)
         
+        return self._set_context(state, search_results)
+
+    async def aretrieve_context(self, state_dict):
+        """Async version of retrieve_context()."""
+        state = UserConversationState.from_dict(state_dict)
+
+        if state.private_mode:
+            state.user_profile = None
+        else:
+            state.user_profile = await asyncio.to_thread(get_user_profile_for_ai_agent, state.profile_id)
+
+        search_results = await self.db_manager.aload_user_conversation_state(state.profile_id, state.user_message)
+        return self._set_context(state, search_results)
+
+    def _set_context(self, state, search_results):
         print(f"=> retrieve_context len(search_results) = {len(search_results)} ")
         
         final_keywords = []
@@ -437,6 +566,13 @@ class LangGraphAI:
         print("update_memory.save_user_conversation_state \n ",state)
         return state.to_dict()
 
+    async def aupdate_memory(self, state_dict):
+        """Async version of update_memory()."""
+        state = UserConversationState.from_dict(state_dict)
+        await self.db_manager.asave_user_conversation_state(state)
+        print("update_memory.asave_user_conversation_state \n ",state)
+        return state.to_dict()
+
 # Agent System 
 agent_system_loaded = False
 agent_system = None  # Declare as global to ensure accessibility
@@ -479,6 +615,23 @@ def submit_message_to_agent(user_msg: Message):
 
     return final_state
 
+async def asubmit_message_to_agent(user_msg: Message):
+    """Async version of submit_message_to_agent(), runs the LangGraph workflow with ainvoke().
+
+    Args:
+        msg (Message): The user's message.
+
+    Returns:
+        UserConversationState: The final conversation state after processing the user message.
+    """
+    initial_state = user_msg.to_conversation_state()
+
+    # the first call creates the collections with the sync client
+    agent_system = await asyncio.to_thread(init_ai_system)
+    final_state_dict = await agent_system.async_workflow.ainvoke(initial_state.to_dict())
+
+    return UserConversationState.from_dict(final_state_dict)
+
 def critical_thinking(user_msg: Message):
     try:
         state = user_msg.to_conversation_state()
@@ -1,27 +1,24 @@
 import os
 import uuid
 import numpy as np
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, SearchParams
+from qdrant_client.models import PointStruct
 from qdrant_client.http.models import Distance, VectorParams
-from langgraph_ai import ConversationState, embedding_model
-
-# Fetch the host and port from environment variables
-QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')  # Default to localhost
-QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))  # Default to 6333
+from langgraph_ai import ConversationState, embedding_provider
+from rs_domain.qdrant_factory import get_qdrant_client
+from rs_domain.qdrant_search import get_search_params
 
 class AgentRoleManager:
     """Handles agent role assignment using Qdrant vector search."""
     
     def __init__(self):
-        self.qdrant_client = QdrantClient(QDRANT_HOST, port=QDRANT_PORT)
+        self.qdrant_client = get_qdrant_client()
         self.collection_name = "om_agent_roles"
 
         # Ensure collection exists in Qdrant
         if self.collection_name not in self.qdrant_client.get_collections().collections:
             self.qdrant_client.recreate_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(size=embedding_model.get_sentence_embedding_dimension(), 
+                vectors_config=VectorParams(size=embedding_provider.dimension, 
                                             distance=Distance.COSINE),
             )
         
@@ -39,23 +36,23 @@ class AgentRoleManager:
         # Generate embeddings and store in Qdrant
         points = []
         for role, description in predefined_roles.items():
-            embedding = embedding_model.encode(description, convert_to_tensor=True).tolist()
+            embedding = embedding_provider.encode_one(description).tolist()
             points.append(PointStruct(id=str(uuid.uuid4()), vector=embedding, payload={"role": role}))
 
         self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
 
     def detect_ai_persona(self, state: ConversationState) -> ConversationState:
         """Uses Qdrant to determine the best-matching agent role based on user_message."""
-        user_embedding = embedding_model.encode(state.user_message, convert_to_tensor=True).tolist()
+        user_embedding = embedding_provider.encode_one(state.user_message, use_cache=False).tolist()
 
         # Perform nearest neighbor search in Qdrant
-        search_results = self.qdrant_client.search(
+        search_results = self.qdrant_client.query_points(
             collection_name=self.collection_name,
-            query_vector=user_embedding,
+            query=user_embedding,
             limit=1,  # Get top match
             with_payload=True,
-            search_params=SearchParams(hnsw_ef=128, exact=True)
-        )
+            search_params=get_search_params(self.qdrant_client, self.collection_name)
+        ).points
 
         if search_results:
             state.agent_role = search_results[0].payload["role"]
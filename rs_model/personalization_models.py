@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 # Pydantic models for request data
@@ -23,6 +23,7 @@ class ProfileRequest(BaseModel):
     max_recommendation_size: int = Field(8, description="Default recommendation is 8")
     except_product_ids: List[str] = []
     journey_maps: List[str] = []
+    product_vector_weights: Dict[str, float] = Field({}, description="Weights of the name, category and keywords product vectors")
 
 
 class ProductRequest(BaseModel):
@@ -46,3 +47,25 @@ class ContentRequest(BaseModel):
     content_keywords: List[str]
     additional_info: dict
     journey_maps: List[str] = []
+
+
+# New keywords of a stored profile, appended to its facets
+class ProfileKeywordsUpdate(BaseModel):
+    profile_id: str
+    page_view_keywords: List[str] = []
+    purchase_keywords: List[str] = []
+    interest_keywords: List[str] = []
+    journey_maps: List[str] = []
+
+
+# One profile of a batch recommendation, with its own filters
+class ProfileRecommendationQuery(BaseModel):
+    profile_id: str
+    except_product_ids: List[str] = []
+    journey_maps: List[str] = []
+
+
+class BatchRecommendationRequest(BaseModel):
+    profiles: List[ProfileRecommendationQuery]
+    top_n: int = Field(8, description="Default recommendation is 8")
+    product_vector_weights: Dict[str, float] = Field({}, description="Weights of the name, category and keywords product vectors")
@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Start N bulk job workers (default 2), each one a consumer of the same group
+DIR_PATH="."
+APP_ID="rs_domain.bulk_jobs"
+WORKER_COUNT=${1:-2}
+
+if [ -d "$DIR_PATH" ]; then
+  cd $DIR_PATH
+fi
+
+# kill old workers to restart, each one resumes its jobs from their last committed chunk
+kill -15 $(pgrep -f $APP_ID)
+sleep 2
+
+# Activate your virtual environment if necessary
+SOURCE_PATH="env/bin/activate"
+source $SOURCE_PATH
+
+# export the variables of .env to the workers
+set -a
+source .env
+set +a
+
+datetoday=$(date '+%Y-%m-%d')
+for i in $(seq 1 $WORKER_COUNT); do
+  log_file="bulk_job_worker-$i-$datetoday.log"
+  python -m $APP_ID --consumer "$(hostname)-bulk-worker-$i" >> $log_file 2>&1 &
+done
+
+# exit
+deactivate
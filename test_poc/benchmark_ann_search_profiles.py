@@ -0,0 +1,73 @@
+import sys
+import time
+import numpy as np
+
+from common_test_util import setup_test
+setup_test()
+
+from qdrant_client.http.models import VectorParams, Distance
+from rs_domain.qdrant_factory import create_qdrant_client
+from rs_domain.qdrant_batch_writer import QdrantBatchWriter
+from rs_domain.qdrant_search import SEARCH_PROFILES, build_search_params, resolve_search_profile
+
+# usage: python benchmark_ann_search_profiles.py [max_collection_size] [vector_dim] [query_count]
+# needs a running Qdrant server, the in-memory local mode always scans exactly
+MAX_COLLECTION_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+VECTOR_DIM = int(sys.argv[2]) if len(sys.argv) > 2 else 384  # the conversation memory model
+QUERY_COUNT = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+TOP_K = 6  # conversation memory lookups return 6 points
+COLLECTION_SIZES = [size for size in [1000, 10000, 50000, 200000, 1000000] if size <= MAX_COLLECTION_SIZE]
+BENCH_COLLECTION = "bench_ann_search_profiles"
+
+rng = np.random.default_rng(42)
+centers = rng.standard_normal((500, VECTOR_DIM)).astype(np.float32)
+
+
+def synthetic_vectors(count):
+    clusters = rng.integers(0, len(centers), size=count)
+    return centers[clusters] + 0.6 * rng.standard_normal((count, VECTOR_DIM)).astype(np.float32)
+
+
+def grow_collection(client, current_size, target_size):
+    # the collection grows from one size to the next, like stored conversations do
+    with QdrantBatchWriter(client, BENCH_COLLECTION) as writer:
+        for i, vector in enumerate(synthetic_vectors(target_size - current_size)):
+            writer.add(current_size + i, vector.tolist(), {"profile_id": str((current_size + i) % 1000)})
+    while client.get_collection(BENCH_COLLECTION).status != "green":
+        time.sleep(0.5)
+
+
+def search(client, queries, search_params):
+    ids, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.query_points(BENCH_COLLECTION, query=query.tolist(), limit=TOP_K, search_params=search_params)
+        timings.append((time.perf_counter() - start) * 1000)
+        ids.append({point.id for point in response.points})
+    return ids, timings
+
+
+if __name__ == "__main__":
+    client = create_qdrant_client(timeout=600)
+    if client.collection_exists(BENCH_COLLECTION):
+        client.delete_collection(BENCH_COLLECTION)
+    client.create_collection(BENCH_COLLECTION, vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE))
+    queries = synthetic_vectors(QUERY_COUNT)
+
+    print(f"=> {VECTOR_DIM} dims, {QUERY_COUNT} queries, recall@{TOP_K} vs exact search")
+    print(f"   {'points':>8} {'profile':<9} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    current_size = 0
+    try:
+        for size in COLLECTION_SIZES:
+            grow_collection(client, current_size, size)
+            current_size = size
+
+            exact_ids, exact_timings = search(client, queries, build_search_params(BENCH_COLLECTION, "exact"))
+            print(f"   {size:>8} {'exact':<9} {1.0:7.4f} {np.percentile(exact_timings, 50):8.2f} {np.percentile(exact_timings, 99):8.2f}")
+            for profile in [name for name in SEARCH_PROFILES if name != "exact"]:
+                ids, timings = search(client, queries, build_search_params(BENCH_COLLECTION, profile))
+                recall = np.mean([len(found & truth) / TOP_K for found, truth in zip(ids, exact_ids)])
+                print(f"   {size:>8} {profile:<9} {recall:7.4f} {np.percentile(timings, 50):8.2f} {np.percentile(timings, 99):8.2f}")
+            print(f"   {size:>8} auto uses: {resolve_search_profile('auto', size) or 'hnsw_ef=QDRANT_SEARCH_HNSW_EF'}")
+    finally:
+        client.delete_collection(BENCH_COLLECTION)
@@ -0,0 +1,82 @@
+import os
+import time
+import numpy as np
+
+# measure the model calls, not the keyword embedding cache
+os.environ['EMBEDDING_CACHE_ENABLED'] = 'false'
+
+from common_test_util import setup_test
+setup_test()
+
+from rs_model.system_utils import read_json_from_file
+from rs_domain.personalization import get_text_embedding, build_profile_vector, build_product_vector, PRODUCT_VECTOR_NAMES
+
+PROFILES_FILE = './data/profiles.json'
+PRODUCTS_FILE = './data/products.json'
+ROUNDS = 5
+
+
+# the old path: one model call per keyword
+def build_profile_vector_per_keyword(page_view_keywords, purchase_keywords, interest_keywords, journey_maps=[]):
+    page_view_vector = np.mean([get_text_embedding(k) for k in page_view_keywords], axis=0)
+    purchase_vector = np.mean([get_text_embedding(k) for k in purchase_keywords], axis=0)
+    interest_vector = np.mean([get_text_embedding(k) for k in interest_keywords], axis=0)
+    if len(journey_maps) > 0:
+        journey_vector = np.mean([get_text_embedding(k) for k in journey_maps], axis=0)
+        return 0.2 * page_view_vector + 0.3 * purchase_vector + 0.4 * interest_vector + 0.1 * journey_vector
+    return 0.3 * page_view_vector + 0.4 * purchase_vector + 0.3 * interest_vector
+
+
+def build_product_vector_per_keyword(product_name, product_category, product_keywords, journey_maps=[]):
+    name_vector = get_text_embedding(product_name)
+    category_vector = get_text_embedding(product_category)
+    keyword_vectors = np.array([get_text_embedding(k) for k in product_keywords])
+    if len(journey_maps) > 0:
+        journey_vectors = np.array([get_text_embedding(k) for k in journey_maps])
+        keyword_vector = 0.4 * np.mean(keyword_vectors, axis=0) + 0.6 * np.mean(journey_vectors, axis=0)
+    else:
+        keyword_vector = np.mean(keyword_vectors, axis=0)
+    return np.concatenate([name_vector, category_vector, keyword_vector])
+
+
+# the batched path returns named vectors, concatenate them to compare with the old path
+def build_product_vector_batched(*args):
+    named_vectors = build_product_vector(*args)
+    return np.concatenate([named_vectors[name] for name in PRODUCT_VECTOR_NAMES])
+
+
+def profile_args(p):
+    return (p['page_view_keywords'], p['purchase_keywords'], p['interest_keywords'], p.get('journey_maps', []))
+
+
+def product_args(p):
+    return (p['product_name'], p['product_category'], p['product_keywords'], p.get('journey_maps', []))
+
+
+def run_benchmark(name, items, to_args, old_fn, new_fn):
+    # warm up the model once so the first forward pass is not measured
+    new_fn(*to_args(items[0]))
+
+    timings = {}
+    for label, fn in [('per-keyword', old_fn), ('batched', new_fn)]:
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            vectors = [fn(*to_args(item)) for item in items]
+        timings[label] = (time.perf_counter() - start) / (ROUNDS * len(items))
+
+    # both paths must produce the same vectors
+    old_vectors = np.array([old_fn(*to_args(item)) for item in items])
+    new_vectors = np.array([new_fn(*to_args(item)) for item in items])
+    max_diff = float(np.max(np.abs(old_vectors - new_vectors)))
+
+    print(f"=> {name}: {len(items)} items, {ROUNDS} rounds")
+    print(f"   per-keyword: {timings['per-keyword'] * 1000:.2f} ms / item")
+    print(f"   batched:     {timings['batched'] * 1000:.2f} ms / item")
+    print(f"   speedup:     {timings['per-keyword'] / timings['batched']:.2f}x, max abs diff {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    profiles = read_json_from_file(PROFILES_FILE)
+    products = read_json_from_file(PRODUCTS_FILE)
+    run_benchmark('profiles', profiles, profile_args, build_profile_vector_per_keyword, build_profile_vector)
+    run_benchmark('products', products, product_args, build_product_vector_per_keyword, build_product_vector_batched)
@@ -0,0 +1,104 @@
+import sys
+import time
+import numpy as np
+
+from common_test_util import setup_test
+setup_test()
+
+from qdrant_client.http.models import PointStruct
+from rs_domain.qdrant_factory import create_qdrant_client
+from rs_domain.qdrant_storage import build_collection_config
+from rs_domain.product_catalog_index import ProductCatalogIndex
+from rs_domain.personalization import PRODUCT_VECTOR_NAMES, normalize_product_vector_weights
+from rs_domain.personalization import build_product_filter, build_product_query_request, scored_products_from_response
+
+# usage: python benchmark_catalog_index.py [catalog_size] [vector_dim] [query_count]
+# compares the in-memory catalog index with the Qdrant prefetch + fusion search, and the named vector layout
+# with the legacy layout of one concatenated vector of 3x the dimension, needs a running Qdrant server
+CATALOG_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+VECTOR_DIM = int(sys.argv[2]) if len(sys.argv) > 2 else 768
+QUERY_COUNT = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+TOP_N = 8
+BENCH_COLLECTION = "bench_catalog_index"
+LEGACY_COLLECTION = "bench_catalog_index_legacy"
+DEFAULT_HNSW_M = 16
+
+rng = np.random.default_rng(7)
+
+
+def random_vectors(count):
+    return rng.standard_normal((count, VECTOR_DIM)).astype(np.float32)
+
+
+def estimate_layout_memory(vector_count, vector_dim):
+    # float32 vectors and one HNSW graph per vector (2 * m links of 4 bytes per point at level 0)
+    return CATALOG_SIZE * (vector_count * vector_dim * 4 + vector_count * 2 * DEFAULT_HNSW_M * 4)
+
+
+if __name__ == "__main__":
+    client = create_qdrant_client()
+    if client.collection_exists(BENCH_COLLECTION):
+        client.delete_collection(BENCH_COLLECTION)
+    client.create_collection(BENCH_COLLECTION, **build_collection_config(BENCH_COLLECTION, VECTOR_DIM, PRODUCT_VECTOR_NAMES))
+
+    vectors = {name: random_vectors(CATALOG_SIZE) for name in PRODUCT_VECTOR_NAMES}
+    for start in range(0, CATALOG_SIZE, 256):
+        client.upsert(BENCH_COLLECTION, points=[
+            PointStruct(id=i, vector={name: vectors[name][i].tolist() for name in PRODUCT_VECTOR_NAMES},
+                        payload={"product_id": f"p{i}", "journey_maps": ["j1"] if i % 4 == 0 else []})
+            for i in range(start, min(start + 256, CATALOG_SIZE))
+        ])
+
+    # the legacy layout, queried with the profile vector repeated 3 times
+    if client.collection_exists(LEGACY_COLLECTION):
+        client.delete_collection(LEGACY_COLLECTION)
+    client.create_collection(LEGACY_COLLECTION, **build_collection_config(LEGACY_COLLECTION, VECTOR_DIM * len(PRODUCT_VECTOR_NAMES)))
+    for start in range(0, CATALOG_SIZE, 256):
+        client.upsert(LEGACY_COLLECTION, points=[
+            PointStruct(id=i, vector=np.concatenate([vectors[name][i] for name in PRODUCT_VECTOR_NAMES]).tolist(),
+                        payload={"product_id": f"p{i}", "journey_maps": ["j1"] if i % 4 == 0 else []})
+            for i in range(start, min(start + 256, CATALOG_SIZE))
+        ])
+
+    index = ProductCatalogIndex(BENCH_COLLECTION, PRODUCT_VECTOR_NAMES, max_size=CATALOG_SIZE)
+    index.load_from_qdrant(client)
+    weights = normalize_product_vector_weights()
+    queries = random_vectors(QUERY_COUNT)
+
+    try:
+        for journey_maps in [[], ["j1"]]:
+            query_filter = build_product_filter([], journey_maps)
+            qdrant_timings, legacy_timings, index_timings, same = [], [], [], 0
+            for query in queries:
+                start = time.perf_counter()
+                request = build_product_query_request(query, TOP_N, query_filter, weights)
+                responses = client.query_batch_points(collection_name=BENCH_COLLECTION, requests=[request])
+                from_qdrant = scored_products_from_response(responses[0])
+                qdrant_timings.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                client.query_points(LEGACY_COLLECTION, query=np.concatenate([query] * len(PRODUCT_VECTOR_NAMES)).tolist(),
+                                    query_filter=query_filter, limit=TOP_N, with_payload=True)
+                legacy_timings.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                from_index = index.search(query, TOP_N, [], journey_maps, weights)
+                index_timings.append((time.perf_counter() - start) * 1000)
+                same += [p["product_id"] for _, p in from_qdrant] == [p["product_id"] for _, p in from_index]
+
+            start = time.perf_counter()
+            index.search_batch(queries, [([], journey_maps)] * QUERY_COUNT, TOP_N, weights)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+            print(f"=> {CATALOG_SIZE} products, {VECTOR_DIM} dims, journey_maps={journey_maps}")
+            print(f"   qdrant p50 {np.percentile(qdrant_timings, 50):.2f} ms, p99 {np.percentile(qdrant_timings, 99):.2f} ms")
+            print(f"   legacy p50 {np.percentile(legacy_timings, 50):.2f} ms, p99 {np.percentile(legacy_timings, 99):.2f} ms")
+            print(f"   index  p50 {np.percentile(index_timings, 50):.2f} ms, p99 {np.percentile(index_timings, 99):.2f} ms")
+            print(f"   index batch of {QUERY_COUNT}: {batch_ms:.1f} ms, qdrant prefetch found the exact top {TOP_N}: {same}/{QUERY_COUNT}")
+        # both layouts store 3 * dim floats per product, the named one has 3 HNSW graphs instead of 1
+        named_memory = estimate_layout_memory(len(PRODUCT_VECTOR_NAMES), VECTOR_DIM)
+        legacy_memory = estimate_layout_memory(1, VECTOR_DIM * len(PRODUCT_VECTOR_NAMES))
+        print(f"=> estimated vectors + HNSW memory: named {named_memory / 2**20:.1f} MB, legacy {legacy_memory / 2**20:.1f} MB")
+    finally:
+        client.delete_collection(BENCH_COLLECTION)
+        client.delete_collection(LEGACY_COLLECTION)
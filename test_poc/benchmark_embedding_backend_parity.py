@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import numpy as np
+
+# compare raw model outputs, not cached vectors
+os.environ['EMBEDDING_CACHE_ENABLED'] = 'false'
+
+from common_test_util import setup_test
+setup_test()
+
+from rs_model.system_utils import read_json_from_file
+from rs_domain.embedding_provider import get_embedding_provider
+
+PROFILES_FILE = './data/profiles.json'
+PRODUCTS_FILE = './data/products.json'
+AGENT_ROLES_FILE = './rs_agent/vn-agent-list.json'
+TOP_K = 5
+
+# usage: python benchmark_embedding_backend_parity.py [model_name] [backend]
+MODEL_NAME = sys.argv[1] if len(sys.argv) > 1 else 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+BACKEND = sys.argv[2] if len(sys.argv) > 2 else 'onnx-int8'
+
+
+def load_corpora():
+    profiles = read_json_from_file(PROFILES_FILE)
+    products = read_json_from_file(PRODUCTS_FILE)
+    agent_roles = read_json_from_file(AGENT_ROLES_FILE)
+
+    profile_texts = set()
+    for p in profiles:
+        for field in ['page_view_keywords', 'purchase_keywords', 'interest_keywords', 'journey_maps']:
+            profile_texts.update(p.get(field, []))
+
+    product_texts = set()
+    for p in products:
+        product_texts.update([p['product_name'], p['product_category']] + p['product_keywords'])
+
+    agent_role_texts = set()
+    for a in agent_roles:
+        agent_role_texts.update([a['name'], a['description'], a['domain_knowledge']] + a.get('seeding_questions', []))
+
+    return {"profiles": sorted(profile_texts), "products": sorted(product_texts), "agent_roles": sorted(agent_role_texts)}
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def top_k_neighbors(vectors, k):
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def compare(name, texts, reference, candidate):
+    start = time.perf_counter()
+    ref_vectors = normalize(reference.encode(texts))
+    ref_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cand_vectors = normalize(candidate.encode(texts))
+    cand_seconds = time.perf_counter() - start
+
+    # cosine drift of each text between the two backends
+    drift = 1.0 - np.sum(ref_vectors * cand_vectors, axis=1)
+
+    # recall@k: how many of the torch nearest neighbors the candidate backend also returns
+    k = min(TOP_K, len(texts) - 1)
+    ref_neighbors = top_k_neighbors(ref_vectors, k)
+    cand_neighbors = top_k_neighbors(cand_vectors, k)
+    recall = np.mean([len(set(r) & set(c)) / k for r, c in zip(ref_neighbors, cand_neighbors)])
+
+    print(f"=> {name}: {len(texts)} texts")
+    print(f"   cosine drift: mean {drift.mean():.5f}, max {drift.max():.5f}")
+    print(f"   recall@{k}: {recall:.4f}")
+    print(f"   encode time: torch {ref_seconds * 1000:.1f} ms, {candidate.backend} {cand_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    reference = get_embedding_provider(MODEL_NAME, backend='torch')
+    candidate = get_embedding_provider(MODEL_NAME, backend=BACKEND)
+
+    # load both models before timing
+    reference.encode(['warmup'])
+    candidate.encode(['warmup'])
+
+    for name, texts in load_corpora().items():
+        compare(name, texts, reference, candidate)
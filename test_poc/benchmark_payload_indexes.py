@@ -0,0 +1,79 @@
+import sys
+import time
+import uuid
+import numpy as np
+
+from common_test_util import setup_test
+setup_test()
+
+from qdrant_client.http.models import PointStruct, VectorParams, Distance, Filter, FieldCondition, MatchAny, MatchExcept
+from rs_domain.qdrant_factory import create_qdrant_client
+from rs_domain.qdrant_schema import reconcile_payload_indexes
+from rs_domain.personalization import COLLECTION_PAYLOAD_INDEXES, PRODUCT_COLLECTION
+
+# usage: python benchmark_payload_indexes.py [product_count] [rounds]
+# needs a running Qdrant server, the in-memory local mode ignores payload indexes
+PRODUCT_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+VECTOR_DIM = 768
+TOP_N = 8
+JOURNEY_MAPS = [f"journey_{i}" for i in range(50)]
+BENCH_COLLECTION = "bench_payload_indexes"
+
+rng = np.random.default_rng(42)
+
+
+def load_products(client):
+    if client.collection_exists(BENCH_COLLECTION):
+        client.delete_collection(BENCH_COLLECTION)
+    client.create_collection(BENCH_COLLECTION, vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE))
+    product_ids = []
+    for start in range(0, PRODUCT_COUNT, 1000):
+        points = []
+        for _ in range(min(1000, PRODUCT_COUNT - start)):
+            product_id = str(uuid.uuid4())
+            product_ids.append(product_id)
+            journey_maps = list(rng.choice(JOURNEY_MAPS, size=2, replace=False))
+            points.append(PointStruct(id=str(uuid.uuid4()), vector=rng.standard_normal(VECTOR_DIM).tolist(),
+                                      payload={"product_id": product_id, "journey_maps": journey_maps}))
+        client.upsert(BENCH_COLLECTION, points=points, wait=True)
+    return product_ids
+
+
+def wait_until_indexed(client):
+    while client.get_collection(BENCH_COLLECTION).status != "green":
+        time.sleep(0.5)
+
+
+def filtered_search_latency(client, product_ids):
+    # the recommendation filter: a few journey maps, minus the products already seen
+    timings = []
+    for _ in range(ROUNDS):
+        query_filter = Filter(must=[
+            FieldCondition(key="journey_maps", match=MatchAny(any=list(rng.choice(JOURNEY_MAPS, size=2, replace=False)))),
+            FieldCondition(key="product_id", match=MatchExcept(**{"except": list(rng.choice(product_ids, size=20))})),
+        ])
+        query = rng.standard_normal(VECTOR_DIM).tolist()
+        start = time.perf_counter()
+        client.query_points(BENCH_COLLECTION, query=query, query_filter=query_filter, limit=TOP_N)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+if __name__ == "__main__":
+    client = create_qdrant_client()
+    product_ids = load_products(client)
+    wait_until_indexed(client)
+
+    try:
+        before = filtered_search_latency(client, product_ids)
+        reconcile_payload_indexes(client, BENCH_COLLECTION, COLLECTION_PAYLOAD_INDEXES[PRODUCT_COLLECTION])
+        wait_until_indexed(client)
+        after = filtered_search_latency(client, product_ids)
+    finally:
+        client.delete_collection(BENCH_COLLECTION)
+
+    print(f"=> filtered product search, {PRODUCT_COUNT} products, {ROUNDS} queries")
+    print(f"   without payload indexes: p50 {before[0]:.2f} ms, p95 {before[1]:.2f} ms")
+    print(f"   with payload indexes:    p50 {after[0]:.2f} ms, p95 {after[1]:.2f} ms")
+    print(f"   speedup p50: {before[0] / after[0]:.2f}x")
@@ -0,0 +1,96 @@
+import sys
+import time
+import uuid
+import numpy as np
+
+from common_test_util import setup_test
+setup_test()
+
+from qdrant_client.http.models import PointStruct, VectorParams, Distance, QueryRequest
+from rs_domain.qdrant_factory import create_qdrant_client
+
+# usage: python benchmark_qdrant_transport.py [vector_dim] [rounds]
+# needs a Qdrant server with both the REST and the gRPC port open, see QDRANT_HOST, QDRANT_PORT and QDRANT_GRPC_PORT
+VECTOR_DIM = int(sys.argv[1]) if len(sys.argv) > 1 else 768
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+PRODUCT_VECTOR_NAMES = ["name", "category", "keywords"]
+UPSERT_BATCH_SIZES = [1, 64, 256]
+TOP_N = 8
+PREFETCH_LIMIT = TOP_N * 4
+
+PROFILE_BENCH_COLLECTION = "bench_transport_profile"
+PRODUCT_BENCH_COLLECTION = "bench_transport_product"
+
+rng = np.random.default_rng(42)
+
+
+def random_vector():
+    return rng.standard_normal(VECTOR_DIM).astype(np.float32).tolist()
+
+
+def profile_point():
+    return PointStruct(id=str(uuid.uuid4()), vector=random_vector(),
+                       payload={"profile_id": str(uuid.uuid4()), "page_view_keywords": ["helmet", "travel"]})
+
+
+def product_point():
+    return PointStruct(id=str(uuid.uuid4()), vector={name: random_vector() for name in PRODUCT_VECTOR_NAMES},
+                       payload={"product_id": str(uuid.uuid4()), "name": "product", "keywords": ["helmet"]})
+
+
+def create_collections(client):
+    for name in [PROFILE_BENCH_COLLECTION, PRODUCT_BENCH_COLLECTION]:
+        if client.collection_exists(name):
+            client.delete_collection(name)
+    client.create_collection(PROFILE_BENCH_COLLECTION, vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE))
+    client.create_collection(PRODUCT_BENCH_COLLECTION, vectors_config={
+        name: VectorParams(size=VECTOR_DIM, distance=Distance.COSINE) for name in PRODUCT_VECTOR_NAMES})
+    client.upsert(PRODUCT_BENCH_COLLECTION, points=[product_point() for _ in range(1000)], wait=True)
+
+
+def timed(fn):
+    # one call to open the connection, then ROUNDS measured calls
+    fn()
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def run_benchmark(client):
+    results = {}
+    for size in UPSERT_BATCH_SIZES:
+        results[f"upsert {size} profiles"] = timed(lambda: client.upsert(
+            PROFILE_BENCH_COLLECTION, points=[profile_point() for _ in range(size)], wait=True))
+        results[f"upsert {size} products"] = timed(lambda: client.upsert(
+            PRODUCT_BENCH_COLLECTION, points=[product_point() for _ in range(size)], wait=True))
+
+    query = random_vector()
+    results["search profiles"] = timed(lambda: client.query_points(
+        PROFILE_BENCH_COLLECTION, query=query, limit=TOP_N, with_payload=True))
+    # the recommendation path: one prefetch per named vector, returning the named vectors for the fusion
+    requests = [QueryRequest(query=query, using=name, limit=PREFETCH_LIMIT, with_payload=True, with_vector=PRODUCT_VECTOR_NAMES)
+                for name in PRODUCT_VECTOR_NAMES]
+    results["recommend products"] = timed(lambda: client.query_batch_points(PRODUCT_BENCH_COLLECTION, requests=requests))
+    return results
+
+
+if __name__ == "__main__":
+    rest_client = create_qdrant_client(prefer_grpc=False)
+    grpc_client = create_qdrant_client(prefer_grpc=True)
+    create_collections(rest_client)
+
+    try:
+        rest_results = run_benchmark(rest_client)
+        grpc_results = run_benchmark(grpc_client)
+    finally:
+        rest_client.delete_collection(PROFILE_BENCH_COLLECTION)
+        rest_client.delete_collection(PRODUCT_BENCH_COLLECTION)
+
+    print(f"=> vector dim {VECTOR_DIM}, {ROUNDS} rounds, latency p50 / p95 in ms")
+    print(f"   {'operation':<24} {'REST':>17} {'gRPC':>17} {'speedup p50':>12}")
+    for name, (rest_p50, rest_p95) in rest_results.items():
+        grpc_p50, grpc_p95 = grpc_results[name]
+        print(f"   {name:<24} {rest_p50:8.2f} / {rest_p95:6.2f} {grpc_p50:8.2f} / {grpc_p95:6.2f} {rest_p50 / grpc_p50:11.2f}x")
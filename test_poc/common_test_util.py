@@ -1,6 +1,42 @@
-
 import sys
 import os
+import hashlib
+import numpy as np
 
 def setup_test():
-    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+# A deterministic stand-in for the SentenceTransformer: the vector of a text is seeded by its hash.
+# The same text always gets the same vector, so stored vectors can be compared with rebuilt ones.
+class HashingModel:
+    def __init__(self, dimension=32):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, **kwargs):
+        seeds = [int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little') for text in texts]
+        vectors = [np.random.default_rng(seed).standard_normal(self.dimension) for seed in seeds]
+        return np.array(vectors, dtype=np.float32).reshape(len(texts), self.dimension)
+
+
+# The focused tests of rs_domain run without any server or model download: profiles are locked in the
+# process, the embedding cache stays in memory and texts are embedded by the HashingModel
+def setup_domain_test():
+    os.environ.update({"REDIS_HOST": "", "EMBEDDING_CACHE_DIR": "", "EMBEDDING_WORKERS": "0",
+                       "PRODUCT_CATALOG_INDEX_ENABLED": "false", "INGESTION_SKIP_UNCHANGED": "true"})
+    setup_test()
+    import rs_domain.embedding_provider as embedding_provider
+    embedding_provider.load_sentence_transformer = lambda model_name, device, backend: HashingModel()
+
+
+# A new Qdrant in memory, shared by every rs_domain module, with the personalization collections
+def use_memory_qdrant():
+    from qdrant_client import QdrantClient
+    import rs_domain.qdrant_factory as qdrant_factory
+    from rs_domain.personalization import init_db_personalization
+    qdrant_factory.qdrant_client = QdrantClient(":memory:")
+    init_db_personalization()
+    return qdrant_factory.qdrant_client
@@ -0,0 +1,98 @@
+import sys
+import time
+import numpy as np
+
+from common_test_util import setup_test
+setup_test()
+
+from qdrant_client.http.models import SearchParams
+from rs_domain.qdrant_factory import create_qdrant_client
+from rs_domain.qdrant_batch_writer import QdrantBatchWriter
+from rs_domain.qdrant_storage import STORAGE_PROFILES, resolve_storage_profile, build_collection_config
+from rs_domain.qdrant_storage import get_quantization_search_params
+
+# usage: python report_quantization_recall_memory.py [profile_count] [vector_dim] [query_count]
+# needs a running Qdrant server, the in-memory local mode ignores quantization and on-disk settings
+PROFILE_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+VECTOR_DIM = int(sys.argv[2]) if len(sys.argv) > 2 else 768
+QUERY_COUNT = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+TOP_K = 10
+CLUSTER_COUNT = 1000  # synthetic profiles are grouped around interests, like real ones
+CHUNK_SIZE = 10000
+DEFAULT_HNSW_M = 16
+
+centers = np.random.default_rng(1).standard_normal((CLUSTER_COUNT, VECTOR_DIM)).astype(np.float32)
+
+
+def synthetic_profiles(count, seed):
+    rng = np.random.default_rng(seed)
+    clusters = rng.integers(0, CLUSTER_COUNT, size=count)
+    return centers[clusters] + 0.6 * rng.standard_normal((count, VECTOR_DIM)).astype(np.float32)
+
+
+def load_collection(client, collection_name, profile):
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(collection_name, **build_collection_config(collection_name, VECTOR_DIM, profile=profile))
+
+    # the same seeds give the same profiles in every collection
+    with QdrantBatchWriter(client, collection_name, chunk_size=512) as writer:
+        for start in range(0, PROFILE_COUNT, CHUNK_SIZE):
+            vectors = synthetic_profiles(min(CHUNK_SIZE, PROFILE_COUNT - start), seed=start)
+            for i, vector in enumerate(vectors):
+                writer.add(start + i, vector.tolist(), {"profile_id": str(start + i)})
+    while client.get_collection(collection_name).status != "green":
+        time.sleep(1)
+    return writer.get_stats()
+
+
+def search(client, collection_name, queries, search_params):
+    ids, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.query_points(collection_name, query=query.tolist(), limit=TOP_K, search_params=search_params)
+        timings.append((time.perf_counter() - start) * 1000)
+        ids.append({point.id for point in response.points})
+    return ids, timings
+
+
+def estimate_memory(profile):
+    # original float32 vectors, quantized vectors and the HNSW graph (2 * m links of 4 bytes per point at level 0)
+    original = PROFILE_COUNT * VECTOR_DIM * 4
+    quantized = {"none": 0, "scalar": PROFILE_COUNT * VECTOR_DIM, "binary": PROFILE_COUNT * VECTOR_DIM // 8}
+    graph = PROFILE_COUNT * 2 * (profile["hnsw_m"] or DEFAULT_HNSW_M) * 4
+    ram = quantized[profile["quantization"]] + graph + (0 if profile["on_disk"] else original)
+    disk = original if profile["on_disk"] else 0
+    return ram, disk
+
+
+if __name__ == "__main__":
+    client = create_qdrant_client(timeout=600)
+    queries = synthetic_profiles(QUERY_COUNT, seed=PROFILE_COUNT + 1)  # a seed not used by the profiles
+
+    rows = []
+    ground_truth = None
+    try:
+        for name in STORAGE_PROFILES:
+            profile = resolve_storage_profile(name)
+            collection_name = f"bench_storage_{name}"
+            stats = load_collection(client, collection_name, profile)
+            print(f"Loaded {PROFILE_COUNT} profiles into '{collection_name}' at {stats['points_per_second']} points/s")
+
+            if ground_truth is None:
+                ground_truth, _ = search(client, collection_name, queries, SearchParams(exact=True))
+            ids, timings = search(client, collection_name, queries,
+                                  SearchParams(quantization=get_quantization_search_params(collection_name, profile)))
+            recall = np.mean([len(found & truth) / TOP_K for found, truth in zip(ids, ground_truth)])
+            ram, disk = estimate_memory(profile)
+            rows.append((name, recall, np.percentile(timings, 50), np.percentile(timings, 99), ram, disk))
+            client.delete_collection(collection_name)
+    finally:
+        for name in STORAGE_PROFILES:
+            if client.collection_exists(f"bench_storage_{name}"):
+                client.delete_collection(f"bench_storage_{name}")
+
+    print(f"=> {PROFILE_COUNT} synthetic profiles of {VECTOR_DIM} dims, {QUERY_COUNT} queries, recall@{TOP_K} vs exact search")
+    print(f"   {'profile':<10} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'RAM MB':>9} {'disk MB':>9}")
+    for name, recall, p50, p99, ram, disk in rows:
+        print(f"   {name:<10} {recall:7.4f} {p50:8.2f} {p99:8.2f} {ram / 2**20:9.0f} {disk / 2**20:9.0f}")
@@ -0,0 +1,91 @@
+# Focused tests of the bulk ingestion jobs, with fakeredis and Qdrant in memory: pytest test_poc/test_bulk_jobs.py
+import json
+import asyncio
+import fakeredis
+import pytest
+
+from common_test_util import setup_domain_test, use_memory_qdrant
+setup_domain_test()
+
+from rs_domain import bulk_jobs
+from rs_domain.bulk_jobs import BulkJobWorker, asubmit_bulk_job, aget_bulk_job, new_bulk_job_id
+from rs_domain.bulk_jobs import BULK_JOB_STREAM, BULK_JOB_GROUP
+from rs_domain.personalization import PRODUCT_COLLECTION
+
+
+@pytest.fixture(autouse=True)
+def qdrant():
+    return use_memory_qdrant()
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def write_products(path, count):
+    products = [{"product_id": f"p{i}", "product_name": f"product {i}", "product_category": "bikes",
+                 "product_keywords": ["bike", f"model {i}"], "additional_info": {}} for i in range(count)]
+    path.write_text(json.dumps(products), encoding="utf-8")
+    return str(path)
+
+
+def submit(redis_server, source):
+    job_id = new_bulk_job_id()
+    asyncio.run(asubmit_bulk_job(fakeredis.aioredis.FakeRedis(server=redis_server), job_id, "product", source, False))
+    return job_id
+
+
+def get_job(redis_server, job_id):
+    return asyncio.run(aget_bulk_job(fakeredis.aioredis.FakeRedis(server=redis_server), job_id))
+
+
+def test_interrupted_job_resumes_from_its_last_committed_chunk(tmp_path, redis_server, qdrant, monkeypatch):
+    redis_client = fakeredis.FakeRedis(server=redis_server)
+    worker = BulkJobWorker(redis_client, "worker-1", chunk_size=2, block_ms=10)
+    worker.ensure_group()
+    job_id = submit(redis_server, write_products(tmp_path / "products.json", 5))
+
+    applied = []
+    crash = {"after_items": 2}
+    add_items_to_qdrant = bulk_jobs.add_items_to_qdrant
+
+    def add_items_until_crash(kind, items):
+        if len(applied) == crash["after_items"]:
+            raise RuntimeError("worker stopped")
+        applied.extend(item.product_id for item in items)
+        return add_items_to_qdrant(kind, items)
+    monkeypatch.setattr(bulk_jobs, "add_items_to_qdrant", add_items_until_crash)
+
+    message_id, next_job_id = worker.next_job()
+    assert next_job_id == job_id
+    with pytest.raises(RuntimeError):
+        worker.run_job(message_id, job_id)
+
+    job = get_job(redis_server, job_id)
+    assert (job["status"], job["offset"], job["processed"], job["applied"]) == ("running", 2, 2, 2)
+    assert redis_client.xpending(BULK_JOB_STREAM, BULK_JOB_GROUP)["pending"] == 1
+
+    # the restarted worker reads its own pending job first and starts after the committed chunk
+    crash["after_items"] = None
+    assert worker.next_job() == (message_id, job_id)
+    worker.run_job(message_id, job_id)
+
+    assert applied == ["p0", "p1", "p2", "p3", "p4"]
+    job = get_job(redis_server, job_id)
+    assert (job["status"], job["offset"], job["processed"], job["applied"], job["failed"]) == ("done", 5, 5, 5, 0)
+    assert redis_client.xpending(BULK_JOB_STREAM, BULK_JOB_GROUP)["pending"] == 0
+    assert qdrant.count(PRODUCT_COLLECTION, exact=True).count == 5
+
+
+def test_items_sent_again_are_counted_unchanged(tmp_path, redis_server):
+    redis_client = fakeredis.FakeRedis(server=redis_server)
+    worker = BulkJobWorker(redis_client, "worker-1", chunk_size=2, block_ms=10)
+    worker.ensure_group()
+    source = write_products(tmp_path / "products.json", 3)
+    for _ in range(2):
+        job_id = submit(redis_server, source)
+        worker.run_job(*worker.next_job())
+
+    job = get_job(redis_server, job_id)
+    assert (job["status"], job["applied"], job["unchanged"], job["failed"]) == ("done", 0, 3, 0)
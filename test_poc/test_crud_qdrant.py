@@ -1,10 +1,13 @@
 import json
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.models import PointStruct
 from qdrant_client.http.models import Distance, VectorParams
 
-from sentence_transformers import SentenceTransformer
+from common_test_util import setup_test
+setup_test()
+
+from rs_domain.embedding_provider import get_embedding_provider
+from rs_domain.qdrant_factory import create_qdrant_client
 
 import cityhash
 
@@ -30,8 +33,7 @@ def index_data(file_path: str):
             id = hash_string(json.dumps(city))
             corpus = ' '.join(city['travelTypes']) + " - " + \
                 city['name'] + " - " + city['description']
-            city_embedding = model.encode(
-                corpus, convert_to_tensor=True).tolist()
+            city_embedding = model.encode_one(corpus, use_cache=False).tolist()
 
             print(f"Indexing City: {city['name']}, Latitude: {city['lat']}, Longitude: {city['lon']}, id {id}")
             # Add more fields as needed
@@ -63,11 +65,11 @@ def index_data(file_path: str):
 
 
 # Initialize the client
-client = QdrantClient("localhost", port=6333)  # For production
+client = create_qdrant_client()  # settings from .env, see rs_domain/qdrant_factory.py
 
 MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
-model = SentenceTransformer(MODEL_NAME)
-VECTOR_DIM_SIZE = model.get_sentence_embedding_dimension()
+model = get_embedding_provider(MODEL_NAME)
+VECTOR_DIM_SIZE = model.dimension
 
 
 def read_json_file(file_path):
@@ -85,7 +87,7 @@ def read_json_file(file_path):
 
 def run_query(query: str, radius_in_km: int, geo_location, travelTypes = [], avg_population = 10000000):
     r_in_km = 1000.0 * radius_in_km
-    query_embedding = model.encode(query, convert_to_tensor=True).tolist()
+    query_embedding = model.encode_one(query, use_cache=False).tolist()
 
     search_result = client.search(
         collection_name=CITIES_DATA,
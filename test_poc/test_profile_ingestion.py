@@ -0,0 +1,116 @@
+# Focused tests of profile ingestion, with Qdrant in memory: pytest test_poc/test_profile_ingestion.py
+import numpy as np
+import pytest
+
+from common_test_util import setup_domain_test, use_memory_qdrant
+setup_domain_test()
+
+from rs_model.personalization_models import ProfileRequest
+from rs_domain import personalization
+from rs_domain.personalization import PROFILE_COLLECTION, FACET_STATS_FIELD, string_to_point_id, build_item_payload
+from rs_domain.personalization import add_items_to_qdrant, append_profile_keywords, build_profile_vector
+from rs_domain.personalization import rebuild_stored_profile_vector, get_ingestion_stats
+
+
+@pytest.fixture(autouse=True)
+def qdrant():
+    return use_memory_qdrant()
+
+
+def make_profile(profile_id, page_view_keywords, additional_info=None):
+    return ProfileRequest(profile_id=profile_id, tenant_id="test", page_view_keywords=page_view_keywords,
+                          purchase_keywords=["helmet"], interest_keywords=["travel"], additional_info=additional_info or {})
+
+
+def stored_point(qdrant, profile_id):
+    return qdrant.retrieve(PROFILE_COLLECTION, [string_to_point_id(profile_id)], with_payload=True, with_vectors=True)[0]
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def spy_on(monkeypatch, name):
+    calls = []
+    real = getattr(personalization, name)
+
+    def spy(*args):
+        calls.append(args)
+        return real(*args)
+    monkeypatch.setattr(personalization, name, spy)
+    return calls
+
+
+def test_incremental_append_matches_full_rebuild(qdrant, monkeypatch):
+    add_items_to_qdrant("profile", [make_profile("p1", ["bike"])])
+    # stored without facet stats: the first append rebuilds the profile and stores them
+    append_profile_keywords({"p1": {"page_view_keywords": ["road bike"]}})
+    assert stored_point(qdrant, "p1").payload[FACET_STATS_FIELD]["facets"]["page_view"]["count"] == 2
+
+    embeddings = spy_on(monkeypatch, "get_text_embeddings")
+    updated = append_profile_keywords({"p1": {"page_view_keywords": ["gloves"], "interest_keywords": ["camping"]}})
+
+    # only the new keywords are embedded
+    assert embeddings == [(["gloves", "camping"],)]
+    expected = build_profile_vector(["bike", "road bike", "gloves"], ["helmet"], ["travel", "camping"])
+    np.testing.assert_allclose(updated["p1"][0], expected, atol=1e-5)
+    np.testing.assert_allclose(stored_point(qdrant, "p1").vector, unit(expected), atol=1e-5)
+    assert FACET_STATS_FIELD not in updated["p1"][1]
+
+    rebuilt_vector, payload = rebuild_stored_profile_vector("p1")
+    np.testing.assert_allclose(rebuilt_vector, expected, atol=1e-5)
+    assert payload["page_view_keywords"] == ["bike", "road bike", "gloves"]
+
+
+def test_facet_stats_of_other_keywords_are_not_used(qdrant):
+    add_items_to_qdrant("profile", [make_profile("p1", ["bike"])])
+    append_profile_keywords({"p1": {"page_view_keywords": ["road bike"]}})
+    # keywords written without their facet stats, the stats no longer match them
+    qdrant.set_payload(PROFILE_COLLECTION, payload={"page_view_keywords": ["kayak"]}, points=[string_to_point_id("p1")])
+
+    updated = append_profile_keywords({"p1": {"page_view_keywords": ["paddle"]}})
+
+    expected = build_profile_vector(["kayak", "paddle"], ["helmet"], ["travel"])
+    np.testing.assert_allclose(updated["p1"][0], expected, atol=1e-5)
+    assert stored_point(qdrant, "p1").payload[FACET_STATS_FIELD]["facets"]["page_view"]["count"] == 2
+
+
+def test_unknown_profiles_are_not_updated():
+    assert append_profile_keywords({"missing": {"page_view_keywords": ["bike"]}}) == {}
+
+
+def test_unchanged_items_are_skipped_and_payload_changes_keep_the_vector(qdrant, monkeypatch):
+    added_ids, failed_items, unchanged_ids = add_items_to_qdrant("profile", [make_profile("p1", ["bike"]),
+                                                                             make_profile("p2", ["kayak"])])
+    assert sorted(added_ids) == ["p1", "p2"] and failed_items == [] and unchanged_ids == []
+    stored_vector = stored_point(qdrant, "p2").vector
+
+    embedded = spy_on(monkeypatch, "embed_items")
+    stats = get_ingestion_stats()
+    changed_profile = make_profile("p2", ["kayak"], {"age": 30})
+    added_ids, failed_items, unchanged_ids = add_items_to_qdrant("profile", [make_profile("p1", ["bike"]), changed_profile])
+
+    assert added_ids == ["p2"] and unchanged_ids == ["p1"] and failed_items == []
+    assert embedded == []
+    point = stored_point(qdrant, "p2")
+    assert point.vector == stored_vector
+    assert point.payload["additional_info"] == {"age": 30}
+    assert point.payload["payload_fingerprint"] == build_item_payload("profile", changed_profile)["payload_fingerprint"]
+    after = get_ingestion_stats()
+    assert (after["embedded"], after["payload_updated"], after["unchanged"]) == \
+           (stats["embedded"], stats["payload_updated"] + 1, stats["unchanged"] + 1)
+
+
+def test_changed_keywords_are_embedded_again(qdrant, monkeypatch):
+    add_items_to_qdrant("profile", [make_profile("p1", ["bike"])])
+    stored_vector = stored_point(qdrant, "p1").vector
+
+    embedded = spy_on(monkeypatch, "embed_items")
+    stats = get_ingestion_stats()
+    added_ids, _, unchanged_ids = add_items_to_qdrant("profile", [make_profile("p1", ["bike", "gloves"])])
+
+    assert added_ids == ["p1"] and unchanged_ids == []
+    assert [item.profile_id for _, items in embedded for item in items] == ["p1"]
+    assert stored_point(qdrant, "p1").vector != stored_vector
+    assert get_ingestion_stats()["embedded"] == stats["embedded"] + 1
@@ -0,0 +1,72 @@
+# Focused tests of the recommendation cache stampede lock, with fakeredis: pytest test_poc/test_recommendation_cache.py
+import asyncio
+import fakeredis
+import pytest
+
+from common_test_util import setup_test
+setup_test()
+
+from rs_domain.recommendation_cache import RecommendationCache
+
+RESULT = [{"product_id": "a", "score": 0.9}]
+
+
+async def get_or_compute(cache, compute):
+    return await cache.get_or_compute("p1", 8, [], [], None, compute)
+
+
+def test_one_caller_computes_and_releases_the_lock():
+    async def scenario():
+        redis_client = fakeredis.aioredis.FakeRedis()
+        cache = RecommendationCache(redis_client, lock_wait_ms=2000)
+        computed = []
+
+        async def compute():
+            computed.append(1)
+            await asyncio.sleep(0.1)
+            return RESULT
+
+        results = await asyncio.gather(*[get_or_compute(cache, compute) for _ in range(5)])
+        assert results == [RESULT] * 5
+        assert len(computed) == 1
+        assert cache.get_stats()["waited_hits"] == 4
+        assert await redis_client.keys("rs:rec:*:lock") == []
+    asyncio.run(scenario())
+
+
+def test_the_lock_is_released_when_compute_fails():
+    async def scenario():
+        redis_client = fakeredis.aioredis.FakeRedis()
+        cache = RecommendationCache(redis_client, lock_wait_ms=2000)
+
+        async def failing_compute():
+            raise RuntimeError("Qdrant unavailable")
+
+        async def compute():
+            return RESULT
+
+        with pytest.raises(RuntimeError):
+            await get_or_compute(cache, failing_compute)
+        assert await redis_client.keys("rs:rec:*:lock") == []
+        # the next caller takes the lock and computes at once, it does not wait for the failed one
+        started_at = asyncio.get_running_loop().time()
+        assert await get_or_compute(cache, compute) == RESULT
+        assert asyncio.get_running_loop().time() - started_at < 1.0
+    asyncio.run(scenario())
+
+
+def test_a_lock_taken_over_by_another_caller_is_not_released():
+    async def scenario():
+        redis_client = fakeredis.aioredis.FakeRedis()
+        cache = RecommendationCache(redis_client, lock_ttl_ms=5000)
+
+        async def slow_compute():
+            # the lock expired during the compute and another caller took it
+            [lock_key] = await redis_client.keys("rs:rec:*:lock")
+            await redis_client.set(lock_key, "other-caller")
+            return RESULT
+
+        assert await get_or_compute(cache, slow_compute) == RESULT
+        [lock_key] = await redis_client.keys("rs:rec:*:lock")
+        assert await redis_client.get(lock_key) == b"other-caller"
+    asyncio.run(scenario())
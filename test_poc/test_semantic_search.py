@@ -1,17 +1,20 @@
-from sentence_transformers import SentenceTransformer
-
 import time
-from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
 from qdrant_client.http.models import PointStruct
 
+from common_test_util import setup_test
+setup_test()
+
+from rs_domain.embedding_provider import get_embedding_provider
+from rs_domain.qdrant_factory import create_qdrant_client
+
 # https://huggingface.co/sentence-transformers/msmarco-distilroberta-base-v2
 MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
 
-model = SentenceTransformer(MODEL_NAME)
-VECTOR_DIM_SIZE = model.get_sentence_embedding_dimension() # the size of msmarco-distilroberta-base-v2
+model = get_embedding_provider(MODEL_NAME)
+VECTOR_DIM_SIZE = model.dimension # the size of msmarco-distilroberta-base-v2
 
-qdrantClient = QdrantClient("localhost", port=6333)
+qdrantClient = create_qdrant_client()
 qdrantClient.recreate_collection(
     collection_name="text_data",
     vectors_config=VectorParams(size=VECTOR_DIM_SIZE, distance=Distance.COSINE),
@@ -40,7 +43,7 @@ for id, corpus in enums:
     print(ids + " = " + corpus)
 
     # 1.147646188735962
-    corpus_embedding = model.encode(corpus, convert_to_tensor=True).tolist()
+    corpus_embedding = model.encode_one(corpus, use_cache=False).tolist()
     #print(corpus_embedding)
 
     operation_info = qdrantClient.upsert(
@@ -58,7 +61,7 @@ queries = ['tình yêu ở khắp mọi nơi ?','Một người đàn ông đang
 # Find the closest 5 sentences of the corpus_list for each query sentence based on cosine similarity
 top_k = min(5, len(corpus_list))
 for query in queries:
-    query_embedding = model.encode(query, convert_to_tensor=True).tolist()
+    query_embedding = model.encode_one(query, use_cache=False).tolist()
 
     print("\n\n======================\n\n")
     print("Query:", query)
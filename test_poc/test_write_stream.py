@@ -0,0 +1,99 @@
+# Focused tests of the write stream workers, with fakeredis and Qdrant in memory: pytest test_poc/test_write_stream.py
+import fakeredis
+import pytest
+
+from common_test_util import setup_domain_test, use_memory_qdrant
+setup_domain_test()
+
+from rs_model.personalization_models import ProfileRequest
+from rs_domain import write_stream
+from rs_domain.personalization import PROFILE_COLLECTION
+from rs_domain.write_stream import WriteStreamWorker, autoclaim_messages
+from rs_domain.write_stream import WRITE_STREAM_NAME, WRITE_STREAM_GROUP, WRITE_STREAM_DEAD_LETTERS
+
+
+@pytest.fixture(autouse=True)
+def qdrant():
+    return use_memory_qdrant()
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+def make_profile(profile_id):
+    return ProfileRequest(profile_id=profile_id, tenant_id="test", page_view_keywords=["bike"],
+                          purchase_keywords=["helmet"], interest_keywords=["travel"], additional_info={})
+
+
+def publish(redis_client, kind, items):
+    for item in items:
+        redis_client.xadd(WRITE_STREAM_NAME, {"kind": kind, "item": item.model_dump_json()})
+
+
+def pending_count(redis_client):
+    return redis_client.xpending(WRITE_STREAM_NAME, WRITE_STREAM_GROUP)["pending"]
+
+
+def new_worker(redis_client, max_deliveries=2):
+    # claim_idle_ms=0: a failed message is claimed again by the next read
+    worker = WriteStreamWorker(redis_client, "worker-1", batch_size=10, block_ms=10, claim_idle_ms=0,
+                               max_deliveries=max_deliveries)
+    worker.ensure_group()
+    return worker
+
+
+def test_applied_messages_are_acknowledged(redis_client, qdrant):
+    worker = new_worker(redis_client)
+    publish(redis_client, "profile", [make_profile("p1"), make_profile("p2")])
+
+    updated = worker.process_batch(worker.read_batch())
+
+    assert sorted(updated["profile"]) == ["p1", "p2"]
+    assert pending_count(redis_client) == 0
+    assert qdrant.count(PROFILE_COLLECTION, exact=True).count == 2
+    assert worker.stats["applied"] == 2 and worker.stats["dead_letters"] == 0
+
+
+def test_failed_messages_stay_pending_then_go_to_the_dead_letters(redis_client, monkeypatch):
+    worker = new_worker(redis_client, max_deliveries=2)
+    publish(redis_client, "profile", [make_profile("p1"), make_profile("p2")])
+    redis_client.xadd(WRITE_STREAM_NAME, {"kind": "profile", "item": "{not json"})
+
+    def add_items_failing_p2(kind, items):
+        return [item.profile_id for item in items if item.profile_id != "p2"], [{"id": "p2", "error": "Qdrant timeout"}], []
+    monkeypatch.setattr(write_stream, "add_items_to_qdrant", add_items_failing_p2)
+
+    # first delivery: p1 is acknowledged, p2 stays pending, the invalid message goes to the dead letters
+    updated = worker.process_batch(worker.read_batch())
+    assert updated["profile"] == ["p1"]
+    assert pending_count(redis_client) == 1
+    assert redis_client.xlen(WRITE_STREAM_DEAD_LETTERS) == 1
+
+    # second delivery, claimed again: p2 reached max_deliveries
+    messages = worker.read_batch()
+    assert [fields[b"item"] for _, fields in messages] == [make_profile("p2").model_dump_json().encode()]
+    worker.process_batch(messages)
+
+    assert pending_count(redis_client) == 0
+    dead_letters = redis_client.xrange(WRITE_STREAM_DEAD_LETTERS)
+    assert dead_letters[0][1][b"error"].startswith(b"Invalid message")
+    assert dead_letters[1][1][b"error"] == b"Qdrant timeout"
+    assert dead_letters[1][1][b"message_id"] == messages[0][0]
+    assert worker.stats == {"applied": 1, "failed": 2, "dead_letters": 2, "batches": 2}
+
+
+@pytest.mark.parametrize("version", [(6, 2), (7,)])
+def test_autoclaim_reads_the_reply_of_redis_6_and_7(version):
+    # XAUTOCLAIM replies [next id, messages] on Redis 6.2 and [next id, messages, deleted ids] on Redis 7
+    redis_client = fakeredis.FakeRedis(version=version)
+    redis_client.xgroup_create("stream", "group", id="0", mkstream=True)
+    redis_client.xadd("stream", {"kind": "profile"})
+    redis_client.xreadgroup("group", "dead-worker", {"stream": ">"})
+
+    messages = autoclaim_messages(redis_client, "stream", "group", "worker-1", 0, 10)
+
+    assert [fields for _, fields in messages] == [{b"kind": b"profile"}]
+    pending = redis_client.xpending_range("stream", "group", min="-", max="+", count=10)
+    assert [(p["consumer"], p["times_delivered"]) for p in pending] == [(b"worker-1", 2)]